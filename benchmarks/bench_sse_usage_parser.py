@@ -0,0 +1,51 @@
+"""Per-chunk overhead of SSEUsageParser on a typical chat completion stream.
+
+Run with: PYTHONPATH=src python benchmarks/bench_sse_usage_parser.py
+"""
+
+import sys
+import time
+
+from api.utils import SSEUsageParser
+
+TOKEN_EVENT = (
+    b'data: {"id":"gen-1","object":"chat.completion.chunk","created":0,'
+    b'"model":"openai/gpt-4.1-mini","choices":[{"index":0,'
+    b'"delta":{"content":" token"},"finish_reason":null}]}\n\n'
+)
+FINAL_EVENTS = (
+    b'data: {"id":"gen-1","object":"chat.completion.chunk","choices":[{"index":0,'
+    b'"delta":{},"finish_reason":"stop"}]}\n\n'
+    b'data: {"id":"gen-1","object":"chat.completion.chunk","choices":[],'
+    b'"usage":{"prompt_tokens":12,"completion_tokens":1000,"total_tokens":1012}}\n\n'
+    b"data: [DONE]\n\n"
+)
+
+
+def build_chunks(tokens: int, split: int) -> list[bytes]:
+    body = TOKEN_EVENT * tokens + FINAL_EVENTS
+    if split <= 0:
+        return [TOKEN_EVENT] * tokens + [FINAL_EVENTS]
+    return [body[i : i + split] for i in range(0, len(body), split)]
+
+
+def bench(label: str, chunks: list[bytes], rounds: int = 50) -> None:
+    best = float("inf")
+    for _ in range(rounds):
+        parser = SSEUsageParser()
+        start = time.perf_counter()
+        for chunk in chunks:
+            parser.feed(chunk)
+        parser.close()
+        best = min(best, time.perf_counter() - start)
+    assert parser.usage is not None
+    per_chunk_us = best / len(chunks) * 1e6
+    sys.stdout.write(
+        f"{label:<32} {len(chunks):>6} chunks  {per_chunk_us:6.2f} us/chunk\n"
+    )
+
+
+if __name__ == "__main__":
+    bench("one event per chunk", build_chunks(1000, 0))
+    bench("64-byte chunks (split events)", build_chunks(1000, 64))
+    bench("4 KiB chunks", build_chunks(1000, 4096))
@@ -1,5 +1,44 @@
+from .admission_controller import AdmissionController
+from .batch_runner import BatchRunner
+from .context_guard import ContextGuard
+from .conversation_store import ConversationStore
+from .embedding_batcher import EmbeddingBatcher
+from .embedding_cache import EmbeddingCache
+from .embedding_chunker import EmbeddingChunker
+from .embedding_jobs import EmbeddingJobs
 from .embeddings import Embeddings
+from .file_store import FileStore
+from .hedging import HedgePolicy
+from .idempotency_store import IdempotencyStore
 from .models import Models
 from .openrouter_proxy import OpenRouterProxy
+from .rate_limiter import RateLimiter
+from .response_cache import ResponseCache
+from .semantic_cache import SemanticCache
+from .sse_coalescer import SSECoalescer
+from .stream_replay import StreamReplay
+from .upstream_router import Upstream, UpstreamRouter
 
-__all__ = ["OpenRouterProxy", "Embeddings", "Models"]
+__all__ = [
+    "AdmissionController",
+    "BatchRunner",
+    "ContextGuard",
+    "ConversationStore",
+    "OpenRouterProxy",
+    "EmbeddingBatcher",
+    "EmbeddingCache",
+    "EmbeddingChunker",
+    "EmbeddingJobs",
+    "Embeddings",
+    "FileStore",
+    "HedgePolicy",
+    "IdempotencyStore",
+    "Models",
+    "ResponseCache",
+    "RateLimiter",
+    "SemanticCache",
+    "SSECoalescer",
+    "StreamReplay",
+    "Upstream",
+    "UpstreamRouter",
+]
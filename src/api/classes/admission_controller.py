@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, Optional, Tuple
+
+from api.config import get_settings
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a request cannot get an upstream slot in time."""
+
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """A granted upstream slot; `release` is idempotent."""
+
+    __slots__ = ("_controller", "_user_id", "_granted_at", "wait_ms")
+
+    def __init__(
+        self, controller: "AdmissionController", user_id: Hashable, wait_ms: int
+    ) -> None:
+        self._controller = controller
+        self._user_id = user_id
+        self._granted_at: Optional[float] = time.monotonic()
+        self.wait_ms = wait_ms
+
+    def release(self) -> None:
+        if self._granted_at is None:
+            return
+        held = time.monotonic() - self._granted_at
+        self._granted_at = None
+        self._controller._release(self._user_id, held)
+
+
+class AdmissionController:
+    """Bound the number of upstream calls in flight, globally and per user.
+
+    A request that finds no free slot waits in a FIFO queue of at most
+    `max_queue` entries for up to `queue_timeout` seconds. Once the queue is
+    full, or the wait times out, `acquire` raises `AdmissionRejectedError` with a
+    Retry-After estimated from the recent slot hold time. A waiter whose user
+    is at its own limit does not hold back waiters of other users.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_concurrent: int = 256,
+        max_per_user: int = 32,
+        max_queue: int = 512,
+        queue_timeout: float = 10.0,
+    ) -> None:
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_per_user = max(1, max_per_user)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+
+        self._active = 0
+        self._per_user: Dict[Hashable, int] = {}
+        self._waiters: Deque[Tuple[Hashable, asyncio.Future]] = deque()
+
+        self._hold_ewma: Optional[float] = None
+        self._admitted = 0
+        self._queued = 0
+        self._rejected_full = 0
+        self._rejected_timeout = 0
+        self._wait_ms_total = 0
+
+    @classmethod
+    def from_settings(cls) -> Optional["AdmissionController"]:
+        settings = get_settings()
+        if not settings.admission_enabled:
+            return None
+        return cls(
+            max_concurrent=settings.admission_max_concurrent,
+            max_per_user=settings.admission_max_per_user,
+            max_queue=settings.admission_max_queue,
+            queue_timeout=settings.admission_queue_timeout,
+        )
+
+    async def acquire(self, user_id: Hashable) -> AdmissionTicket:
+        if self._can_run(user_id):
+            self._grant(user_id)
+            return AdmissionTicket(self, user_id, 0)
+        if len(self._waiters) >= self.max_queue:
+            self._rejected_full += 1
+            raise AdmissionRejectedError(
+                "Too many concurrent requests", self.retry_after()
+            )
+
+        start_time = time.monotonic()
+        entry = (user_id, asyncio.get_running_loop().create_future())
+        self._waiters.append(entry)
+        self._queued += 1
+        try:
+            done, _ = await asyncio.wait({entry[1]}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            self._abandon(entry)
+            raise
+        if not done:
+            self._abandon(entry)
+            self._rejected_timeout += 1
+            raise AdmissionRejectedError(
+                "Timed out waiting for capacity", self.retry_after()
+            )
+        wait_ms = int((time.monotonic() - start_time) * 1000)
+        self._wait_ms_total += wait_ms
+        return AdmissionTicket(self, user_id, wait_ms)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up for a new request."""
+        hold = self._hold_ewma if self._hold_ewma is not None else 1.0
+        backlog = (len(self._waiters) + 1) / self.max_concurrent
+        return min(60, max(1, math.ceil(hold * backlog)))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "active": self._active,
+            "queued": len(self._waiters),
+            "admitted": self._admitted,
+            "waited": self._queued,
+            "rejected_queue_full": self._rejected_full,
+            "rejected_timeout": self._rejected_timeout,
+            "avg_queue_wait_ms": (
+                self._wait_ms_total / self._queued if self._queued else None
+            ),
+            "avg_hold_s": self._hold_ewma,
+        }
+
+    # ------------------------------ Internals ---------------------------------
+    def _can_run(self, user_id: Hashable) -> bool:
+        return (
+            self._active < self.max_concurrent
+            and self._per_user.get(user_id, 0) < self.max_per_user
+        )
+
+    def _grant(self, user_id: Hashable) -> None:
+        self._active += 1
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        self._admitted += 1
+
+    def _release(self, user_id: Hashable, held: Optional[float] = None) -> None:
+        self._active -= 1
+        remaining = self._per_user.get(user_id, 1) - 1
+        if remaining:
+            self._per_user[user_id] = remaining
+        else:
+            self._per_user.pop(user_id, None)
+        if held is not None:
+            if self._hold_ewma is None:
+                self._hold_ewma = held
+            else:
+                self._hold_ewma += 0.1 * (held - self._hold_ewma)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        if not self._waiters or self._active >= self.max_concurrent:
+            return
+        for entry in list(self._waiters):
+            if self._active >= self.max_concurrent:
+                break
+            user_id, future = entry
+            if self._can_run(user_id):
+                self._waiters.remove(entry)
+                self._grant(user_id)
+                future.set_result(None)
+
+    def _abandon(self, entry: Tuple[Hashable, asyncio.Future]) -> None:
+        user_id, future = entry
+        if future.done():
+            # Granted right as the waiter gave up: hand the slot back
+            self._release(user_id)
+            return
+        future.cancel()
+        try:
+            self._waiters.remove(entry)
+        except ValueError:
+            pass
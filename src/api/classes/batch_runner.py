@@ -0,0 +1,583 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from api.config import get_settings
+from api.utils import CustomLogger
+
+from .file_store import FileStore, FileTooLargeError, FileWriter
+from .resilience import RetryPolicy
+
+logger = CustomLogger.get_logger(__name__)
+
+BATCH_COLLECTION = "llm_batches"
+
+# Batch `endpoint` -> upstream path
+BATCH_ENDPOINTS = {
+    "/v1/chat/completions": "/chat/completions",
+    "/v1/responses": "/responses",
+}
+
+COMPLETION_WINDOWS = {"24h": 24 * 3600}
+
+# Statuses after which a batch never changes again
+FINAL_STATUSES = ("failed", "completed", "expired", "cancelled")
+
+# Validation stops reporting past this many invalid lines
+MAX_REPORTED_ERRORS = 100
+
+# Finished batches kept in memory when there is no Mongo to read them from
+_MAX_FINISHED = 1000
+
+
+class BatchError(ValueError):
+    """The batch cannot be created (unknown input file, bad endpoint...)."""
+
+
+def new_batch_id() -> str:
+    return f"batch_{uuid.uuid4().hex}"
+
+
+def public_batch(batch: Dict[str, Any]) -> Dict[str, Any]:
+    """The OpenAI `batch` object, without the owner kept on the side."""
+    return {k: v for k, v in batch.items() if k not in ("_id", "user_id")}
+
+
+def _validate_line(
+    raw: bytes, endpoint: str, seen: set
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """The parsed request of one input line, or why it is invalid."""
+    try:
+        request = json.loads(raw)
+    except ValueError:
+        return None, "Line is not valid JSON"
+    if not isinstance(request, dict):
+        return None, "Line is not a JSON object"
+    custom_id = request.get("custom_id")
+    if not isinstance(custom_id, str) or not custom_id:
+        return None, "Missing `custom_id`"
+    if custom_id in seen:
+        return None, f"Duplicate `custom_id`: {custom_id}"
+    seen.add(custom_id)
+    if request.get("method") != "POST":
+        return None, "`method` must be POST"
+    if request.get("url") != endpoint:
+        return None, f"`url` must be {endpoint}, like the batch endpoint"
+    body = request.get("body")
+    if not isinstance(body, dict) or not isinstance(body.get("model"), str):
+        return None, "`body` must be an object with a `model`"
+    return request, None
+
+
+def _response_body(response: httpx.Response) -> Any:
+    try:
+        return response.json()
+    except ValueError:
+        return response.text
+
+
+def _add_usage(total: Dict[str, int], usage: Any) -> None:
+    if not isinstance(usage, dict):
+        return
+    # Chat Completions name them prompt/completion, Responses input/output
+    for key, fields in (
+        ("input_tokens", ("input_tokens", "prompt_tokens")),
+        ("output_tokens", ("output_tokens", "completion_tokens")),
+        ("total_tokens", ("total_tokens",)),
+    ):
+        for field in fields:
+            value = usage.get(field)
+            if isinstance(value, int):
+                total[key] += value
+                break
+
+
+class _Run:
+    """Output files and counters of one running batch."""
+
+    def __init__(self, output: FileWriter, errors: FileWriter) -> None:
+        self.output = output
+        self.errors = errors
+        self.write_lock = asyncio.Lock()
+        self.tasks: set[asyncio.Task] = set()
+        self.last_saved = 0.0
+
+
+class BatchRunner:
+    """Local executor for OpenAI-compatible batches of chat/responses calls.
+
+    The JSONL input file is read from the `FileStore` twice: once to validate
+    every line, then to run them. Lines go through `OpenRouterProxy` with at
+    most `max_workers` in flight overall and `max_per_model` per model, so a
+    large batch never starves interactive traffic. A line whose answer is a
+    connect error, a 429 or a 5xx is retried by the proxy following `retry`,
+    with longer delays than interactive calls since nobody is waiting on it.
+
+    Results are appended to an output file (2xx) and an error file as they
+    come, in completion order; `request_counts` is updated as lines finish.
+    Batches are kept in memory and, with `mongodb_client`, saved in Mongo;
+    each line is also logged in `llm_requests`. A batch interrupted by a
+    shutdown is marked failed, not resumed.
+    """
+
+    def __init__(
+        self,
+        openrouter_proxy,
+        file_store: FileStore,
+        *,
+        mongodb_client=None,
+        max_workers: int = 16,
+        max_per_model: int = 4,
+        retry: Optional[RetryPolicy] = None,
+        progress_interval: float = 1.0,
+    ) -> None:
+        self.openrouter_proxy = openrouter_proxy
+        self.file_store = file_store
+        self.mongodb_client = mongodb_client
+        self.max_workers = max(1, max_workers)
+        self.max_per_model = max(1, max_per_model)
+        self.retry = retry or RetryPolicy(
+            max_attempts=3, base_delay=2.0, max_delay=60.0
+        )
+        self.progress_interval = progress_interval
+
+        self._workers = asyncio.Semaphore(self.max_workers)
+        self._model_slots: Dict[str, asyncio.Semaphore] = {}
+        self._batches: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._closing = False
+        self._in_flight = 0
+
+        self._lines_succeeded = 0
+        self._lines_failed = 0
+
+    @classmethod
+    def from_settings(
+        cls, openrouter_proxy, file_store: FileStore, mongodb_client=None
+    ) -> Optional["BatchRunner"]:
+        settings = get_settings()
+        if not settings.batch_enabled:
+            return None
+        return cls(
+            openrouter_proxy,
+            file_store,
+            mongodb_client=mongodb_client,
+            max_workers=settings.batch_max_workers,
+            max_per_model=settings.batch_max_per_model,
+            retry=RetryPolicy(
+                max_attempts=settings.batch_retry_max_attempts,
+                base_delay=settings.batch_retry_base_delay,
+                max_delay=settings.batch_retry_max_delay,
+            ),
+        )
+
+    # --------------------------------- API ------------------------------------
+    async def create(
+        self,
+        *,
+        user_id: Any,
+        input_file_id: str,
+        endpoint: str,
+        completion_window: str = "24h",
+        metadata: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Any]:
+        if endpoint not in BATCH_ENDPOINTS:
+            raise BatchError(f"Unsupported endpoint: {endpoint}")
+        if completion_window not in COMPLETION_WINDOWS:
+            raise BatchError(f"Unsupported completion_window: {completion_window}")
+        input_file = await self.file_store.get(input_file_id, user_id)
+        if input_file is None:
+            raise BatchError(f"No such file: {input_file_id}")
+        if input_file["purpose"] != "batch":
+            raise BatchError("The input file must have been uploaded for `batch`")
+
+        now = int(time.time())
+        batch = {
+            "id": new_batch_id(),
+            "object": "batch",
+            "endpoint": endpoint,
+            "errors": None,
+            "input_file_id": input_file_id,
+            "completion_window": completion_window,
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": now,
+            "in_progress_at": None,
+            "expires_at": now + COMPLETION_WINDOWS[completion_window],
+            "finalizing_at": None,
+            "completed_at": None,
+            "failed_at": None,
+            "expired_at": None,
+            "cancelling_at": None,
+            "cancelled_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "usage": {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0},
+            "metadata": metadata,
+            "user_id": str(user_id),
+        }
+        self._batches[batch["id"]] = batch
+        await self._save(batch)
+        task = asyncio.create_task(self._run(batch))
+        self._tasks[batch["id"]] = task
+        task.add_done_callback(lambda _: self._finished(batch["id"]))
+        return batch
+
+    async def get(self, batch_id: str, user_id: Any) -> Optional[Dict[str, Any]]:
+        """The batch, or None when missing or owned by someone else."""
+        batch = self._batches.get(batch_id)
+        if batch is None and self.mongodb_client is not None:
+            batch = await self._collection().find_one({"_id": batch_id})
+        if batch is None or batch["user_id"] != str(user_id):
+            return None
+        return batch
+
+    async def list(self, user_id: Any, *, limit: int = 20) -> List[Dict[str, Any]]:
+        if self.mongodb_client is not None:
+            cursor = (
+                self._collection()
+                .find({"user_id": str(user_id)})
+                .sort("created_at", -1)
+                .limit(limit)
+            )
+            stored = {b["id"]: b for b in await cursor.to_list(length=limit)}
+        else:
+            stored = {}
+        # Running batches are fresher in memory than in Mongo
+        for batch in self._batches.values():
+            if batch["user_id"] == str(user_id):
+                stored[batch["id"]] = batch
+        batches = sorted(stored.values(), key=lambda b: b["created_at"], reverse=True)
+        return batches[:limit]
+
+    async def cancel(self, batch_id: str, user_id: Any) -> Optional[Dict[str, Any]]:
+        batch = await self.get(batch_id, user_id)
+        if batch is None:
+            return None
+        task = self._tasks.get(batch_id)
+        if batch["status"] in FINAL_STATUSES or task is None:
+            return batch
+        batch["status"] = "cancelling"
+        batch["cancelling_at"] = int(time.time())
+        await self._save(batch)
+        task.cancel()
+        return batch
+
+    async def wait(self, batch_id: str) -> None:
+        """Wait for a running batch to reach a final status."""
+        task = self._tasks.get(batch_id)
+        if task is not None:
+            await asyncio.wait({task})
+
+    async def aclose(self) -> None:
+        self._closing = True
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "running": len(self._tasks),
+            "lines_in_flight": self._in_flight,
+            "lines_succeeded": self._lines_succeeded,
+            "lines_failed": self._lines_failed,
+        }
+
+    # -------------------------------- Running ---------------------------------
+    def _finished(self, batch_id: str) -> None:
+        self._tasks.pop(batch_id, None)
+        if self.mongodb_client is not None:
+            # Saved in Mongo; read back from there when asked for
+            self._batches.pop(batch_id, None)
+            return
+        while len(self._batches) > _MAX_FINISHED:
+            oldest = next(iter(self._batches))
+            if oldest in self._tasks:
+                break
+            self._batches.pop(oldest)
+
+    async def _validate(self, batch: Dict[str, Any]) -> int:
+        """Count the input lines, failing the batch when any is invalid."""
+        seen: set = set()
+        errors: List[Dict[str, Any]] = []
+        total = 0
+        async for raw in self.file_store.iter_lines(batch["input_file_id"]):
+            total += 1
+            _, message = _validate_line(raw, batch["endpoint"], seen)
+            if message is not None and len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(
+                    {"code": "invalid_request", "message": message, "line": total}
+                )
+        if total == 0:
+            errors.append({"code": "empty_file", "message": "The input file is empty"})
+        if errors:
+            batch["status"] = "failed"
+            batch["failed_at"] = int(time.time())
+            batch["errors"] = {"object": "list", "data": errors}
+        return total
+
+    async def _run(self, batch: Dict[str, Any]) -> None:
+        run: Optional[_Run] = None
+        try:
+            total = await self._validate(batch)
+            if batch["status"] == "failed":
+                await self._save(batch)
+                return
+            batch["status"] = "in_progress"
+            batch["in_progress_at"] = int(time.time())
+            batch["request_counts"]["total"] = total
+            await self._save(batch)
+
+            user_id = batch["user_id"]
+            run = _Run(
+                self.file_store.open_writer(
+                    filename=f"{batch['id']}_output.jsonl",
+                    purpose="batch_output",
+                    user_id=user_id,
+                ),
+                self.file_store.open_writer(
+                    filename=f"{batch['id']}_error.jsonl",
+                    purpose="batch_output",
+                    user_id=user_id,
+                ),
+            )
+            expired = False
+            seen: set = set()
+            async for raw in self.file_store.iter_lines(batch["input_file_id"]):
+                if time.time() > batch["expires_at"]:
+                    expired = True
+                    break
+                request, _ = _validate_line(raw, batch["endpoint"], seen)
+                if request is None:
+                    continue
+                # Waiting here keeps the input from being read ahead of workers;
+                # the model slot comes first so that no worker sits idle
+                # behind a saturated model
+                model_slot = self._model_slot(request["body"]["model"])
+                await model_slot.acquire()
+                try:
+                    await self._workers.acquire()
+                except BaseException:
+                    model_slot.release()
+                    raise
+                task = asyncio.create_task(self._run_line(batch, run, request))
+                run.tasks.add(task)
+                task.add_done_callback(self._release_worker)
+                task.add_done_callback(lambda _, slot=model_slot: slot.release())
+                task.add_done_callback(run.tasks.discard)
+            if run.tasks:
+                await asyncio.gather(*run.tasks)
+            await self._finalize(batch, run, "expired" if expired else "completed")
+        except asyncio.CancelledError:
+            await self._stop(batch, run)
+        except Exception as e:
+            logger.error(f"Batch {batch['id']} failed: {e}")
+            await self._stop(batch, run, error=e)
+
+    async def _stop(
+        self,
+        batch: Dict[str, Any],
+        run: Optional[_Run],
+        error: Optional[Exception] = None,
+    ) -> None:
+        if run is not None:
+            for task in list(run.tasks):
+                task.cancel()
+            if run.tasks:
+                await asyncio.gather(*run.tasks, return_exceptions=True)
+        if error is None and not self._closing:
+            # Cancelled by its owner: what already ran is kept
+            if run is not None:
+                await self._finalize(batch, run, "cancelled")
+                return
+            batch["status"] = "cancelled"
+            batch["cancelled_at"] = int(time.time())
+        else:
+            if run is not None:
+                await run.output.abort()
+                await run.errors.abort()
+            message = str(error) if error else "Interrupted by a server shutdown"
+            batch["status"] = "failed"
+            batch["failed_at"] = int(time.time())
+            batch["errors"] = {
+                "object": "list",
+                "data": [{"code": "batch_failed", "message": message, "line": None}],
+            }
+        await self._save(batch)
+
+    async def _finalize(self, batch: Dict[str, Any], run: _Run, status: str) -> None:
+        batch["status"] = "finalizing"
+        batch["finalizing_at"] = int(time.time())
+        counts = batch["request_counts"]
+        for writer, field, count in (
+            (run.output, "output_file_id", counts["completed"]),
+            (run.errors, "error_file_id", counts["failed"]),
+        ):
+            if count:
+                batch[field] = (await writer.close())["id"]
+            else:
+                await writer.abort()
+        batch["status"] = status
+        batch[f"{status}_at"] = int(time.time())
+        await self._save(batch)
+
+    def _release_worker(self, _: asyncio.Task) -> None:
+        # A callback, so that a line cancelled before it started still frees it
+        self._in_flight -= 1
+        self._workers.release()
+
+    async def _run_line(
+        self, batch: Dict[str, Any], run: _Run, request: Dict[str, Any]
+    ) -> None:
+        self._in_flight += 1
+        body = dict(request["body"])
+        # Results are written whole; a stream has nowhere to go
+        body.pop("stream", None)
+        body.pop("stream_options", None)
+        model = body["model"]
+        start = time.perf_counter()
+        response, error = await self._call(batch["endpoint"], body, model)
+        latency_ms = int((time.perf_counter() - start) * 1000)
+        await self._record(batch, run, request, response, error, latency_ms)
+
+    def _model_slot(self, model: str) -> asyncio.Semaphore:
+        slot = self._model_slots.get(model)
+        if slot is None:
+            slot = self._model_slots[model] = asyncio.Semaphore(self.max_per_model)
+        return slot
+
+    async def _call(
+        self, endpoint: str, body: Dict[str, Any], model: str
+    ) -> Tuple[Optional[httpx.Response], Optional[Exception]]:
+        # The proxy retries with the batch policy in place of its own, so a
+        # failing line is not retried twice over
+        try:
+            response = await self.openrouter_proxy.post(
+                BATCH_ENDPOINTS[endpoint], body, model=model, retry=self.retry
+            )
+        except (httpx.RequestError, RuntimeError) as e:
+            return None, e
+        return response, None
+
+    async def _record(
+        self,
+        batch: Dict[str, Any],
+        run: _Run,
+        request: Dict[str, Any],
+        response: Optional[httpx.Response],
+        error: Optional[Exception],
+        latency_ms: int,
+    ) -> None:
+        line: Dict[str, Any] = {
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": request["custom_id"],
+            "response": None,
+            "error": None,
+        }
+        usage = provider_response_id = None
+        if response is not None:
+            body = _response_body(response)
+            if isinstance(body, dict):
+                usage = body.get("usage")
+                provider_response_id = body.get("id")
+            line["response"] = {
+                "status_code": response.status_code,
+                "request_id": response.headers.get("x-request-id", ""),
+                "body": body,
+            }
+        else:
+            line["error"] = {"code": "upstream_error", "message": str(error)}
+        succeeded = response is not None and response.status_code < 400
+
+        counts = batch["request_counts"]
+        encoded = (json.dumps(line, ensure_ascii=False) + "\n").encode()
+        async with run.write_lock:
+            try:
+                await (run.output if succeeded else run.errors).write(encoded)
+            except FileTooLargeError as e:
+                raise RuntimeError(f"Batch results are too large: {e}") from e
+            if succeeded:
+                counts["completed"] += 1
+                self._lines_succeeded += 1
+                _add_usage(batch["usage"], usage)
+            else:
+                counts["failed"] += 1
+                self._lines_failed += 1
+            if time.monotonic() - run.last_saved >= self.progress_interval:
+                run.last_saved = time.monotonic()
+                await self._save(batch)
+
+        await self._log_line(
+            batch, request, response, error, latency_ms, usage, provider_response_id
+        )
+
+    async def _log_line(
+        self,
+        batch: Dict[str, Any],
+        request: Dict[str, Any],
+        response: Optional[httpx.Response],
+        error: Optional[Exception],
+        latency_ms: int,
+        usage: Any,
+        provider_response_id: Any,
+    ) -> None:
+        if self.mongodb_client is None:
+            return
+        path = BATCH_ENDPOINTS[batch["endpoint"]]
+        try:
+            await self.mongodb_client.log_llm_request(
+                {
+                    "user_id": batch["user_id"],
+                    "job_id": str(uuid.uuid4()),
+                    "provider": (
+                        self.openrouter_proxy.upstream_name(response)
+                        if response is not None
+                        else "openrouter"
+                    ),
+                    "operation": "batch." + path.strip("/").replace("/", "."),
+                    "endpoint": path,
+                    "model": request["body"].get("model"),
+                    "stream": False,
+                    "batch_id": batch["id"],
+                    "custom_id": request["custom_id"],
+                    "status_code": response.status_code if response else None,
+                    "latency_ms": latency_ms,
+                    "usage": usage,
+                    "provider_response_id": provider_response_id,
+                    "error": (
+                        str(error)
+                        if response is None
+                        else response.text if response.status_code >= 400 else None
+                    ),
+                }
+            )
+        except Exception as e:
+            logger.error(f"Batch line log failed: {e}")
+
+    # ---------------------------- Persistent tier -----------------------------
+    def _collection(self):
+        return self.mongodb_client.get_database()[BATCH_COLLECTION]
+
+    async def ensure_indexes(self) -> None:
+        if self.mongodb_client is None:
+            return
+        await self._collection().create_index([("user_id", 1), ("created_at", -1)])
+
+    async def _save(self, batch: Dict[str, Any]) -> None:
+        if self.mongodb_client is None:
+            return
+        try:
+            await self._collection().replace_one(
+                {"_id": batch["id"]}, {**batch, "_id": batch["id"]}, upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Batch save failed: {e}")
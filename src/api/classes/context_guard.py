@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from api.config import get_settings
+from api.utils import CustomLogger, TokenEstimate, TokenEstimator
+from api.utils.token_estimator import tiktoken_counter
+
+logger = CustomLogger.get_logger(__name__)
+
+# A failed lookup is retried after this many seconds
+_ERROR_TTL = 60.0
+
+# Model names come from clients; the cache is reset past this size
+_MAX_MODELS = 10_000
+
+
+class ContextLimits:
+    """Largest prompt and context accepted by any endpoint of a model."""
+
+    __slots__ = ("context_length", "max_prompt_tokens")
+
+    def __init__(
+        self, context_length: Optional[int], max_prompt_tokens: Optional[int]
+    ) -> None:
+        self.context_length = context_length
+        self.max_prompt_tokens = max_prompt_tokens
+
+    @classmethod
+    def from_model(cls, data: Dict[str, Any]) -> "ContextLimits":
+        """From a `Models.read_model` answer (ModelDTO with its endpoints)."""
+        endpoints = [e for e in data.get("endpoints") or [] if isinstance(e, dict)]
+        context_lengths = [e.get("context_length") for e in endpoints]
+        prompt_limits = [e.get("max_prompt_tokens") for e in endpoints]
+        # A request fails only when no endpoint can take it
+        context_length = _largest(context_lengths) or _largest(
+            [data.get("context_length")]
+        )
+        max_prompt_tokens = (
+            _largest(prompt_limits) if None not in prompt_limits else None
+        )
+        return cls(context_length, max_prompt_tokens)
+
+
+def _largest(values: List[Any]) -> Optional[int]:
+    numbers = [int(v) for v in values if isinstance(v, (int, float)) and v > 0]
+    return max(numbers) if numbers else None
+
+
+class ContextGuard:
+    """Reject requests that cannot fit in the context window of their model.
+
+    The prompt size comes from a local `TokenEstimator`; the limits are the
+    `context_length` / `max_prompt_tokens` of the model endpoints, read with
+    `Models.read_model` and cached for `ttl` seconds. A model not in the
+    cache yet is looked up in the background and its requests let through,
+    so the check itself never waits on the network.
+
+    The heuristic estimate is only trusted up to `margin`: a request is
+    rejected when even `estimate * (1 - margin)` does not fit.
+    """
+
+    def __init__(
+        self,
+        models_client,
+        *,
+        estimator: Optional[TokenEstimator] = None,
+        ttl: float = 3600.0,
+        margin: float = 0.2,
+    ) -> None:
+        self.models_client = models_client
+        self.estimator = estimator or TokenEstimator()
+        self.ttl = ttl
+        self.margin = margin
+
+        self._limits: Dict[str, Tuple[float, Optional[ContextLimits]]] = {}
+        self._loading: Dict[str, asyncio.Task] = {}
+
+        self._checked = 0
+        self._rejected = 0
+        self._unknown = 0
+
+    @classmethod
+    def from_settings(cls, models_client) -> Optional["ContextGuard"]:
+        settings = get_settings()
+        if not settings.context_check_enabled:
+            return None
+        estimator = TokenEstimator()
+        for pattern in filter(None, settings.context_check_tiktoken_models.split(",")):
+            try:
+                estimator.register(pattern.strip(), tiktoken_counter())
+            except ImportError:
+                logger.warning("tiktoken is not installed; using the heuristic")
+                break
+        return cls(
+            models_client,
+            estimator=estimator,
+            ttl=settings.context_check_cache_ttl,
+            margin=settings.context_check_margin,
+        )
+
+    def estimate(self, payload) -> TokenEstimate:
+        return self.estimator.estimate(payload)
+
+    def check(self, model: str, estimate: TokenEstimate) -> Optional[str]:
+        """Why the request cannot fit, or None when it may."""
+        self._checked += 1
+        limits = self.limits(model)
+        if limits is None:
+            self._unknown += 1
+            return None
+        prompt_tokens = estimate.prompt_tokens
+        if not estimate.exact:
+            prompt_tokens = int(prompt_tokens * (1 - self.margin))
+        reason = None
+        if limits.max_prompt_tokens and prompt_tokens > limits.max_prompt_tokens:
+            reason = (
+                f"Prompt is about {estimate.prompt_tokens} tokens, more than the "
+                f"{limits.max_prompt_tokens} accepted by {model}"
+            )
+        elif limits.context_length and (
+            prompt_tokens + (estimate.max_output_tokens or 0) > limits.context_length
+        ):
+            reason = (
+                f"Prompt of about {estimate.prompt_tokens} tokens plus "
+                f"{estimate.max_output_tokens or 0} output tokens exceeds the "
+                f"{limits.context_length} token context of {model}"
+            )
+        if reason is not None:
+            self._rejected += 1
+        return reason
+
+    def limits(self, model: str) -> Optional[ContextLimits]:
+        """Cached limits of `model`; a miss schedules a lookup."""
+        item = self._limits.get(model)
+        if item is not None and item[0] > time.monotonic():
+            return item[1]
+        if model not in self._loading and "/" in model:
+            task = asyncio.ensure_future(self.load(model))
+            self._loading[model] = task
+            task.add_done_callback(lambda _: self._loading.pop(model, None))
+        return item[1] if item is not None else None
+
+    async def load(self, model: str) -> Optional[ContextLimits]:
+        author, _, name = model.partition("/")
+        try:
+            data = await self.models_client.read_model(author, name)
+            limits = ContextLimits.from_model(data if isinstance(data, dict) else {})
+            ttl = self.ttl
+        except Exception as e:
+            logger.warning(f"Could not read limits of {model}: {e}")
+            limits, ttl = None, _ERROR_TTL
+        if len(self._limits) >= _MAX_MODELS:
+            self._limits.clear()
+        self._limits[model] = (time.monotonic() + ttl, limits)
+        return limits
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "models": len(self._limits),
+            "checked": self._checked,
+            "rejected": self._rejected,
+            "unknown_limits": self._unknown,
+        }
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from api.config import get_settings
+from api.utils import CustomLogger
+
+logger = CustomLogger.get_logger(__name__)
+
+CONVERSATION_COLLECTION = "llm_conversation_items"
+
+# Guards against a corrupted (cyclic) chain of previous_response_id
+MAX_CHAIN_LENGTH = 10_000
+
+
+class ConversationNotFoundError(LookupError):
+    """`previous_response_id` is unknown, expired or owned by someone else."""
+
+
+def input_items(value: Any) -> List[Any]:
+    """Normalize a Responses `input` (string or list of items) to a list."""
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [{"type": "message", "role": "user", "content": value}]
+
+
+class ConversationTurn:
+    """One /v1/responses call whose items are recorded once it completes."""
+
+    __slots__ = ("_store", "user_id", "previous_response_id", "input_items")
+
+    def __init__(
+        self,
+        store: "ConversationStore",
+        user_id: Any,
+        previous_response_id: Optional[str],
+        items: List[Any],
+    ) -> None:
+        self._store = store
+        self.user_id = user_id
+        self.previous_response_id = previous_response_id
+        self.input_items = items
+
+    def complete(self, response_id: Any, output: Any) -> None:
+        if isinstance(response_id, str) and isinstance(output, list):
+            self._store.record(
+                response_id,
+                user_id=self.user_id,
+                previous_response_id=self.previous_response_id,
+                items=self.input_items + output,
+            )
+
+
+class ConversationStore:
+    """Conversation items of proxied /v1/responses calls, by response id.
+
+    Each response only stores its own turn (the new input items followed by
+    the output items) and a link to the previous response, so a session is
+    written incrementally. `expand` walks the links back to rebuild the full
+    history for a request carrying `previous_response_id`.
+
+    Recent turns live in an LRU bounded by `max_entries` records and
+    `max_bytes` of serialized items; with `mongodb_client`, every turn is
+    also written to Mongo. The part of a chain missing from memory is read
+    back with a single `$graphLookup`, not one query per turn.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = 10_000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 30 * 24 * 3600.0,
+        mongodb_client=None,
+    ) -> None:
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self.ttl = float(ttl)
+        self.mongodb_client = mongodb_client
+
+        self._hot: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._hot_bytes = 0
+        self._background: set[asyncio.Task] = set()
+
+        self._expansions = 0
+        self._hot_hits = 0
+        self._cold_hits = 0
+        self._misses = 0
+
+    @classmethod
+    def from_settings(cls, mongodb_client=None) -> Optional["ConversationStore"]:
+        settings = get_settings()
+        if not settings.conversation_store_enabled:
+            return None
+        return cls(
+            max_entries=settings.conversation_store_hot_entries,
+            max_bytes=settings.conversation_store_hot_bytes,
+            ttl=settings.conversation_store_ttl,
+            mongodb_client=mongodb_client,
+        )
+
+    def turn(
+        self, user_id: Any, previous_response_id: Optional[str], items: List[Any]
+    ) -> ConversationTurn:
+        return ConversationTurn(self, user_id, previous_response_id, items)
+
+    async def expand(self, user_id: Any, previous_response_id: str) -> List[Any]:
+        """Items of every turn up to and including `previous_response_id`."""
+        owner = str(user_id)
+        turns: List[List[Any]] = []
+        loaded: Optional[Dict[str, Dict[str, Any]]] = None
+        response_id: Optional[str] = previous_response_id
+        while response_id is not None:
+            record = self._hot_record(response_id)
+            if record is None and loaded is None:
+                loaded = await self._load_chain(response_id, owner)
+            if record is None and loaded:
+                record = loaded.get(response_id)
+            if record is None or record["user_id"] != owner:
+                self._misses += 1
+                raise ConversationNotFoundError(
+                    f"Previous response with id '{response_id}' not found"
+                )
+            turns.append(record["items"])
+            response_id = record.get("previous_response_id")
+            if len(turns) > MAX_CHAIN_LENGTH:
+                raise ConversationNotFoundError("Conversation history is too long")
+        self._expansions += 1
+        return [item for items in reversed(turns) for item in items]
+
+    def record(
+        self,
+        response_id: str,
+        *,
+        user_id: Any,
+        previous_response_id: Optional[str],
+        items: List[Any],
+    ) -> None:
+        record = {
+            "user_id": str(user_id),
+            "previous_response_id": previous_response_id,
+            "items": items,
+        }
+        self._remember(response_id, record)
+        if self.mongodb_client is not None:
+            self._spawn(self._write_persistent(response_id, record))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "hot_entries": len(self._hot),
+            "hot_bytes": self._hot_bytes,
+            "expansions": self._expansions,
+            "hot_hits": self._hot_hits,
+            "cold_hits": self._cold_hits,
+            "misses": self._misses,
+        }
+
+    # ------------------------------ Internals ---------------------------------
+    def _remember(self, response_id: str, record: Dict[str, Any]) -> None:
+        size = len(json.dumps(record["items"], default=str))
+        previous = self._hot.pop(response_id, None)
+        if previous is not None:
+            self._hot_bytes -= previous["size"]
+        if size > self.max_bytes:
+            return
+        self._hot[response_id] = {**record, "size": size}
+        self._hot_bytes += size
+        while len(self._hot) > self.max_entries or self._hot_bytes > self.max_bytes:
+            _, evicted = self._hot.popitem(last=False)
+            self._hot_bytes -= evicted["size"]
+
+    def _hot_record(self, response_id: str) -> Optional[Dict[str, Any]]:
+        record = self._hot.get(response_id)
+        if record is not None:
+            self._hot.move_to_end(response_id)
+            self._hot_hits += 1
+        return record
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    # ---------------------------- Persistent tier -----------------------------
+    def _collection(self):
+        return self.mongodb_client.get_database()[CONVERSATION_COLLECTION]
+
+    async def ensure_indexes(self) -> None:
+        if self.mongodb_client is None:
+            return
+        await self._collection().create_index("expires_at", expireAfterSeconds=0)
+
+    async def _write_persistent(self, response_id: str, record: Dict[str, Any]) -> None:
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        try:
+            await self._collection().replace_one(
+                {"_id": response_id},
+                {**record, "expires_at": expires_at},
+                upsert=True,
+            )
+        except Exception as e:
+            logger.error(f"Conversation write failed: {e}")
+
+    async def _load_chain(
+        self, response_id: str, owner: str
+    ) -> Dict[str, Dict[str, Any]]:
+        """`response_id` and all its ancestors, in one round trip."""
+        if self.mongodb_client is None:
+            return {}
+        pipeline = [
+            {"$match": {"_id": response_id, "user_id": owner}},
+            {
+                "$graphLookup": {
+                    "from": CONVERSATION_COLLECTION,
+                    "startWith": "$previous_response_id",
+                    "connectFromField": "previous_response_id",
+                    "connectToField": "_id",
+                    "as": "ancestors",
+                    "depthField": "depth",
+                    "maxDepth": MAX_CHAIN_LENGTH,
+                    "restrictSearchWithMatch": {"user_id": owner},
+                }
+            },
+        ]
+        try:
+            docs = await self._collection().aggregate(pipeline).to_list(length=1)
+        except Exception as e:
+            logger.error(f"Conversation lookup failed: {e}")
+            return {}
+        if not docs:
+            return {}
+        doc = docs[0]
+        # Oldest first, so the most recent turns end up hottest in the LRU
+        chain = sorted(doc.pop("ancestors", []), key=lambda d: -d["depth"]) + [doc]
+        records: Dict[str, Dict[str, Any]] = {}
+        for item in chain:
+            record = {
+                "user_id": item["user_id"],
+                "previous_response_id": item.get("previous_response_id"),
+                "items": item.get("items") or [],
+            }
+            records[item["_id"]] = record
+            self._remember(item["_id"], record)
+        self._cold_hits += len(records)
+        return records
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import openai
+
+from api.config import get_settings
+
+from .resilience import RetryPolicy
+
+CreateFn = Callable[[str, List[str], Optional[int]], Awaitable[List[Dict[str, Any]]]]
+
+
+class _Batch:
+    __slots__ = ("create", "waiters", "size", "timer", "task")
+
+    def __init__(self, create: CreateFn) -> None:
+        self.create = create
+        self.waiters: List[Tuple[List[str], asyncio.Future]] = []
+        self.size = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class EmbeddingBatcher:
+    """Merge concurrent realtime embedding calls into one upstream request.
+
+    Calls for the same model and dimensions are collected for up to
+    `max_delay` seconds, or until `max_items` inputs are waiting, then sent
+    as a single `create(model, texts, dimensions)` call; each caller gets
+    its own slice back. A text asked by several callers is embedded once.
+    A call larger than `max_items` is sent on its own, never split. The
+    upstream call is cancelled once every caller of a batch went away.
+
+    When the merged call is rejected with a non-retryable 4xx, one caller's
+    input may be at fault: each caller's inputs are then sent again on their
+    own, so only that caller gets the error.
+    """
+
+    def __init__(self, *, max_items: int = 256, max_delay: float = 0.005) -> None:
+        self.max_items = max(1, max_items)
+        self.max_delay = max(0.0, max_delay)
+        self._pending: Dict[Tuple[str, Optional[int]], _Batch] = {}
+        self._running: set[asyncio.Task] = set()
+
+        self._requests = 0
+        self._items = 0
+        self._upstream_calls = 0
+        self._deduplicated = 0
+
+    @classmethod
+    def from_settings(cls) -> Optional["EmbeddingBatcher"]:
+        settings = get_settings()
+        if not settings.embedding_micro_batch_enabled:
+            return None
+        return cls(
+            max_items=settings.embedding_micro_batch_max_items,
+            max_delay=settings.embedding_micro_batch_max_delay_ms / 1000,
+        )
+
+    async def embed(
+        self,
+        create: CreateFn,
+        model: str,
+        inputs: List[str],
+        dimensions: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        key = (model, dimensions)
+        batch = self._pending.get(key)
+        if batch is not None and batch.size + len(inputs) > self.max_items:
+            self._flush(key, batch)
+            batch = None
+        if batch is None:
+            batch = self._pending[key] = _Batch(create)
+            batch.timer = asyncio.get_running_loop().call_later(
+                self.max_delay, self._flush, key, batch
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        batch.waiters.append((inputs, future))
+        batch.size += len(inputs)
+        self._requests += 1
+        self._items += len(inputs)
+        if batch.size >= self.max_items:
+            self._flush(key, batch)
+        try:
+            return await future
+        finally:
+            if batch.task is not None and not batch.task.done():
+                if all(waiter.done() for _, waiter in batch.waiters):
+                    batch.task.cancel()
+
+    async def aclose(self) -> None:
+        for batch in self._pending.values():
+            batch.timer.cancel()
+            for _, future in batch.waiters:
+                future.cancel()
+        self._pending.clear()
+        for task in list(self._running):
+            task.cancel()
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "requests": self._requests,
+            "items": self._items,
+            "upstream_calls": self._upstream_calls,
+            "deduplicated": self._deduplicated,
+            "pending": sum(batch.size for batch in self._pending.values()),
+        }
+
+    def _flush(self, key: Tuple[str, Optional[int]], batch: _Batch) -> None:
+        if self._pending.get(key) is not batch:
+            return
+        del self._pending[key]
+        batch.timer.cancel()
+        if all(future.done() for _, future in batch.waiters):
+            # Every caller already went away
+            return
+        task = batch.task = asyncio.create_task(self._run(key, batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, key: Tuple[str, Optional[int]], batch: _Batch) -> None:
+        model, dimensions = key
+        texts = list(
+            dict.fromkeys(text for inputs, _ in batch.waiters for text in inputs)
+        )
+        self._deduplicated += batch.size - len(texts)
+        try:
+            data = await self._create(batch, model, texts, dimensions)
+        except asyncio.CancelledError:
+            for _, future in batch.waiters:
+                future.cancel()
+            raise
+        except Exception as e:
+            if len(batch.waiters) > 1 and _rejects_inputs(e):
+                await self._run_separately(key, batch)
+                return
+            for _, future in batch.waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, data, strict=True))
+        for inputs, future in batch.waiters:
+            if not future.done():
+                future.set_result([by_text[text] for text in inputs])
+
+    async def _run_separately(
+        self, key: Tuple[str, Optional[int]], batch: _Batch
+    ) -> None:
+        model, dimensions = key
+
+        async def run_alone(inputs: List[str], future: asyncio.Future) -> None:
+            if future.done():
+                return
+            try:
+                data = await self._create(batch, model, inputs, dimensions)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                return
+            if not future.done():
+                future.set_result(data)
+
+        try:
+            await asyncio.gather(
+                *(run_alone(inputs, future) for inputs, future in batch.waiters)
+            )
+        except asyncio.CancelledError:
+            for _, future in batch.waiters:
+                future.cancel()
+            raise
+
+    async def _create(
+        self,
+        batch: _Batch,
+        model: str,
+        texts: List[str],
+        dimensions: Optional[int],
+    ) -> List[Dict[str, Any]]:
+        self._upstream_calls += 1
+        data = await batch.create(model, texts, dimensions)
+        if len(data) != len(texts):
+            raise ValueError(
+                f"Upstream returned {len(data)} embeddings for {len(texts)} inputs"
+            )
+        return data
+
+
+def _rejects_inputs(error: Exception) -> bool:
+    """Whether the upstream refused the request itself (a non-retryable 4xx)."""
+    return (
+        isinstance(error, openai.APIStatusError)
+        and 400 <= error.status_code < 500
+        and not RetryPolicy.is_retryable(error.status_code)
+    )
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+from pymongo import ReplaceOne
+
+from api.config import get_settings
+from api.utils import CustomLogger
+
+logger = CustomLogger.get_logger(__name__)
+
+CACHE_COLLECTION = "llm_embedding_cache"
+
+
+class EmbeddingCache:
+    """Content-addressed cache of embedding vectors.
+
+    A vector is keyed by model, requested dimensions and the sha256 of the
+    text, so the same chunk re-embedded by an ingestion job or the same
+    search query costs nothing upstream. Vectors are kept as packed float32
+    bytes (what the providers return) and read back as read-only NumPy
+    arrays without a copy. The in-memory tier is an LRU bounded by TTL and
+    total bytes; the optional Mongo tier survives restarts and is shared
+    between workers.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_bytes: int = 128 * 1024 * 1024,
+        ttl: float = 30 * 24 * 3600.0,
+        mongodb_client=None,
+    ):
+        self.max_bytes = max(0, int(max_bytes))
+        self.ttl = float(ttl)
+        self.mongodb_client = mongodb_client
+
+        self._entries: OrderedDict[str, Tuple[float, bytes]] = OrderedDict()
+        self._bytes = 0
+        self._background: set[asyncio.Task] = set()
+
+        self._hits = 0
+        self._persistent_hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+
+    @classmethod
+    def from_settings(cls, mongodb_client=None) -> Optional["EmbeddingCache"]:
+        settings = get_settings()
+        if not settings.embedding_cache_enabled:
+            return None
+        return cls(
+            max_bytes=settings.embedding_cache_max_bytes,
+            ttl=settings.embedding_cache_ttl,
+            mongodb_client=(
+                mongodb_client if settings.embedding_cache_persistent else None
+            ),
+        )
+
+    @staticmethod
+    def make_key(model: str, dimensions: Optional[int], text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}:{dimensions or 0}:{digest}"
+
+    # --------------------------------- Access ---------------------------------
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Cached vectors of `keys`; missing keys are absent from the result."""
+        now = time.time()
+        found: Dict[str, np.ndarray] = {}
+        missing: List[str] = []
+        for key in dict.fromkeys(keys):
+            item = self._entries.get(key)
+            if item is not None:
+                expires_at, packed = item
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    found[key] = _unpack(packed)
+                    continue
+                self._remove(key)
+            missing.append(key)
+
+        if missing:
+            stored = await self._get_persistent(missing)
+            for key, packed in stored.items():
+                self._persistent_hits += 1
+                self._store_memory(key, packed, now + self.ttl)
+                found[key] = _unpack(packed)
+            self._misses += len(missing) - len(stored)
+        return found
+
+    def set_many(self, vectors: Mapping[str, np.ndarray]) -> None:
+        if not vectors:
+            return
+        expires_at = time.time() + self.ttl
+        packed = {key: _pack(vector) for key, vector in vectors.items()}
+        for key, value in packed.items():
+            self._store_memory(key, value, expires_at)
+        self._stores += len(packed)
+        if self.mongodb_client is not None:
+            # Persisting happens off the response path
+            task = asyncio.create_task(self._set_persistent(packed))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    def metrics(self) -> Dict[str, object]:
+        lookups = self._hits + self._persistent_hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self._hits,
+            "persistent_hits": self._persistent_hits,
+            "misses": self._misses,
+            "hit_rate": (
+                (self._hits + self._persistent_hits) / lookups if lookups else None
+            ),
+            "stores": self._stores,
+            "evictions": self._evictions,
+        }
+
+    # ------------------------------ Memory tier -------------------------------
+    def _store_memory(self, key: str, packed: bytes, expires_at: float) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, packed)
+        self._bytes += len(packed)
+        while self._bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, packed = self._entries.pop(key)
+        self._bytes -= len(packed)
+
+    # ---------------------------- Persistent tier -----------------------------
+    def _collection(self):
+        return self.mongodb_client.get_database()[CACHE_COLLECTION]
+
+    async def ensure_indexes(self) -> None:
+        if self.mongodb_client is None:
+            return
+        await self._collection().create_index("expires_at", expireAfterSeconds=0)
+
+    async def _get_persistent(self, keys: List[str]) -> Dict[str, bytes]:
+        if self.mongodb_client is None:
+            return {}
+        now = datetime.now(timezone.utc)
+        found: Dict[str, bytes] = {}
+        try:
+            cursor = self._collection().find({"_id": {"$in": keys}})
+            async for doc in cursor:
+                expires_at = doc.get("expires_at")
+                if expires_at is not None:
+                    if expires_at.tzinfo is None:
+                        expires_at = expires_at.replace(tzinfo=timezone.utc)
+                    if expires_at <= now:
+                        continue
+                found[doc["_id"]] = bytes(doc["vector"])
+        except Exception as e:
+            logger.error(f"Embedding cache lookup failed: {e}")
+        return found
+
+    async def _set_persistent(self, packed: Dict[str, bytes]) -> None:
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        operations = [
+            ReplaceOne(
+                {"_id": key},
+                {"vector": value, "expires_at": expires_at},
+                upsert=True,
+            )
+            for key, value in packed.items()
+        ]
+        try:
+            await self._collection().bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Embedding cache write failed: {e}")
+
+
+def _pack(vector) -> bytes:
+    return np.asarray(vector, dtype="<f4").tobytes()
+
+
+def _unpack(packed: bytes) -> np.ndarray:
+    return np.frombuffer(packed, dtype="<f4")
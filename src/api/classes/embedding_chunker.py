@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import asyncio
+import math
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import openai
+
+from api.config import get_settings
+from api.utils.token_estimator import BYTES_PER_TOKEN
+
+from .resilience import RetryPolicy, parse_retry_after
+
+CreateFn = Callable[[str, List[str], Optional[int]], Awaitable[List[Dict[str, Any]]]]
+
+
+class EmbeddingChunker:
+    """Split large realtime embedding calls into chunks run in parallel.
+
+    A chunk holds at most `max_items` inputs and about `max_tokens` tokens
+    (estimated from the text size), the limits of one provider request; a
+    single text above `max_tokens` gets a chunk of its own. Up to
+    `concurrency` chunks of a call are in flight at once. A chunk failing on
+    a connect error, a 429 or a 5xx is retried following `retry`; once one
+    gives up, the others are cancelled and the call fails. Results come
+    back in input order.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_items: int = 512,
+        max_tokens: int = 250_000,
+        concurrency: int = 4,
+        retry: Optional[RetryPolicy] = None,
+    ) -> None:
+        self.max_items = max(1, max_items)
+        self.max_tokens = max(1, max_tokens)
+        self.concurrency = max(1, concurrency)
+        self.retry = retry or RetryPolicy()
+
+        self._calls = 0
+        self._chunks = 0
+        self._retries = 0
+        self._failures = 0
+
+    @classmethod
+    def from_settings(cls) -> Optional["EmbeddingChunker"]:
+        settings = get_settings()
+        if not settings.embedding_chunk_enabled:
+            return None
+        return cls(
+            max_items=settings.embedding_chunk_max_items,
+            max_tokens=settings.embedding_chunk_max_tokens,
+            concurrency=settings.embedding_chunk_concurrency,
+            retry=RetryPolicy.from_settings(),
+        )
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        return max(1, math.ceil(len(text.encode("utf-8")) / BYTES_PER_TOKEN))
+
+    def split(self, inputs: List[str]) -> List[Tuple[int, int]]:
+        """`(start, end)` bounds of the chunks of `inputs`."""
+        bounds: List[Tuple[int, int]] = []
+        start = tokens = 0
+        for i, text in enumerate(inputs):
+            cost = self.estimate_tokens(text)
+            if i > start and (
+                i - start >= self.max_items or tokens + cost > self.max_tokens
+            ):
+                bounds.append((start, i))
+                start, tokens = i, 0
+            tokens += cost
+        if start < len(inputs):
+            bounds.append((start, len(inputs)))
+        return bounds
+
+    async def run(
+        self,
+        create: CreateFn,
+        model: str,
+        inputs: List[str],
+        dimensions: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        self._calls += 1
+        bounds = self.split(inputs)
+        if len(bounds) <= 1:
+            return await self._create_chunk(create, model, inputs, dimensions)
+
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def create_chunk(start: int, end: int) -> List[Dict[str, Any]]:
+            async with slots:
+                return await self._create_chunk(
+                    create, model, inputs[start:end], dimensions
+                )
+
+        tasks = [asyncio.ensure_future(create_chunk(*bound)) for bound in bounds]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return [item for chunk in results for item in chunk]
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "calls": self._calls,
+            "chunks": self._chunks,
+            "retries": self._retries,
+            "failures": self._failures,
+        }
+
+    async def _create_chunk(
+        self,
+        create: CreateFn,
+        model: str,
+        texts: List[str],
+        dimensions: Optional[int],
+    ) -> List[Dict[str, Any]]:
+        self._chunks += 1
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                data = await create(model, texts, dimensions)
+            except (openai.APIConnectionError, openai.APIStatusError) as e:
+                retry_after = None
+                if isinstance(e, openai.APIStatusError):
+                    if not RetryPolicy.is_retryable(e.status_code):
+                        self._failures += 1
+                        raise
+                    retry_after = parse_retry_after(e.response)
+                delay = self.retry.delay(attempt, retry_after)
+                if delay is None:
+                    self._failures += 1
+                    raise
+                self._retries += 1
+                await asyncio.sleep(delay)
+                continue
+            if len(data) != len(texts):
+                self._failures += 1
+                raise ValueError(
+                    f"Upstream returned {len(data)} embeddings for {len(texts)} inputs"
+                )
+            return data
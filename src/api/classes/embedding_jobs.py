@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from api.config import get_settings
+from api.utils import CustomLogger
+
+from .embeddings import Embeddings, EncodingFormat, encode_embedding
+
+logger = CustomLogger.get_logger(__name__)
+
+JOB_COLLECTION = "llm_embedding_jobs"
+
+# Statuses after which a job never changes again
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Provider batch statuses ending a job without results
+_PROVIDER_FAILURES = ("failed", "expired", "cancelled")
+
+# Finished jobs kept in memory when there is no Mongo to read them from
+_MAX_FINISHED = 1000
+
+# Polls that retry a failed completion action before the job is completed
+# without it (the embeddings stay readable)
+MAX_ACTION_ATTEMPTS = 5
+
+# Bookkeeping fields not shown by the API
+_PRIVATE_FIELDS = ("_id", "user_id", "lease_owner", "lease_until", "action_attempts")
+
+# Points upserted by a job get stable ids, so a completion run twice (after
+# a restart mid-upsert) overwrites the same points
+_POINT_NAMESPACE = uuid.UUID("6f1d1c1e-5b7a-4a44-9a51-3f3c9d0e2b10")
+
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """The job as returned by the API, without the owner kept on the side."""
+    return {k: v for k, v in job.items() if k not in _PRIVATE_FIELDS}
+
+
+class EmbeddingJobs:
+    """Embedding batches run by the provider Batch API, without blocking.
+
+    `submit` uploads the inputs, starts the provider batch and returns the
+    job at once. One background task, started with `start`, polls every
+    in-flight job each `poll_interval` seconds and records its status and
+    `request_counts`. Once the provider batch completes, the optional
+    completion action runs: `vector_store_id` upserts the vectors into that
+    Qdrant collection, with the text as `source_text` payload. A failing
+    action is tried again on the next polls; after `MAX_ACTION_ATTEMPTS` the
+    job is completed anyway, with the reason in `action_error`.
+
+    Jobs are kept in memory and, with `mongodb_client`, saved in Mongo;
+    `start` reloads the jobs still in flight, so a restart loses none. Each
+    worker then polls only the jobs it holds a Mongo lease on, so a job is
+    not polled, nor its action run, by every worker at once.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        *,
+        mongodb_client=None,
+        qdrant_client=None,
+        poll_interval: float = 30.0,
+    ) -> None:
+        self.embeddings = embeddings
+        self.mongodb_client = mongodb_client
+        self.qdrant_client = qdrant_client
+        self.poll_interval = poll_interval
+        self.lease = 2 * poll_interval + 60.0
+        self._owner = uuid.uuid4().hex
+
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._poller: Optional[asyncio.Task] = None
+
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._upserted = 0
+
+    @classmethod
+    def from_settings(
+        cls, embeddings: Embeddings, mongodb_client=None, qdrant_client=None
+    ) -> Optional["EmbeddingJobs"]:
+        settings = get_settings()
+        if not settings.embedding_jobs_enabled:
+            return None
+        return cls(
+            embeddings,
+            mongodb_client=mongodb_client,
+            qdrant_client=qdrant_client,
+            poll_interval=settings.embedding_jobs_poll_interval,
+        )
+
+    # --------------------------------- API ------------------------------------
+    async def submit(
+        self,
+        *,
+        user_id: Any,
+        model: str,
+        inputs: List[str],
+        dimensions: Optional[int] = None,
+        vector_store_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        job_id = f"embjob_{uuid.uuid4().hex}"
+        batch = await self.embeddings.submit_batch(model, inputs, job_id, dimensions)
+        job = {
+            "id": job_id,
+            "object": "embedding.job",
+            "model": model,
+            "dimensions": dimensions,
+            "status": getattr(batch, "status", None) or "validating",
+            "batch_id": batch.id,
+            "input_file_id": getattr(batch, "input_file_id", None),
+            "output_file_id": None,
+            "input_count": len(inputs),
+            "request_counts": {"total": len(inputs), "completed": 0, "failed": 0},
+            "vector_store_id": vector_store_id,
+            "error": None,
+            "action_error": None,
+            "created_at": int(time.time()),
+            "completed_at": None,
+            "user_id": str(user_id),
+        }
+        self._jobs[job_id] = job
+        self._submitted += 1
+        await self._save(job)
+        return job
+
+    async def get(self, job_id: str, user_id: Any) -> Optional[Dict[str, Any]]:
+        """The job, or None when missing or owned by someone else."""
+        job = self._jobs.get(job_id)
+        if job is None and self.mongodb_client is not None:
+            job = await self._collection().find_one({"_id": job_id})
+        if job is None or job["user_id"] != str(user_id):
+            return None
+        return job
+
+    async def results(
+        self, job: Dict[str, Any], encoding_format: EncodingFormat = "float"
+    ) -> Dict[str, Any]:
+        """The embeddings of a completed job, as a `/v1/embeddings` response."""
+        data = await self.embeddings.read_batch_embeddings(
+            job["output_file_id"], job["input_count"]
+        )
+        return Embeddings._format_embeddings_openai(
+            [], data, job["model"], encoding_format
+        )
+
+    # -------------------------------- Polling ---------------------------------
+    async def start(self) -> None:
+        """Reload the jobs still in flight and start the poller."""
+        if self.mongodb_client is not None:
+            cursor = self._collection().find({"status": {"$nin": list(FINAL_STATUSES)}})
+            async for job in cursor:
+                self._jobs.setdefault(job["id"], job)
+        if self._poller is None:
+            self._poller = asyncio.create_task(self._poll_forever())
+
+    async def aclose(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+
+    async def poll(self) -> None:
+        """Refresh every in-flight job once."""
+        for job in list(self._jobs.values()):
+            if job["status"] in FINAL_STATUSES:
+                continue
+            try:
+                if await self._claim(job):
+                    await self._poll_job(job)
+            except Exception as e:
+                logger.warning(f"Embedding job {job['id']} poll failed: {e}")
+        self._forget_finished()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "in_flight": sum(
+                1 for job in self._jobs.values() if job["status"] not in FINAL_STATUSES
+            ),
+            "submitted": self._submitted,
+            "completed": self._completed,
+            "failed": self._failed,
+            "points_upserted": self._upserted,
+        }
+
+    async def _poll_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await self.poll()
+
+    async def _poll_job(self, job: Dict[str, Any]) -> None:
+        batch = await self.embeddings.retrieve_batch(job["batch_id"])
+        status = getattr(batch, "status", None)
+        counts = getattr(batch, "request_counts", None)
+        if counts is not None:
+            job["request_counts"] = {
+                "total": getattr(counts, "total", 0),
+                "completed": getattr(counts, "completed", 0),
+                "failed": getattr(counts, "failed", 0),
+            }
+
+        if status == "completed":
+            job["output_file_id"] = getattr(batch, "output_file_id", None)
+            if not job["output_file_id"]:
+                self._fail(job, "failed", "Batch finished without output_file_id")
+            else:
+                await self._finish(job)
+        elif status in _PROVIDER_FAILURES:
+            errors = getattr(getattr(batch, "errors", None), "data", None) or []
+            message = getattr(errors[0], "message", None) if errors else None
+            self._fail(job, status, message or f"Batch {status}")
+        elif status is not None:
+            # Still running; "completed" is only set once the action is done
+            job["status"] = status
+        await self._save(job)
+
+    async def _finish(self, job: Dict[str, Any]) -> None:
+        try:
+            await self._complete(job)
+        except Exception as e:
+            logger.error(f"Embedding job {job['id']} action failed: {e}")
+            job["action_error"] = f"Completion action failed: {e}"
+            job["action_attempts"] = job.get("action_attempts", 0) + 1
+            if job["action_attempts"] < MAX_ACTION_ATTEMPTS:
+                # The provider keeps the results: try again on the next poll
+                job["status"] = "finalizing"
+                return
+        else:
+            job["action_error"] = None
+        job["status"] = "completed"
+        job["completed_at"] = int(time.time())
+        self._completed += 1
+
+    async def _complete(self, job: Dict[str, Any]) -> None:
+        if not job.get("vector_store_id"):
+            return
+        if self.qdrant_client is None:
+            raise RuntimeError("Vector store upsert needs a Qdrant client")
+        data = await self.embeddings.read_batch_embeddings(
+            job["output_file_id"], job["input_count"]
+        )
+        texts = await self.embeddings.read_batch_inputs(job["input_file_id"])
+        ids, vectors, payloads = [], [], []
+        for i, (text, emb) in enumerate(zip(texts, data, strict=True)):
+            if not len(emb["embedding"]):
+                continue
+            ids.append(str(uuid.uuid5(_POINT_NAMESPACE, f"{job['id']}-{i}")))
+            vectors.append(encode_embedding(emb["embedding"]))
+            payloads.append({"source_text": text, "job_id": job["id"]})
+        if ids:
+            await self.qdrant_client.batch_upsert(
+                collection_name=job["vector_store_id"],
+                indexes=ids,
+                vectors=vectors,
+                payloads=payloads,
+            )
+        self._upserted += len(ids)
+
+    def _fail(self, job: Dict[str, Any], status: str, message: str) -> None:
+        job["status"] = status
+        job["error"] = message
+        job["completed_at"] = int(time.time())
+        self._failed += 1
+
+    def _forget_finished(self) -> None:
+        finished = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job["status"] in FINAL_STATUSES
+        ]
+        if self.mongodb_client is not None:
+            # Saved in Mongo; read back from there when asked for
+            for job_id in finished:
+                self._jobs.pop(job_id)
+            return
+        for job_id in finished[: max(0, len(finished) - _MAX_FINISHED)]:
+            self._jobs.pop(job_id)
+
+    # ---------------------------- Persistent tier -----------------------------
+    def _collection(self):
+        return self.mongodb_client.get_database()[JOB_COLLECTION]
+
+    async def _claim(self, job: Dict[str, Any]) -> bool:
+        """Take or renew the lease on `job`; refresh it when another holds it."""
+        if self.mongodb_client is None:
+            return True
+        now = time.time()
+        try:
+            claimed = await self._collection().find_one_and_update(
+                {
+                    "_id": job["id"],
+                    "status": {"$nin": list(FINAL_STATUSES)},
+                    "$or": [
+                        {"lease_until": None},
+                        {"lease_until": {"$lt": now}},
+                        {"lease_owner": self._owner},
+                    ],
+                },
+                {"$set": {"lease_owner": self._owner, "lease_until": now + self.lease}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if claimed is None:
+                stored = await self._collection().find_one({"_id": job["id"]})
+        except Exception as e:
+            logger.error(f"Embedding job lease failed: {e}")
+            return False
+        if claimed is None:
+            # Polled by another worker: keep the copy served by `get` current
+            if stored is not None:
+                job.update(stored)
+            return False
+        job["lease_owner"] = claimed["lease_owner"]
+        job["lease_until"] = claimed["lease_until"]
+        return True
+
+    async def ensure_indexes(self) -> None:
+        if self.mongodb_client is None:
+            return
+        await self._collection().create_index("status")
+
+    async def _save(self, job: Dict[str, Any]) -> None:
+        if self.mongodb_client is None:
+            return
+        try:
+            await self._collection().replace_one(
+                {"_id": job["id"]}, {**job, "_id": job["id"]}, upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Embedding job save failed: {e}")
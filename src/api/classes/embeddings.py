@@ -1,17 +1,26 @@
 from __future__ import annotations
 
 import asyncio
+import base64
+import hashlib
 import io
 import json
 import uuid
-from typing import Any, Dict, List, Literal, Optional, Tuple
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
 
-from openai import AsyncOpenAI
+import numpy as np
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from qdrant_client.models import PointStruct
 
 from api.config import get_settings
 from api.utils import CustomLogger
 
+from .embedding_batcher import EmbeddingBatcher
+from .embedding_cache import EmbeddingCache
+from .embedding_chunker import EmbeddingChunker
+from .http_client import build_http_limits, http2_enabled
+from .single_flight import SingleFlight
+
 logger = CustomLogger.get_logger(__name__)
 
 EMBEDDING_MODELS = {
@@ -26,6 +35,39 @@ EMBEDDING_MODELS = {
 
 Mode = Literal["auto", "realtime", "batch"]
 OutputFormat = Literal["dict", "points", "tuple"]
+EncodingFormat = Literal["float", "base64", "float16", "int8"]
+
+# int8 encoding: a unit-vector component v is sent as round(v * 127)
+INT8_SCALE = 127
+
+
+def as_vector(embedding: Any) -> np.ndarray:
+    """float32 vector of a client result, base64 (little-endian) or floats."""
+    if isinstance(embedding, str):
+        return np.frombuffer(base64.b64decode(embedding), dtype="<f4")
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def encode_embedding(
+    embedding: Any, encoding_format: EncodingFormat = "float"
+) -> Union[List[float], str]:
+    """Serialize a vector for the API.
+
+    "float" is a list of numbers; "base64" is little-endian float32 bytes,
+    as OpenAI sends them; "float16" and "int8" are half and a quarter of
+    that size. "int8" assumes unit vectors (the OpenAI models return them):
+    divide by `INT8_SCALE` to get the components back.
+    """
+    if encoding_format == "float":
+        return embedding.tolist() if isinstance(embedding, np.ndarray) else embedding
+    vector = as_vector(embedding)
+    if encoding_format == "float16":
+        packed = vector.astype("<f2")
+    elif encoding_format == "int8":
+        packed = np.clip(np.rint(vector * INT8_SCALE), -127, 127).astype(np.int8)
+    else:
+        packed = vector.astype("<f4", copy=False)
+    return base64.b64encode(packed.tobytes()).decode("ascii")
 
 
 class Embeddings:
@@ -41,12 +83,22 @@ class Embeddings:
             mode: Literal["auto", "realtime", "batch"] = "auto",
             job_id: Optional[str] = None,
             output_format: Literal["dict", "points", "tuple"] = "dict",
+            dimensions: Optional[int] = None,
+            encoding_format: Literal["float", "base64", "float16", "int8"] = "float",
         ) -> Any
 
+    With a `cache`, only the inputs not embedded before go upstream. With a
+    `batcher`, concurrent realtime calls share upstream requests. With a
+    `chunker`, large realtime calls are split into parallel chunks, and
+    "auto" stays on the realtime path whatever the number of inputs.
+
     Output formats:
         - "dict": OpenAI-like list object
         - "points": List[PointStruct] for Qdrant
         - "tuple": (ids, vectors, payloads)
+
+    Vectors are float32 NumPy arrays from the client result on; they are
+    only turned into lists or base64 (`encoding_format`) by the formatters.
     """
 
     def __init__(
@@ -54,9 +106,28 @@ class Embeddings:
         openai_client: Optional[AsyncOpenAI] = None,
         *,
         batch_threshold: int = 256,  # switch to Batch API if inputs >= threshold when mode="auto"
+        cache: Optional[EmbeddingCache] = None,
+        batcher: Optional[EmbeddingBatcher] = None,
+        chunker: Optional[EmbeddingChunker] = None,
     ):
+        self._owns_client = openai_client is None
         self._client = openai_client or self._build_openai_client()
         self.batch_threshold = max(1, int(batch_threshold))
+        self.cache = cache
+        self.batcher = batcher
+        self.chunker = chunker
+        self.single_flight = SingleFlight()
+        # Chunks are retried by the chunker: the client must not retry them
+        # underneath as well
+        self._chunk_client = self._client
+        if chunker is not None and isinstance(self._client, AsyncOpenAI):
+            self._chunk_client = self._client.with_options(max_retries=0)
+
+    async def aclose(self) -> None:
+        if self.batcher is not None:
+            await self.batcher.aclose()
+        if self._client is not None and self._owns_client:
+            await self._client.close()
 
     # ----------------------------- Core entrypoint -----------------------------
     async def generate_embeddings(
@@ -67,23 +138,23 @@ class Embeddings:
         mode: Mode = "auto",
         job_id: Optional[str] = None,
         output_format: OutputFormat = "dict",
+        dimensions: Optional[int] = None,
+        encoding_format: EncodingFormat = "float",
     ) -> Any:
         if not isinstance(inputs, list) or not all(isinstance(x, str) for x in inputs):
             raise TypeError("inputs must be List[str]")
 
         normalized_model = self._normalize_model(model)
 
-        if mode == "auto":
-            chosen = "batch" if len(inputs) >= self.batch_threshold else "realtime"
-        else:
-            chosen = mode
-
-        if chosen == "realtime":
-            data = await self._embeddings_realtime(normalized_model, inputs)
+        # Offline stub vectors must not end up in the cache
+        if self.cache is not None and self._client is not None:
+            data = await self._embeddings_cached(
+                normalized_model, inputs, mode, job_id, dimensions
+            )
         else:
-            # Batch API requires a job id; generate if not provided
-            job_id = job_id or f"emb-{uuid.uuid4().hex[:12]}"
-            data = await self._embeddings_batch_api(normalized_model, inputs, job_id)
+            data = await self._embeddings_upstream(
+                normalized_model, inputs, mode, job_id, dimensions
+            )
 
         if not data:
             raise ValueError("Empty embeddings response")
@@ -92,11 +163,66 @@ class Embeddings:
             return self._embedding_to_points(inputs, data)
         if output_format == "tuple":
             return self._embedding_to_tuple(inputs, data)
-        return self._format_embeddings_openai(inputs, data, normalized_model)
+        return self._format_embeddings_openai(
+            inputs, data, normalized_model, encoding_format
+        )
+
+    async def _embeddings_upstream(
+        self,
+        model: str,
+        inputs: List[str],
+        mode: Mode,
+        job_id: Optional[str],
+        dimensions: Optional[int],
+    ) -> List[Dict[str, Any]]:
+        if mode == "auto":
+            large = self.chunker is None and len(inputs) >= self.batch_threshold
+            chosen = "batch" if large else "realtime"
+        else:
+            chosen = mode
+
+        if chosen == "realtime":
+            return await self._embeddings_realtime(model, inputs, dimensions)
+        # Batch API requires a job id; generate if not provided
+        job_id = job_id or f"emb-{uuid.uuid4().hex[:12]}"
+        return await self._embeddings_batch_api(model, inputs, job_id, dimensions)
+
+    # ------------------------------ Cached path -------------------------------
+    async def _embeddings_cached(
+        self,
+        model: str,
+        inputs: List[str],
+        mode: Mode,
+        job_id: Optional[str],
+        dimensions: Optional[int],
+    ) -> List[Dict[str, Any]]:
+        keys = [self.cache.make_key(model, dimensions, text) for text in inputs]
+        vectors = await self.cache.get_many(keys)
+
+        # Each missing text goes upstream once, however often it is repeated
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, inputs, strict=True):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        if missing:
+            data = await self._embeddings_upstream(
+                model, list(missing.values()), mode, job_id, dimensions
+            )
+            fetched = {
+                key: emb["embedding"]
+                for key, emb in zip(missing, data, strict=True)
+                if emb.get("object") == "embedding" and len(emb["embedding"])
+            }
+            self.cache.set_many(fetched)
+            vectors.update(fetched)
+
+        return [
+            {"object": "embedding", "embedding": vectors.get(key, [])} for key in keys
+        ]
 
     # ----------------------------- Realtime path -------------------------------
     async def _embeddings_realtime(
-        self, model: str, inputs: List[str]
+        self, model: str, inputs: List[str], dimensions: Optional[int] = None
     ) -> List[Dict[str, Any]]:
         if self._client is None:
             logger.warning(
@@ -104,17 +230,63 @@ class Embeddings:
             )
             return self._offline_embeddings_stub(inputs)
 
-        # The embeddings endpoint accepts a list of inputs directly
-        resp = await self._client.embeddings.create(model=model, input=inputs)
-        # Normalize to a simple list[{object:"embedding", embedding:[...]}]
+        if self.batcher is not None:
+            return await self.batcher.embed(
+                self._create_realtime, model, inputs, dimensions
+            )
+
+        # Identical concurrent batches share one upstream call
+        digest = hashlib.sha256(
+            json.dumps(inputs, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        return await self.single_flight.do(
+            (model, dimensions, digest),
+            lambda: self._create_realtime(model, inputs, dimensions),
+        )
+
+    async def _create_realtime(
+        self, model: str, inputs: List[str], dimensions: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        if self.chunker is None:
+            return await self._create_embeddings(model, inputs, dimensions)
+        return await self.chunker.run(
+            self._create_chunk_embeddings, model, inputs, dimensions
+        )
+
+    async def _create_chunk_embeddings(
+        self, model: str, inputs: List[str], dimensions: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        return await self._create_embeddings(
+            model, inputs, dimensions, client=self._chunk_client
+        )
+
+    async def _create_embeddings(
+        self,
+        model: str,
+        inputs: List[str],
+        dimensions: Optional[int] = None,
+        *,
+        client: Optional[AsyncOpenAI] = None,
+    ) -> List[Dict[str, Any]]:
+        # The embeddings endpoint accepts a list of inputs directly; base64 is
+        # decoded straight into arrays instead of lists of Python floats
+        extra = {"dimensions": dimensions} if dimensions else {}
+        resp = await (client or self._client).embeddings.create(
+            model=model, input=inputs, encoding_format="base64", **extra
+        )
+        # Normalize to a simple list[{object:"embedding", embedding:array}]
         return [
-            {"object": "embedding", "embedding": item.embedding}
+            {"object": "embedding", "embedding": as_vector(item.embedding)}
             for item in getattr(resp, "data", [])
         ]
 
     # ------------------------------ Batch path --------------------------------
     async def _embeddings_batch_api(
-        self, model: str, inputs: List[str], job_id: str
+        self,
+        model: str,
+        inputs: List[str],
+        job_id: str,
+        dimensions: Optional[int] = None,
     ) -> List[Dict[str, Any]]:
         if self._client is None:
             logger.warning(
@@ -122,17 +294,50 @@ class Embeddings:
             )
             return self._offline_embeddings_stub(inputs)
 
-        content = self._build_batch_jsonl_content(model, inputs, job_id)
-        uploaded = await self._upload_file(content)
-        batch = await self._create_embeddings_batch(uploaded.id, job_id)
-
+        batch = await self.submit_batch(model, inputs, job_id, dimensions)
         current = await self._wait_for_batch_completion(batch.id)
         output_file_id = getattr(current, "output_file_id", None)
         if not output_file_id:
             raise ValueError("Batch finished without output_file_id")
+        return await self.read_batch_embeddings(output_file_id, len(inputs))
 
+    # Used on their own by EmbeddingJobs, which polls batches in the background
+    async def submit_batch(
+        self,
+        model: str,
+        inputs: List[str],
+        job_id: str,
+        dimensions: Optional[int] = None,
+    ) -> Any:
+        """Upload `inputs` and start a provider batch; returns the batch."""
+        if self._client is None:
+            raise RuntimeError("OpenAI client not configured")
+        model = self._normalize_model(model)
+        content = self._build_batch_jsonl_content(model, inputs, job_id, dimensions)
+        uploaded = await self._upload_file(content)
+        return await self._create_embeddings_batch(uploaded.id, job_id)
+
+    async def retrieve_batch(self, batch_id: str) -> Any:
+        return await self._client.batches.retrieve(batch_id)
+
+    async def read_batch_embeddings(
+        self, output_file_id: str, num_inputs: int
+    ) -> List[Dict[str, Any]]:
+        """Embeddings of a finished batch, in input order."""
         text_data = await self._read_file_text(output_file_id)
-        return self._parse_embeddings_jsonl(text_data, len(inputs))
+        return self._parse_embeddings_jsonl(text_data, num_inputs)
+
+    async def read_batch_inputs(self, input_file_id: str) -> List[str]:
+        """Texts of a batch input file, in input order."""
+        text_data = await self._read_file_text(input_file_id)
+        by_index: Dict[int, str] = {}
+        for line in text_data.splitlines():
+            if not line.strip():
+                continue
+            obj = json.loads(line)
+            idx = int(obj["custom_id"].rsplit("-", 1)[-1])
+            by_index[idx] = obj["body"]["input"]
+        return [by_index[i] for i in range(len(by_index))]
 
     # ------------------------------ Helpers -----------------------------------
     @staticmethod
@@ -145,18 +350,28 @@ class Embeddings:
         if not api_key:
             logger.warning("OPENAI_API_KEY not set; Embeddings will use offline stub")
             return None
-        return AsyncOpenAI(api_key=api_key)
+        http_client = DefaultAsyncHttpxClient(
+            limits=build_http_limits(), http2=http2_enabled()
+        )
+        return AsyncOpenAI(api_key=api_key, http_client=http_client)
 
     @staticmethod
     def _format_embeddings_openai(
-        inputs: List[str], data: List[Dict], model: str
+        inputs: List[str],
+        data: List[Dict],
+        model: str,
+        encoding_format: EncodingFormat = "float",
     ) -> Dict[str, Any]:
         return {
             "id": f"embd-{uuid.uuid4().hex[:12]}",
             "object": "list",
             "model": model,
             "data": [
-                {"object": "embedding", "embedding": emb["embedding"], "index": i}
+                {
+                    "object": "embedding",
+                    "embedding": encode_embedding(emb["embedding"], encoding_format),
+                    "index": i,
+                }
                 for i, emb in enumerate(data)
                 if emb.get("object") == "embedding"
             ],
@@ -169,7 +384,7 @@ class Embeddings:
         return [
             {
                 "id": i,
-                "vector": emb["embedding"],
+                "vector": encode_embedding(emb["embedding"]),
                 "payload": {"source_text": inputs[i]},
             }
             for i, emb in enumerate(data)
@@ -186,20 +401,25 @@ class Embeddings:
         for i, emb in enumerate(data):
             if emb.get("object") == "embedding":
                 ids.append(i)
-                vectors.append(emb["embedding"])  # type: ignore[index]
+                vectors.append(encode_embedding(emb["embedding"]))  # type: ignore
                 payloads.append({"source_text": inputs[i]})
         return ids, vectors, payloads
 
     # ---------------------------- Batch internals ------------------------------
     @staticmethod
-    def _build_batch_jsonl_content(model: str, inputs: List[str], job_id: str) -> bytes:
+    def _build_batch_jsonl_content(
+        model: str, inputs: List[str], job_id: str, dimensions: Optional[int] = None
+    ) -> bytes:
         lines: List[str] = []
         for idx, text in enumerate(inputs):
+            body: Dict[str, Any] = {"model": model, "input": text}
+            if dimensions:
+                body["dimensions"] = dimensions
             request = {
                 "custom_id": f"{job_id}-{idx}",
                 "method": "POST",
                 "url": "/v1/embeddings",
-                "body": {"model": model, "input": text},
+                "body": body,
             }
             lines.append(json.dumps(request, ensure_ascii=False))
         return ("\n".join(lines)).encode("utf-8")
@@ -256,7 +476,7 @@ class Embeddings:
     def _parse_embeddings_jsonl(
         text_data: str, num_inputs: int
     ) -> List[Dict[str, Any]]:
-        by_index: Dict[int, List[float]] = {}
+        by_index: Dict[int, np.ndarray] = {}
         for line in text_data.splitlines():
             if not line.strip():
                 continue
@@ -272,15 +492,19 @@ class Embeddings:
             data_list = body.get("data", [])
             if data_list:
                 emb = data_list[0].get("embedding")
-                if isinstance(emb, list):
-                    by_index[idx] = emb
-        # Rebuild in input order
+                if isinstance(emb, (list, str)):
+                    by_index[idx] = as_vector(emb)
+        # Rebuild in input order; a missing result is an empty vector
+        missing = as_vector([])
         return [
-            {"object": "embedding", "embedding": by_index.get(i, [])}
+            {"object": "embedding", "embedding": by_index.get(i, missing)}
             for i in range(num_inputs)
         ]
 
     # ------------------------------ Offline stub -------------------------------
     @staticmethod
     def _offline_embeddings_stub(inputs: List[str]) -> List[Dict[str, Any]]:
-        return [{"object": "embedding", "embedding": [0.1, 0.2, 0.3]} for _ in inputs]
+        return [
+            {"object": "embedding", "embedding": as_vector([0.1, 0.2, 0.3])}
+            for _ in inputs
+        ]
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+from api.config import get_settings
+
+FILES_BUCKET = "llm_files"
+
+FILE_PURPOSES = ("batch", "batch_output")
+
+
+class FileTooLargeError(ValueError):
+    """The uploaded content goes past `FileStore.max_bytes`."""
+
+
+def new_file_id() -> str:
+    return f"file-{uuid.uuid4().hex}"
+
+
+class FileWriter:
+    """Append-only writer for one file; the file is listed once closed."""
+
+    def __init__(self, store: "FileStore", file: Dict[str, Any], grid_in=None):
+        self._store = store
+        self._grid_in = grid_in
+        self._parts: List[bytes] = []
+        self.file = file
+
+    @property
+    def id(self) -> str:
+        return self.file["id"]
+
+    async def write(self, data: bytes) -> None:
+        if self.file["bytes"] + len(data) > self._store.max_bytes:
+            await self.abort()
+            raise FileTooLargeError(
+                f"File is larger than {self._store.max_bytes} bytes"
+            )
+        self.file["bytes"] += len(data)
+        if self._grid_in is not None:
+            await self._grid_in.write(data)
+        else:
+            self._parts.append(data)
+
+    async def close(self) -> Dict[str, Any]:
+        if self._grid_in is not None:
+            await self._grid_in.close()
+        else:
+            self._store._memory[self.id] = (self.file, b"".join(self._parts))
+        return self.file
+
+    async def abort(self) -> None:
+        if self._grid_in is not None:
+            await self._grid_in.abort()
+        self._parts = []
+
+
+class FileStore:
+    """OpenAI-compatible file storage for batch inputs and outputs.
+
+    Files are kept in memory, or with `mongodb_client` in a GridFS bucket so
+    that large JSONL files are stored in chunks and read back as a stream.
+    File metadata follows the OpenAI `file` object; `user_id` is kept on the
+    side and never returned.
+    """
+
+    def __init__(
+        self, *, mongodb_client=None, max_bytes: int = 200 * 1024 * 1024
+    ) -> None:
+        self.mongodb_client = mongodb_client
+        self.max_bytes = max_bytes
+        self._memory: Dict[str, tuple[Dict[str, Any], bytes]] = {}
+        self._bucket = None
+        if mongodb_client is not None:
+            self._bucket = AsyncIOMotorGridFSBucket(
+                mongodb_client.get_database(), bucket_name=FILES_BUCKET
+            )
+
+    @classmethod
+    def from_settings(cls, mongodb_client=None) -> "FileStore":
+        settings = get_settings()
+        return cls(mongodb_client=mongodb_client, max_bytes=settings.files_max_bytes)
+
+    def open_writer(self, *, filename: str, purpose: str, user_id: Any) -> FileWriter:
+        file = {
+            "id": new_file_id(),
+            "object": "file",
+            "bytes": 0,
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+            "user_id": str(user_id),
+        }
+        grid_in = None
+        if self._bucket is not None:
+            grid_in = self._bucket.open_upload_stream_with_id(
+                file["id"], filename, metadata=_metadata(file)
+            )
+        return FileWriter(self, file, grid_in)
+
+    async def get(self, file_id: str, user_id: Any) -> Optional[Dict[str, Any]]:
+        """The file object, or None when missing or owned by someone else."""
+        file = await self._find(file_id)
+        if file is None or file["user_id"] != str(user_id):
+            return None
+        return file
+
+    async def list(
+        self, user_id: Any, *, purpose: Optional[str] = None, limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        if self._bucket is None:
+            files = [
+                file
+                for file, _ in self._memory.values()
+                if file["user_id"] == str(user_id)
+                and (purpose is None or file["purpose"] == purpose)
+            ]
+        else:
+            query: Dict[str, Any] = {"metadata.user_id": str(user_id)}
+            if purpose is not None:
+                query["metadata.purpose"] = purpose
+            cursor = self._bucket.find(query).sort("uploadDate", -1).limit(limit)
+            files = [
+                _from_grid_out(grid_out)
+                for grid_out in await cursor.to_list(length=limit)
+            ]
+        files.sort(key=lambda f: f["created_at"], reverse=True)
+        return files[:limit]
+
+    async def iter_chunks(self, file_id: str) -> AsyncIterator[bytes]:
+        if self._bucket is None:
+            item = self._memory.get(file_id)
+            if item is not None:
+                yield item[1]
+            return
+        grid_out = await self._bucket.open_download_stream(file_id)
+        while True:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                return
+            yield chunk
+
+    async def iter_lines(self, file_id: str) -> AsyncIterator[bytes]:
+        """Non-empty lines of a JSONL file, read chunk by chunk."""
+        pending = b""
+        async for chunk in self.iter_chunks(file_id):
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield line
+        if pending.strip():
+            yield pending
+
+    async def delete(self, file_id: str) -> None:
+        if self._bucket is None:
+            self._memory.pop(file_id, None)
+            return
+        await self._bucket.delete(file_id)
+
+    async def _find(self, file_id: str) -> Optional[Dict[str, Any]]:
+        if self._bucket is None:
+            item = self._memory.get(file_id)
+            return item[0] if item is not None else None
+        cursor = self._bucket.find({"_id": file_id}).limit(1)
+        found = await cursor.to_list(length=1)
+        return _from_grid_out(found[0]) if found else None
+
+
+def _metadata(file: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "user_id": file["user_id"],
+        "purpose": file["purpose"],
+        "created_at": file["created_at"],
+    }
+
+
+def _from_grid_out(grid_out) -> Dict[str, Any]:
+    metadata = grid_out.metadata or {}
+    return {
+        "id": grid_out._id,
+        "object": "file",
+        "bytes": grid_out.length,
+        "created_at": metadata.get("created_at", 0),
+        "filename": grid_out.filename,
+        "purpose": metadata.get("purpose"),
+        "status": "processed",
+        "user_id": metadata.get("user_id"),
+    }
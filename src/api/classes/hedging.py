@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, Optional
+
+from api.config import get_settings
+
+
+class HedgePolicy:
+    """When to fire a duplicate of a slow non-stream request, and for whom.
+
+    The hedge delay is either fixed (`delay_ms`) or learned per model as the
+    `percentile` of the last `window` observed latencies, once `min_samples`
+    are known. Each user may trigger at most `budget_per_minute` hedges in a
+    sliding 60 s window, so hedging cannot double a user's upstream spend.
+    """
+
+    def __init__(
+        self,
+        *,
+        delay_ms: Optional[float] = None,
+        percentile: float = 0.95,
+        min_samples: int = 20,
+        window: int = 200,
+        budget_per_minute: int = 10,
+    ) -> None:
+        self.delay_ms = delay_ms
+        self.percentile = min(max(percentile, 0.0), 1.0)
+        self.min_samples = max(1, min_samples)
+        self.window = window
+        self.budget_per_minute = budget_per_minute
+
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._spent: Dict[Hashable, Deque[float]] = {}
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._denied = 0
+
+    @classmethod
+    def from_settings(cls) -> Optional["HedgePolicy"]:
+        settings = get_settings()
+        if not settings.hedge_enabled:
+            return None
+        return cls(
+            delay_ms=settings.hedge_delay_ms,
+            percentile=settings.hedge_percentile,
+            min_samples=settings.hedge_min_samples,
+            budget_per_minute=settings.hedge_budget_per_minute,
+        )
+
+    def delay_for(self, model: Optional[str]) -> Optional[float]:
+        """Seconds to wait before hedging, or None when not known yet."""
+        if self.delay_ms is not None:
+            return self.delay_ms / 1000
+        samples = self._latencies.get(model or "")
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(int(self.percentile * len(ordered)), len(ordered) - 1)
+        return ordered[index] / 1000
+
+    def record(self, model: Optional[str], latency_ms: float) -> None:
+        samples = self._latencies.get(model or "")
+        if samples is None:
+            samples = self._latencies[model or ""] = deque(maxlen=self.window)
+        samples.append(latency_ms)
+
+    def try_acquire(self, user_id: Hashable) -> bool:
+        """Spend one hedge from the user's budget, if any is left."""
+        now = time.monotonic()
+        spent = self._spent.setdefault(user_id, deque())
+        while spent and now - spent[0] >= 60.0:
+            spent.popleft()
+        if len(spent) >= self.budget_per_minute:
+            self._denied += 1
+            return False
+        spent.append(now)
+        self._hedged += 1
+        return True
+
+    def record_win(self) -> None:
+        self._hedge_wins += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "hedged": self._hedged,
+            "hedge_wins": self._hedge_wins,
+            "denied_by_budget": self._denied,
+            "delays_ms": {
+                model: (self.delay_for(model) or 0) * 1000 or None
+                for model in self._latencies
+            },
+        }
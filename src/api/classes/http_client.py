@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from typing import Dict, Optional
+
+import httpx
+
+from api.config import get_settings
+from api.utils import CustomLogger
+
+logger = CustomLogger.get_logger(__name__)
+
+
+def build_http_limits() -> httpx.Limits:
+    settings = get_settings()
+    return httpx.Limits(
+        max_connections=settings.upstream_max_connections,
+        max_keepalive_connections=settings.upstream_max_keepalive_connections,
+        keepalive_expiry=settings.upstream_keepalive_expiry,
+    )
+
+
+def http2_enabled() -> bool:
+    if not get_settings().upstream_http2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning(
+            "UPSTREAM_HTTP2 is set but 'h2' is not installed; using HTTP/1.1"
+        )
+        return False
+    return True
+
+
+def build_openrouter_headers() -> Optional[Dict[str, str]]:
+    settings = get_settings()
+    api_key = settings.openrouter_api_key
+    if not api_key:
+        return None
+    headers: Dict[str, str] = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+    site = settings.openrouter_site_url
+    app_name = settings.openrouter_app_name
+    if site:
+        headers["HTTP-Referer"] = site
+    if app_name:
+        headers["X-Title"] = app_name
+    return headers
+
+
+def build_openrouter_client(
+    timeout: httpx.Timeout | float,
+) -> Optional[httpx.AsyncClient]:
+    """Build a pooled client for OpenRouter, or None when no API key is set.
+
+    Instances are meant to live for the whole process (see `lifespan`), so the
+    TCP/TLS connections are reused across requests.
+    """
+    headers = build_openrouter_headers()
+    if headers is None:
+        return None
+    return httpx.AsyncClient(
+        base_url=get_settings().openrouter_base_url,
+        headers=headers,
+        timeout=timeout,
+        limits=build_http_limits(),
+        http2=http2_enabled(),
+    )
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from api.config import get_settings
+from api.utils import CustomLogger
+
+logger = CustomLogger.get_logger(__name__)
+
+IDEMPOTENCY_COLLECTION = "llm_idempotency_keys"
+
+
+class IdempotencyOutcome:
+    """What to do with a request carrying an `Idempotency-Key`.
+
+    `kind` is one of:
+    - "new": run the request, then call `complete` or `fail`
+    - "replay": `entry` holds the stored result
+    - "join": await `future` for the result of the running call
+    - "conflict": the key is in flight for a stream (or on another worker)
+    - "mismatch": the key was used with a different request body
+    """
+
+    __slots__ = ("kind", "entry", "future", "job_id")
+
+    def __init__(
+        self,
+        kind: str,
+        *,
+        entry: Optional[Dict[str, Any]] = None,
+        future: Optional[asyncio.Future] = None,
+        job_id: Optional[str] = None,
+    ) -> None:
+        self.kind = kind
+        self.entry = entry
+        self.future = future
+        self.job_id = job_id
+
+
+class _InFlight:
+    __slots__ = ("future", "request_hash", "stream", "job_id")
+
+    def __init__(self, request_hash: Optional[str], stream: bool, job_id: str):
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.request_hash = request_hash
+        self.stream = stream
+        self.job_id = job_id
+
+
+class IdempotencyStore:
+    """Results of LLM calls keyed by user, endpoint and `Idempotency-Key`.
+
+    The first request for a key runs; a retry arriving while it runs joins it
+    (non-stream only) and one arriving afterwards gets the stored result. In
+    memory, completed entries are kept in an LRU bounded by count and TTL.
+    The optional Mongo tier stores both the in-flight marker and the result,
+    so a retry routed to another worker is not run twice either.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl: float = 24 * 3600.0,
+        max_entries: int = 10_000,
+        max_entry_bytes: int = 1024 * 1024,
+        mongodb_client=None,
+    ) -> None:
+        self.ttl = float(ttl)
+        self.max_entries = max(1, max_entries)
+        self.max_entry_bytes = max_entry_bytes
+        self.mongodb_client = mongodb_client
+
+        self._in_flight: Dict[str, _InFlight] = {}
+        self._done: OrderedDict[str, Tuple[float, Dict[str, Any]]] = OrderedDict()
+        self._background: set[asyncio.Task] = set()
+
+        self._replays = 0
+        self._joins = 0
+        self._conflicts = 0
+
+    @classmethod
+    def from_settings(cls, mongodb_client=None) -> Optional["IdempotencyStore"]:
+        settings = get_settings()
+        if not settings.idempotency_enabled:
+            return None
+        return cls(
+            ttl=settings.idempotency_ttl,
+            max_entry_bytes=settings.idempotency_max_entry_bytes,
+            mongodb_client=mongodb_client,
+        )
+
+    @staticmethod
+    def scoped_key(user_id: Any, endpoint: str, idempotency_key: str) -> str:
+        return f"{user_id}:{endpoint}:{idempotency_key}"
+
+    async def begin(
+        self, key: str, *, request_hash: Optional[str], stream: bool, job_id: str
+    ) -> IdempotencyOutcome:
+        outcome = self._lookup_memory(key, request_hash)
+        if outcome is not None:
+            return self._count(outcome)
+
+        in_flight = self._in_flight[key] = _InFlight(request_hash, stream, job_id)
+        if self.mongodb_client is None:
+            return IdempotencyOutcome("new", job_id=job_id)
+        try:
+            doc = await self._claim_persistent(key, request_hash, job_id)
+        except BaseException:
+            self._release(key, in_flight, None)
+            raise
+        if doc is None:
+            return IdempotencyOutcome("new", job_id=job_id)
+        # Another worker ran or is running this key; retries that joined
+        # during the claim get the same answer
+        outcome = self._outcome_from_doc(doc, request_hash)
+        self._release(key, in_flight, outcome.entry)
+        return self._count(outcome)
+
+    def complete(self, key: str, entry: Dict[str, Any]) -> None:
+        """Store the result of a "new" call and hand it to joined retries.
+
+        `entry` holds `content`, `status_code`, `media_type` and `job_id`.
+        Only successful results are kept; errors are shared with the retries
+        already waiting, then forgotten so a later retry runs again.
+        """
+        in_flight = self._in_flight.pop(key, None)
+        if in_flight is not None:
+            entry.setdefault("request_hash", in_flight.request_hash)
+            if not in_flight.future.done():
+                in_flight.future.set_result(entry)
+        keep = entry["status_code"] < 400 and (
+            len(entry["content"]) <= self.max_entry_bytes
+        )
+        if keep:
+            self._done[key] = (time.time() + self.ttl, entry)
+            self._done.move_to_end(key)
+            while len(self._done) > self.max_entries:
+                self._done.popitem(last=False)
+        if self.mongodb_client is not None:
+            self._spawn(self._finish_persistent(key, entry if keep else None))
+
+    def fail(self, key: str) -> None:
+        """Forget a "new" call that raised; joined retries get None."""
+        in_flight = self._in_flight.pop(key, None)
+        if in_flight is not None and not in_flight.future.done():
+            in_flight.future.set_result(None)
+        if self.mongodb_client is not None:
+            self._spawn(self._finish_persistent(key, None))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._in_flight),
+            "stored": len(self._done),
+            "replays": self._replays,
+            "joins": self._joins,
+            "conflicts": self._conflicts,
+        }
+
+    # ------------------------------ Memory tier -------------------------------
+    def _lookup_memory(
+        self, key: str, request_hash: Optional[str]
+    ) -> Optional[IdempotencyOutcome]:
+        item = self._done.get(key)
+        if item is not None:
+            expires_at, entry = item
+            if expires_at > time.time():
+                if entry.get("request_hash") != request_hash:
+                    return IdempotencyOutcome("mismatch")
+                return IdempotencyOutcome(
+                    "replay", entry=entry, job_id=entry.get("job_id")
+                )
+            del self._done[key]
+        in_flight = self._in_flight.get(key)
+        if in_flight is None:
+            return None
+        if in_flight.request_hash != request_hash:
+            return IdempotencyOutcome("mismatch")
+        if in_flight.stream:
+            return IdempotencyOutcome("conflict", job_id=in_flight.job_id)
+        return IdempotencyOutcome(
+            "join", future=in_flight.future, job_id=in_flight.job_id
+        )
+
+    def _release(
+        self, key: str, in_flight: _InFlight, entry: Optional[Dict[str, Any]]
+    ) -> None:
+        if self._in_flight.get(key) is in_flight:
+            del self._in_flight[key]
+        if not in_flight.future.done():
+            in_flight.future.set_result(entry)
+
+    def _count(self, outcome: IdempotencyOutcome) -> IdempotencyOutcome:
+        if outcome.kind == "replay":
+            self._replays += 1
+        elif outcome.kind == "join":
+            self._joins += 1
+        elif outcome.kind == "conflict":
+            self._conflicts += 1
+        return outcome
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    # ---------------------------- Persistent tier -----------------------------
+    def _collection(self):
+        return self.mongodb_client.get_database()[IDEMPOTENCY_COLLECTION]
+
+    async def ensure_indexes(self) -> None:
+        if self.mongodb_client is None:
+            return
+        await self._collection().create_index("expires_at", expireAfterSeconds=0)
+
+    async def _claim_persistent(
+        self, key: str, request_hash: Optional[str], job_id: str
+    ) -> Optional[Dict[str, Any]]:
+        """Insert the in-flight marker; return the existing doc if any."""
+        now = datetime.now(timezone.utc)
+        try:
+            await self._collection().insert_one(
+                {
+                    "_id": key,
+                    "state": "in_flight",
+                    "job_id": job_id,
+                    "request_hash": request_hash,
+                    "expires_at": now + timedelta(seconds=self.ttl),
+                }
+            )
+            return None
+        except DuplicateKeyError:
+            pass
+        except Exception as e:
+            logger.error(f"Idempotency key claim failed: {e}")
+            return None
+        try:
+            return await self._collection().find_one({"_id": key})
+        except Exception as e:
+            logger.error(f"Idempotency key lookup failed: {e}")
+            return None
+
+    @staticmethod
+    def _outcome_from_doc(
+        doc: Dict[str, Any], request_hash: Optional[str]
+    ) -> IdempotencyOutcome:
+        if doc.get("request_hash") != request_hash:
+            return IdempotencyOutcome("mismatch")
+        if doc.get("state") != "completed":
+            return IdempotencyOutcome("conflict", job_id=doc.get("job_id"))
+        entry = {
+            "content": bytes(doc["content"]),
+            "status_code": doc["status_code"],
+            "media_type": doc.get("media_type"),
+            "job_id": doc.get("job_id"),
+            "request_hash": doc.get("request_hash"),
+        }
+        return IdempotencyOutcome("replay", entry=entry, job_id=entry["job_id"])
+
+    async def _finish_persistent(
+        self, key: str, entry: Optional[Dict[str, Any]]
+    ) -> None:
+        try:
+            if entry is None:
+                await self._collection().delete_one({"_id": key})
+                return
+            await self._collection().update_one(
+                {"_id": key},
+                {
+                    "$set": {
+                        "state": "completed",
+                        "content": entry["content"],
+                        "status_code": entry["status_code"],
+                        "media_type": entry["media_type"],
+                    }
+                },
+            )
+        except Exception as e:
+            logger.error(f"Idempotency key write failed: {e}")
@@ -4,43 +4,42 @@ from typing import Any, Dict, Optional
 
 import httpx
 
-from api.config import get_settings
+from .http_client import build_openrouter_client
+from .single_flight import SingleFlight
 
 
 class Models:
     def __init__(self, http_client: Optional[httpx.AsyncClient] = None) -> None:
+        self._owns_client = http_client is None
         self._client = http_client or self._build_client()
+        self.single_flight = SingleFlight()
 
     def _build_client(self) -> Optional[httpx.AsyncClient]:
-        settings = get_settings()
-        api_key = settings.openrouter_api_key
-        if not api_key:
-            return None
-        base_url = settings.openrouter_base_url
-        headers: Dict[str, str] = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        }
-        site = settings.openrouter_site_url
-        app_name = settings.openrouter_app_name
-        if site:
-            headers["HTTP-Referer"] = site
-        if app_name:
-            headers["X-Title"] = app_name
-        return httpx.AsyncClient(base_url=base_url, headers=headers, timeout=30.0)
+        return build_openrouter_client(30.0)
+
+    async def aclose(self) -> None:
+        if self._client is not None and self._owns_client:
+            await self._client.aclose()
 
     async def list_models(self) -> Dict[str, Any]:
         if self._client is None:
             # Fallback hors-ligne: retour minimal compatible
             return {"object": "list", "data": []}
-        r = await self._client.get("/models")
-        r.raise_for_status()
-        return r.json()
+        return await self.single_flight.do("/models", self._fetch_models)
 
     async def read_model(self, author: str, model: str) -> Dict[str, Any]:
         if self._client is None:
             return {"id": model, "object": "model"}
-        r = await self._client.get(f"/models/{author}/{model}/endpoints")
+        path = f"/models/{author}/{model}/endpoints"
+        return await self.single_flight.do(path, lambda: self._fetch_endpoints(path))
+
+    async def _fetch_models(self) -> Dict[str, Any]:
+        r = await self._client.get("/models")
+        r.raise_for_status()
+        return r.json()
+
+    async def _fetch_endpoints(self, path: str) -> Dict[str, Any]:
+        r = await self._client.get(path)
         r.raise_for_status()
         json_data = r.json()
         model_data = json_data.get("data", {})
@@ -1,52 +1,338 @@
 from __future__ import annotations
 
+import asyncio
+import time
 from contextlib import asynccontextmanager
-from typing import Any, AsyncIterator, Dict, Optional
+from typing import Any, AsyncIterator, Dict, Hashable, Optional, Tuple, Union
 
 import httpx
 
-from api.config import get_settings
+from api.utils import CustomLogger
+
+from .hedging import HedgePolicy
+from .resilience import CircuitOpenError, RetryPolicy, parse_retry_after
+from .single_flight import SingleFlight
+from .upstream_router import Upstream, UpstreamRouter, build_default_router
+
+logger = CustomLogger.get_logger(__name__)
+
+Payload = Union[Dict[str, Any], bytes]
+
+
+def _body(payload: Payload) -> Dict[str, Any]:
+    if isinstance(payload, bytes):
+        return {"content": payload}
+    return {"json": payload}
+
+
+def _succeeded(task: asyncio.Future) -> bool:
+    return (
+        not task.cancelled()
+        and task.exception() is None
+        and task.result().status_code < 500
+    )
+
+
+def _close_result(task: asyncio.Future) -> None:
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(task.result().aclose())
+
+
+def _discard(task: asyncio.Future) -> None:
+    """Cancel a losing request and release its connection if it answered."""
+    task.cancel()
+    task.add_done_callback(_close_result)
+
+
+class NoUpstreamAvailable(httpx.RequestError):
+    """No configured upstream accepts the requested model."""
 
 
 class OpenRouterProxy:
-    def __init__(self, http_client: Optional[httpx.AsyncClient] = None) -> None:
-        self._client = http_client or self._build_client()
-
-    def _build_client(self) -> Optional[httpx.AsyncClient]:
-        settings = get_settings()
-        api_key = settings.openrouter_api_key
-        if not api_key:
-            return None
-        base_url = settings.openrouter_base_url
-        headers: Dict[str, str] = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        }
-        site = settings.openrouter_site_url
-        app_name = settings.openrouter_app_name
-        if site:
-            headers["HTTP-Referer"] = site
-        if app_name:
-            headers["X-Title"] = app_name
-        timeout = httpx.Timeout(60.0, read=None)
-        return httpx.AsyncClient(base_url=base_url, headers=headers, timeout=timeout)
+    """Client for the OpenAI-compatible upstreams (OpenRouter by default).
+
+    Requests go through an `UpstreamRouter`: the best healthy upstream that
+    serves the model is tried first, and connect errors, 429 or 5xx answers
+    fail over to the next one before anything is sent to the caller. When
+    every upstream failed, the attempt is retried following `RetryPolicy`;
+    upstreams whose circuit breaker is open are skipped.
+
+    With a `HedgePolicy`, calls made with `hedge=True` fire a duplicate
+    request when the first one runs past the policy delay, and keep whichever
+    answers first.
+    """
+
+    def __init__(
+        self,
+        http_client: Optional[httpx.AsyncClient] = None,
+        router: Optional[UpstreamRouter] = None,
+        hedging: Optional[HedgePolicy] = None,
+        retry: Optional[RetryPolicy] = None,
+    ) -> None:
+        if router is None:
+            if http_client is not None:
+                router = UpstreamRouter(
+                    [Upstream("openrouter", http_client, owns_client=False)]
+                )
+            else:
+                router = build_default_router()
+                hedging = hedging or HedgePolicy.from_settings()
+        self.router = router
+        self.hedging = hedging
+        self.retry = retry or RetryPolicy.from_settings()
+        self.single_flight = SingleFlight()
 
     def is_configured(self) -> bool:
-        return self._client is not None
+        return bool(self.router.upstreams)
+
+    async def aclose(self) -> None:
+        await self.router.aclose()
+
+    @staticmethod
+    def upstream_name(response: httpx.Response) -> Optional[str]:
+        """Name of the upstream that produced `response`."""
+        return response.extensions.get("upstream")
+
+    @staticmethod
+    def was_hedged(response: httpx.Response) -> bool:
+        """Whether a duplicate request was fired to obtain `response`."""
+        return bool(response.extensions.get("hedged"))
 
-    async def post(self, path: str, payload: Dict[str, Any]) -> httpx.Response:
-        if self._client is None:
+    async def _send(
+        self,
+        path: str,
+        payload: Payload,
+        model: Optional[str],
+        *,
+        alternate: bool = False,
+        retry: Optional[RetryPolicy] = None,
+    ) -> httpx.Response:
+        """Send to the first upstream that answers, with headers read only.
+
+        Connect errors, 429 and 5xx go to the next upstream; once all have
+        been tried, the whole pass is retried with backoff (`retry`, else the
+        proxy policy). `alternate` starts from the second-best upstream, so a
+        hedge goes elsewhere when there is somewhere else to go.
+        """
+        if not self.router.upstreams:
             raise RuntimeError("OpenRouter client not configured")
-        return await self._client.post(path, json=payload)
+        retry = retry or self.retry
+        attempt = 0
+        while True:
+            attempt += 1
+            response, error = await self._attempt(path, payload, model, alternate)
+            if response is not None and not RetryPolicy.is_retryable(
+                response.status_code
+            ):
+                return response
+            retry_after = parse_retry_after(response) if response is not None else None
+            delay = retry.delay(attempt, retry_after)
+            if delay is None:
+                if response is not None:
+                    return response
+                raise error
+            if response is not None:
+                await response.aclose()
+            logger.warning(
+                f"Upstream attempt {attempt} failed "
+                f"({response.status_code if response is not None else error}), "
+                f"retrying in {delay:.2f}s"
+            )
+            await asyncio.sleep(delay)
+
+    async def _attempt(
+        self, path: str, payload: Payload, model: Optional[str], alternate: bool
+    ) -> Tuple[Optional[httpx.Response], Optional[Exception]]:
+        """One pass over the candidates; returns the last answer or error."""
+        candidates = self.router.candidates(model)
+        if not candidates:
+            raise NoUpstreamAvailable(f"No upstream serves model {model!r}")
+        if alternate:
+            candidates = candidates[1:] + candidates[:1]
+        last_response: Optional[httpx.Response] = None
+        last_error: Optional[Exception] = None
+        for upstream in candidates:
+            if not upstream.breaker.allow():
+                continue
+            if last_response is not None:
+                await last_response.aclose()
+                last_response = None
+            try:
+                response = await self._send_to(upstream, path, payload)
+            except httpx.TransportError as exc:
+                logger.warning(f"Upstream {upstream.name} failed: {exc}")
+                last_error = exc
+                continue
+            if not RetryPolicy.is_retryable(response.status_code):
+                return response, None
+            logger.warning(f"Upstream {upstream.name} answered {response.status_code}")
+            last_response = response
+        if last_response is None and last_error is None:
+            last_error = CircuitOpenError(
+                f"Circuit open for every upstream serving model {model!r}"
+            )
+        return last_response, last_error
+
+    async def _send_to(
+        self, upstream: Upstream, path: str, payload: Payload
+    ) -> httpx.Response:
+        """Send to one upstream and record the outcome for routing."""
+        request = upstream.client.build_request("POST", path, **_body(payload))
+        start_time = time.perf_counter()
+        try:
+            response = await upstream.client.send(request, stream=True)
+        except httpx.TransportError:
+            latency_ms = (time.perf_counter() - start_time) * 1000
+            self.router.record(upstream, latency_ms, ok=False)
+            upstream.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled (e.g. a losing hedge): free the half-open trial
+            upstream.breaker.release()
+            raise
+        latency_ms = (time.perf_counter() - start_time) * 1000
+        ok = response.status_code < 500
+        self.router.record(upstream, latency_ms, ok=ok)
+        if ok:
+            upstream.breaker.record_success()
+        else:
+            upstream.breaker.record_failure()
+        response.extensions["upstream"] = upstream.name
+        return response
+
+    async def _send_hedged(
+        self,
+        path: str,
+        payload: Payload,
+        model: Optional[str],
+        user_id: Hashable,
+        retry: Optional[RetryPolicy] = None,
+    ) -> httpx.Response:
+        start_time = time.perf_counter()
+        delay = self.hedging.delay_for(model)
+        primary = asyncio.ensure_future(self._send(path, payload, model, retry=retry))
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done and self.hedging.try_acquire(user_id):
+                    return await self._race(
+                        primary, path, payload, model, start_time, retry
+                    )
+            response = await asyncio.shield(primary)
+        except BaseException:
+            # Cancelled at any point (last single-flight waiter gone, client
+            # disconnected): stop the call and close whatever it returns
+            _discard(primary)
+            raise
+        self.hedging.record(model, (time.perf_counter() - start_time) * 1000)
+        return response
+
+    async def _race(
+        self,
+        primary: asyncio.Future,
+        path: str,
+        payload: Payload,
+        model: Optional[str],
+        start_time: float,
+        retry: Optional[RetryPolicy] = None,
+    ) -> httpx.Response:
+        hedge = asyncio.ensure_future(
+            self._send(path, payload, model, alternate=True, retry=retry)
+        )
+        pending = {primary, hedge}
+        winner: Optional[asyncio.Future] = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                winner = next((task for task in done if _succeeded(task)), None)
+            if winner is None:
+                # Both failed: surface the primary's outcome
+                winner = primary
+        finally:
+            for task in (primary, hedge):
+                if task is not winner:
+                    _discard(task)
+        response = winner.result()
+        response.extensions["hedged"] = True
+        if winner is hedge:
+            self.hedging.record_win()
+        self.hedging.record(model, (time.perf_counter() - start_time) * 1000)
+        return response
+
+    async def _open(
+        self,
+        path: str,
+        payload: Payload,
+        model: Optional[str],
+        hedge_user: Optional[Hashable],
+        retry: Optional[RetryPolicy] = None,
+    ) -> httpx.Response:
+        if self.hedging is None or hedge_user is None:
+            return await self._send(path, payload, model, retry=retry)
+        return await self._send_hedged(path, payload, model, hedge_user, retry)
+
+    async def _post(
+        self,
+        path: str,
+        payload: Payload,
+        model: Optional[str],
+        hedge_user: Optional[Hashable] = None,
+        retry: Optional[RetryPolicy] = None,
+    ) -> httpx.Response:
+        response = await self._open(path, payload, model, hedge_user, retry)
+        try:
+            await response.aread()
+        finally:
+            await response.aclose()
+        return response
+
+    async def post(
+        self,
+        path: str,
+        payload: Payload,
+        *,
+        dedupe_key: Optional[str] = None,
+        model: Optional[str] = None,
+        hedge_user: Optional[Hashable] = None,
+        retry: Optional[RetryPolicy] = None,
+    ) -> httpx.Response:
+        """POST to the best upstream for `model`.
+
+        `payload` is either a JSON-serializable dict or an already encoded
+        body, which is forwarded as-is. Concurrent calls with the same
+        `dedupe_key` share one upstream request; only pass one for
+        deterministic requests. `hedge_user` opts the call into hedging,
+        charged to that user's budget. `retry` replaces the proxy retry
+        policy for this call.
+        """
+        if model is None and isinstance(payload, dict):
+            model = payload.get("model")
+        if dedupe_key is None:
+            return await self._post(path, payload, model, hedge_user, retry)
+        return await self.single_flight.do(
+            (path, dedupe_key),
+            lambda: self._post(path, payload, model, hedge_user, retry),
+        )
 
     @asynccontextmanager
     async def stream(
-        self, path: str, payload: Dict[str, Any]
+        self,
+        path: str,
+        payload: Payload,
+        *,
+        model: Optional[str] = None,
+        hedge_user: Optional[Hashable] = None,
     ) -> AsyncIterator[httpx.Response]:
-        if self._client is None:
-            raise RuntimeError("OpenRouter client not configured")
-        async with self._client.stream("POST", path, json=payload) as response:
+        """Open a streamed POST; hedging only covers the wait for headers."""
+        if model is None and isinstance(payload, dict):
+            model = payload.get("model")
+        response = await self._open(path, payload, model, hedge_user)
+        try:
             yield response
+        finally:
+            await response.aclose()
 
     async def chat_completions(self, payload: Dict[str, Any]) -> httpx.Response:
         return await self.post("/chat/completions", payload)
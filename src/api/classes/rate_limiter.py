@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from api.config import get_settings
+from api.utils import CustomLogger
+
+logger = CustomLogger.get_logger(__name__)
+
+RATE_LIMIT_COLLECTION = "rate_limit_counters"
+
+# Full (idle) buckets are dropped once the table grows past this size
+_PRUNE_ABOVE = 10_000
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `capacity` per minute."""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float) -> None:
+        self.capacity = float(capacity)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        if now <= self.updated:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 when available now).
+
+        A charge larger than the capacity only needs a full bucket, otherwise
+        it could never pass; it then leaves the bucket in debt.
+        """
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def reset_time(self) -> float:
+        """Seconds until the bucket is full again."""
+        return (self.capacity - self.tokens) / self.rate
+
+
+class RateLimitResult:
+    """Outcome of a check, with the values for the `X-RateLimit-*` headers."""
+
+    __slots__ = ("allowed", "retry_after", "headers")
+
+    def __init__(
+        self, allowed: bool, retry_after: float, headers: Dict[str, str]
+    ) -> None:
+        self.allowed = allowed
+        self.retry_after = retry_after
+        self.headers = headers
+
+
+class RateLimiter:
+    """Token buckets for requests/min and estimated tokens/min.
+
+    Every request is charged to up to three scopes: the API key used, the
+    user, and the (user, model) pair. A request is admitted only when all
+    buckets have room, and then charged to all of them, so one runaway key or
+    model cannot consume the whole user budget unnoticed.
+
+    Buckets live in memory. With `mongodb_client`, per-minute counters are
+    also incremented atomically in Mongo so limits hold across workers.
+    """
+
+    def __init__(
+        self,
+        *,
+        limits: Dict[str, Tuple[int, int]],
+        mongodb_client=None,
+    ) -> None:
+        # scope kind -> (requests per minute, tokens per minute); 0 disables
+        self.limits = limits
+        self.mongodb_client = mongodb_client
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._allowed = 0
+        self._limited = 0
+
+    @classmethod
+    def from_settings(cls, mongodb_client=None) -> Optional["RateLimiter"]:
+        settings = get_settings()
+        if not settings.rate_limit_enabled:
+            return None
+        return cls(
+            limits={
+                "key": (
+                    settings.rate_limit_key_requests_per_minute,
+                    settings.rate_limit_key_tokens_per_minute,
+                ),
+                "user": (
+                    settings.rate_limit_user_requests_per_minute,
+                    settings.rate_limit_user_tokens_per_minute,
+                ),
+                "model": (
+                    settings.rate_limit_model_requests_per_minute,
+                    settings.rate_limit_model_tokens_per_minute,
+                ),
+            },
+            mongodb_client=mongodb_client if settings.rate_limit_shared else None,
+        )
+
+    async def check(
+        self,
+        *,
+        user_id: Any,
+        api_key_id: Optional[str] = None,
+        model: Optional[str] = None,
+        tokens: int = 0,
+    ) -> RateLimitResult:
+        scopes: List[Tuple[str, str]] = [("user", str(user_id))]
+        if api_key_id:
+            scopes.append(("key", api_key_id))
+        if model:
+            scopes.append(("model", f"{user_id}:{model}"))
+
+        now = time.monotonic()
+        charges = self._charges(scopes, tokens)
+        for bucket, _, _ in charges:
+            bucket.refill(now)
+
+        retry_after = max(
+            (bucket.wait_time(amount) for bucket, amount, _ in charges), default=0.0
+        )
+        if retry_after == 0.0 and self.mongodb_client is not None:
+            retry_after = await self._check_shared(scopes, tokens)
+        if retry_after == 0.0:
+            for bucket, amount, _ in charges:
+                bucket.tokens -= amount
+            self._allowed += 1
+        else:
+            self._limited += 1
+        if len(self._buckets) > _PRUNE_ABOVE:
+            self._prune(now)
+        return RateLimitResult(
+            retry_after == 0.0, retry_after, self._headers(charges, retry_after)
+        )
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "buckets": len(self._buckets),
+            "allowed": self._allowed,
+            "limited": self._limited,
+            "shared": self.mongodb_client is not None,
+        }
+
+    # ------------------------------ Internals ---------------------------------
+    def _charges(
+        self, scopes: List[Tuple[str, str]], tokens: int
+    ) -> List[Tuple[TokenBucket, float, bool]]:
+        """(bucket, amount, counts tokens rather than requests) of each limit."""
+        charges: List[Tuple[TokenBucket, float, bool]] = []
+        for kind, name in scopes:
+            requests_limit, tokens_limit = self.limits.get(kind, (0, 0))
+            if requests_limit:
+                bucket = self._bucket(f"{kind}:req", name, requests_limit)
+                charges.append((bucket, 1, False))
+            if tokens_limit:
+                bucket = self._bucket(f"{kind}:tok", name, tokens_limit)
+                charges.append((bucket, tokens, True))
+        return charges
+
+    def _bucket(self, kind: str, name: str, capacity: int) -> TokenBucket:
+        bucket = self._buckets.get((kind, name))
+        if bucket is None:
+            bucket = self._buckets[(kind, name)] = TokenBucket(capacity)
+        return bucket
+
+    def _prune(self, now: float) -> None:
+        for key, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self._buckets[key]
+
+    @staticmethod
+    def _headers(
+        charges: List[Tuple[TokenBucket, float, bool]], retry_after: float
+    ) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        for suffix, counts_tokens in (("", False), ("-Tokens", True)):
+            buckets = [b for b, _, is_tokens in charges if is_tokens == counts_tokens]
+            if not buckets:
+                continue
+            tightest = min(buckets, key=lambda b: b.tokens)
+            headers[f"X-RateLimit-Limit{suffix}"] = str(int(tightest.capacity))
+            headers[f"X-RateLimit-Remaining{suffix}"] = str(
+                max(0, int(tightest.tokens))
+            )
+            headers[f"X-RateLimit-Reset{suffix}"] = str(
+                math.ceil(tightest.reset_time())
+            )
+        if retry_after:
+            headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+        return headers
+
+    # ---------------------------- Shared counters -----------------------------
+    async def ensure_indexes(self) -> None:
+        if self.mongodb_client is None:
+            return
+        collection = self.mongodb_client.get_database()[RATE_LIMIT_COLLECTION]
+        await collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def _check_shared(self, scopes: List[Tuple[str, str]], tokens: int) -> float:
+        """Fixed one-minute windows counted atomically in Mongo.
+
+        The request is counted in every scope first; when one is over its
+        limit the counts are taken back, so only admitted requests use up
+        the window and a throttled client does not extend its own lockout.
+        """
+        now = datetime.now(timezone.utc)
+        window = now.replace(second=0, microsecond=0)
+        collection = self.mongodb_client.get_database()[RATE_LIMIT_COLLECTION]
+        ids = [f"{kind}:{name}:{window.isoformat()}" for kind, name in scopes]
+
+        async def increment(counter_id: str, requests: int, amount: int):
+            return await collection.find_one_and_update(
+                {"_id": counter_id},
+                {
+                    "$inc": {"requests": requests, "tokens": amount},
+                    "$setOnInsert": {"expires_at": window + timedelta(minutes=2)},
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+
+        try:
+            counters = await asyncio.gather(
+                *(increment(counter_id, 1, tokens) for counter_id in ids)
+            )
+        except Exception as e:
+            # The local buckets still apply when Mongo is unavailable
+            logger.error(f"Shared rate limit check failed: {e}")
+            return 0.0
+        for (kind, _), counter in zip(scopes, counters, strict=True):
+            requests_limit, tokens_limit = self.limits.get(kind, (0, 0))
+            if (requests_limit and counter["requests"] > requests_limit) or (
+                tokens_limit and counter["tokens"] > tokens_limit
+            ):
+                try:
+                    await asyncio.gather(
+                        *(increment(counter_id, -1, -tokens) for counter_id in ids)
+                    )
+                except Exception as e:
+                    logger.error(f"Shared rate limit refund failed: {e}")
+                return max(1.0, 60.0 - (now - window).total_seconds())
+        return 0.0
@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from api.config import get_settings
+from api.utils import CustomLogger, LazyJSONObject
+
+logger = CustomLogger.get_logger(__name__)
+
+CACHE_COLLECTION = "llm_response_cache"
+
+# Fields that only change how the answer is delivered, not the answer itself.
+_DELIVERY_FIELDS = ("stream", "stream_options")
+
+
+class ResponseCache:
+    """Exact-match cache for deterministic LLM responses.
+
+    Entries are keyed by user, endpoint and the request body without the
+    streaming fields, so a cached answer can be replayed to `stream: true`
+    callers. The in-memory tier is an LRU bounded by TTL and
+    total bytes; the optional Mongo tier survives restarts and is shared
+    between workers.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entry_bytes: int = 1024 * 1024,
+        ttl: float = 3600.0,
+        mongodb_client=None,
+    ):
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_entry_bytes = max(0, int(max_entry_bytes))
+        self.ttl = float(ttl)
+        self.mongodb_client = mongodb_client
+
+        self._entries: OrderedDict[str, Tuple[float, Dict[str, Any]]] = OrderedDict()
+        self._bytes = 0
+        self._background: set[asyncio.Task] = set()
+
+        self._hits = 0
+        self._persistent_hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+
+    @classmethod
+    def from_settings(cls, mongodb_client=None) -> Optional["ResponseCache"]:
+        settings = get_settings()
+        if not settings.response_cache_enabled:
+            return None
+        return cls(
+            max_bytes=settings.response_cache_max_bytes,
+            max_entry_bytes=settings.response_cache_max_entry_bytes,
+            ttl=settings.response_cache_ttl,
+            mongodb_client=(
+                mongodb_client if settings.response_cache_persistent else None
+            ),
+        )
+
+    # ------------------------------ Eligibility -------------------------------
+    @staticmethod
+    def is_cacheable(
+        payload: LazyJSONObject | Mapping[str, Any], headers: Mapping[str, str]
+    ) -> bool:
+        """Only deterministic requests: temperature 0 or `X-Cache: allow`."""
+        if headers.get("x-cache", "").lower() == "allow":
+            return True
+        temperature = payload.get("temperature")
+        return isinstance(temperature, (int, float)) and temperature == 0
+
+    @staticmethod
+    def make_key(user_id: Any, endpoint: str, payload: LazyJSONObject) -> str:
+        # Canonical form: key order and whitespace do not split entries
+        body = {k: v for k, v in payload.to_dict().items() if k not in _DELIVERY_FIELDS}
+        canonical = json.dumps(
+            body, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+        )
+        digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+        return f"{user_id}:{endpoint}:{digest}"
+
+    # --------------------------------- Access ---------------------------------
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        item = self._entries.get(key)
+        if item is not None:
+            expires_at, entry = item
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry
+            self._remove(key)
+
+        entry = await self._get_persistent(key)
+        if entry is not None:
+            self._persistent_hits += 1
+            self._store_memory(key, entry, now + self.ttl)
+            return entry
+        self._misses += 1
+        return None
+
+    def set(
+        self,
+        key: str,
+        content: bytes,
+        media_type: Optional[str],
+        *,
+        provider_response_id: Optional[str] = None,
+        finish_reason: Optional[str] = None,
+    ) -> None:
+        if len(content) > self.max_entry_bytes:
+            return
+        entry = {
+            "content": content,
+            "media_type": media_type,
+            "provider_response_id": provider_response_id,
+            "finish_reason": finish_reason,
+        }
+        self._store_memory(key, entry, time.time() + self.ttl)
+        self._stores += 1
+        if self.mongodb_client is not None:
+            # Persisting happens off the response path
+            task = asyncio.create_task(self._set_persistent(key, entry))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self._hits + self._persistent_hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self._hits,
+            "persistent_hits": self._persistent_hits,
+            "misses": self._misses,
+            "hit_rate": (
+                (self._hits + self._persistent_hits) / lookups if lookups else None
+            ),
+            "stores": self._stores,
+            "evictions": self._evictions,
+        }
+
+    # ------------------------------ Memory tier -------------------------------
+    def _store_memory(self, key: str, entry: Dict[str, Any], expires_at: float) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, entry)
+        self._bytes += len(entry["content"])
+        while self._bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, entry = self._entries.pop(key)
+        self._bytes -= len(entry["content"])
+
+    # ---------------------------- Persistent tier -----------------------------
+    async def ensure_indexes(self) -> None:
+        if self.mongodb_client is None:
+            return
+        collection = self.mongodb_client.get_database()[CACHE_COLLECTION]
+        await collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def _get_persistent(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.mongodb_client is None:
+            return None
+        try:
+            doc = await self.mongodb_client.find_one(CACHE_COLLECTION, {"_id": key})
+        except Exception as e:
+            logger.error(f"Response cache lookup failed: {e}")
+            return None
+        if doc is None:
+            return None
+        expires_at = doc.get("expires_at")
+        if expires_at is not None:
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            if expires_at <= datetime.now(timezone.utc):
+                return None
+        return {
+            "content": bytes(doc["content"]),
+            "media_type": doc.get("media_type"),
+            "provider_response_id": doc.get("provider_response_id"),
+            "finish_reason": doc.get("finish_reason"),
+        }
+
+    async def _set_persistent(self, key: str, entry: Dict[str, Any]) -> None:
+        collection = self.mongodb_client.get_database()[CACHE_COLLECTION]
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        try:
+            await collection.replace_one(
+                {"_id": key}, {**entry, "expires_at": expires_at}, upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Response cache write failed: {e}")
+
+
+# ------------------------------- SSE replay -----------------------------------
+def _sse(data: Dict[str, Any], event: Optional[str] = None) -> bytes:
+    line = b"data: " + json.dumps(data, ensure_ascii=False).encode("utf-8") + b"\n\n"
+    if event is None:
+        return line
+    return f"event: {event}\n".encode("utf-8") + line
+
+
+def chat_completion_to_sse(
+    completion: Dict[str, Any], *, include_usage: bool = False
+) -> List[bytes]:
+    """Replay a `chat.completion` object as `chat.completion.chunk` events.
+
+    The final `choices: []` usage chunk is only sent with `include_usage`,
+    as upstream does for `stream_options.include_usage`.
+    """
+    base = {
+        "id": completion.get("id"),
+        "object": "chat.completion.chunk",
+        "created": completion.get("created"),
+        "model": completion.get("model"),
+    }
+    events: List[bytes] = []
+    for position, choice in enumerate(completion.get("choices") or []):
+        index = choice.get("index", position)
+        message = choice.get("message") or {}
+        delta = {
+            k: v
+            for k, v in message.items()
+            if k in ("role", "content", "refusal", "reasoning") and v is not None
+        }
+        tool_calls = message.get("tool_calls")
+        if tool_calls:
+            delta["tool_calls"] = [
+                {"index": i, **call} for i, call in enumerate(tool_calls)
+            ]
+        events.append(
+            _sse(
+                {
+                    **base,
+                    "choices": [
+                        {"index": index, "delta": delta, "finish_reason": None}
+                    ],
+                }
+            )
+        )
+        events.append(
+            _sse(
+                {
+                    **base,
+                    "choices": [
+                        {
+                            "index": index,
+                            "delta": {},
+                            "finish_reason": choice.get("finish_reason"),
+                        }
+                    ],
+                }
+            )
+        )
+    if include_usage and completion.get("usage"):
+        events.append(_sse({**base, "choices": [], "usage": completion["usage"]}))
+    events.append(b"data: [DONE]\n\n")
+    return events
+
+
+def response_to_sse(response: Dict[str, Any]) -> List[bytes]:
+    """Replay a Responses API `response` object as streaming events."""
+    sequence = 0
+
+    def event(event_type: str, **fields: Any) -> bytes:
+        nonlocal sequence
+        data = {"type": event_type, "sequence_number": sequence, **fields}
+        sequence += 1
+        return _sse(data, event_type)
+
+    events = [
+        event(
+            "response.created",
+            response={**response, "status": "in_progress", "output": []},
+        )
+    ]
+    for output_index, item in enumerate(response.get("output") or []):
+        if item.get("type") != "message":
+            continue
+        for content_index, part in enumerate(item.get("content") or []):
+            if part.get("type") == "output_text" and part.get("text"):
+                events.append(
+                    event(
+                        "response.output_text.delta",
+                        item_id=item.get("id"),
+                        output_index=output_index,
+                        content_index=content_index,
+                        delta=part["text"],
+                    )
+                )
+    events.append(event("response.completed", response=response))
+    return events
@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Mapping, Optional
+
+from qdrant_client import models
+
+from api.config import get_settings
+from api.utils import CustomLogger, LazyJSONObject
+
+logger = CustomLogger.get_logger(__name__)
+
+SEMANTIC_CACHE_COLLECTION = "llm_semantic_cache"
+
+# Request fields that change the answer to the same question, or its shape
+_SCOPE_FIELDS = (
+    "tools",
+    "tool_choice",
+    "response_format",
+    "max_tokens",
+    "max_completion_tokens",
+    "max_output_tokens",
+    "logprobs",
+    "top_logprobs",
+    "stop",
+    "seed",
+)
+
+_SYSTEM_ROLES = ("system", "developer")
+
+
+class SemanticQuery:
+    """The question of an eligible request and the scope it is cached in."""
+
+    __slots__ = ("scope", "text", "model", "vector")
+
+    def __init__(self, scope: str, text: str, model: str) -> None:
+        self.scope = scope
+        self.text = text
+        self.model = model
+        self.vector: Optional[List[float]] = None
+
+
+class SemanticCache:
+    """Near-duplicate cache for chat completions, searched in Qdrant.
+
+    The user question is embedded and compared with the questions already
+    answered in the same scope (user, model, system prompt, tools, response
+    format and output limits such as `max_tokens` or `stop`). The stored completion is returned when the cosine
+    similarity reaches the threshold of the model.
+
+    Only single-question conversations are eligible: earlier turns change
+    what the same question means. Entries expire after `ttl`; expired points
+    are ignored by searches and purged from the collection periodically.
+    """
+
+    def __init__(
+        self,
+        *,
+        qdrant_client,
+        embeddings,
+        collection: str = SEMANTIC_CACHE_COLLECTION,
+        embedding_model: str = "text-embedding-3-small",
+        threshold: float = 0.95,
+        model_thresholds: Optional[Dict[str, float]] = None,
+        ttl: float = 24 * 3600.0,
+        max_entry_bytes: int = 256 * 1024,
+    ) -> None:
+        self.qdrant_client = qdrant_client
+        self.embeddings = embeddings
+        self.collection = collection
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.model_thresholds = model_thresholds or {}
+        self.ttl = float(ttl)
+        self.max_entry_bytes = max_entry_bytes
+
+        self._collection_ready = False
+        self._collection_lock = asyncio.Lock()
+        self._last_purge = 0.0
+        self._background: set[asyncio.Task] = set()
+
+        self._lookups = 0
+        self._hits = 0
+        self._stores = 0
+        self._errors = 0
+
+    @classmethod
+    def from_settings(cls, qdrant_client, embeddings) -> Optional["SemanticCache"]:
+        settings = get_settings()
+        if not settings.semantic_cache_enabled:
+            return None
+        return cls(
+            qdrant_client=qdrant_client,
+            embeddings=embeddings,
+            embedding_model=settings.semantic_cache_embedding_model,
+            threshold=settings.semantic_cache_threshold,
+            model_thresholds=_parse_thresholds(
+                settings.semantic_cache_model_thresholds
+            ),
+            ttl=settings.semantic_cache_ttl,
+        )
+
+    # ------------------------------ Eligibility -------------------------------
+    @staticmethod
+    def query(
+        user_id: Any, payload: LazyJSONObject | Mapping[str, Any]
+    ) -> Optional[SemanticQuery]:
+        """The cache query for a chat request, or None when not eligible."""
+        messages = payload.get("messages")
+        model = payload.get("model")
+        n = payload.get("n")
+        if not isinstance(messages, list) or not messages or (n is not None and n != 1):
+            return None
+        *context, last = messages
+        if not isinstance(last, dict) or last.get("role") != "user":
+            return None
+        if not all(
+            isinstance(m, dict) and m.get("role") in _SYSTEM_ROLES for m in context
+        ):
+            return None
+        text = _text_content(last.get("content"))
+        if not text:
+            return None
+        scope = {
+            "user_id": str(user_id),
+            "model": model,
+            "system": [_text_content(m.get("content")) for m in context],
+            **{field: payload.get(field) for field in _SCOPE_FIELDS},
+        }
+        digest = hashlib.sha256(
+            json.dumps(scope, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        return SemanticQuery(digest, text, model)
+
+    def threshold_for(self, model: str) -> float:
+        return self.model_thresholds.get(model, self.threshold)
+
+    # --------------------------------- Access ---------------------------------
+    async def get(self, query: SemanticQuery) -> Optional[Dict[str, Any]]:
+        """Cached entry for a near-identical question, in ResponseCache format."""
+        self._lookups += 1
+        try:
+            query.vector = await self._embed(query.text)
+            await self._ensure_collection(len(query.vector))
+            result = await self.qdrant_client.query_points(
+                collection_name=self.collection,
+                query=query.vector,
+                query_filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="scope", match=models.MatchValue(value=query.scope)
+                        ),
+                        models.FieldCondition(
+                            key="expires_at", range=models.Range(gt=time.time())
+                        ),
+                    ]
+                ),
+                score_threshold=self.threshold_for(query.model),
+                limit=1,
+                with_payload=True,
+            )
+        except Exception as e:
+            self._errors += 1
+            logger.error(f"Semantic cache lookup failed: {e}")
+            return None
+        if not result.points:
+            return None
+        self._hits += 1
+        payload = result.points[0].payload or {}
+        return {
+            "content": payload["content"].encode("utf-8"),
+            "media_type": payload.get("media_type"),
+            "provider_response_id": payload.get("provider_response_id"),
+            "finish_reason": payload.get("finish_reason"),
+            "similarity": result.points[0].score,
+        }
+
+    def set(
+        self,
+        query: SemanticQuery,
+        content: bytes,
+        media_type: Optional[str],
+        *,
+        provider_response_id: Optional[str] = None,
+        finish_reason: Optional[str] = None,
+    ) -> None:
+        """Store a completion for the question `get` was called with."""
+        if query.vector is None or len(content) > self.max_entry_bytes:
+            return
+        try:
+            text = content.decode("utf-8")
+        except UnicodeDecodeError:
+            return
+        point = models.PointStruct(
+            id=str(uuid.uuid4()),
+            vector=query.vector,
+            payload={
+                "scope": query.scope,
+                "model": query.model,
+                "question": query.text,
+                "content": text,
+                "media_type": media_type,
+                "provider_response_id": provider_response_id,
+                "finish_reason": finish_reason,
+                "expires_at": time.time() + self.ttl,
+            },
+        )
+        self._spawn(self._store(point))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "lookups": self._lookups,
+            "hits": self._hits,
+            "hit_rate": self._hits / self._lookups if self._lookups else None,
+            "stores": self._stores,
+            "errors": self._errors,
+        }
+
+    # ------------------------------ Internals ---------------------------------
+    async def _embed(self, text: str) -> List[float]:
+        result = await self.embeddings.generate_embeddings(
+            self.embedding_model, [text], mode="realtime"
+        )
+        return result["data"][0]["embedding"]
+
+    async def _ensure_collection(self, vector_size: int) -> None:
+        """Create the collection on first use, sized for the embedding model."""
+        if self._collection_ready:
+            return
+        async with self._collection_lock:
+            if self._collection_ready:
+                return
+            if not await self.qdrant_client.collection_exists(self.collection):
+                await self.qdrant_client.create_collection(
+                    collection_name=self.collection,
+                    vectors_config=models.VectorParams(
+                        size=vector_size, distance=models.Distance.COSINE
+                    ),
+                )
+                await self.qdrant_client.create_payload_index(
+                    self.collection, "scope", models.PayloadSchemaType.KEYWORD
+                )
+                await self.qdrant_client.create_payload_index(
+                    self.collection, "expires_at", models.PayloadSchemaType.FLOAT
+                )
+            self._collection_ready = True
+
+    async def _store(self, point: models.PointStruct) -> None:
+        try:
+            await self.qdrant_client.upsert(
+                collection_name=self.collection, points=[point]
+            )
+            self._stores += 1
+            await self._purge_expired()
+        except Exception as e:
+            self._errors += 1
+            logger.error(f"Semantic cache write failed: {e}")
+
+    async def _purge_expired(self) -> None:
+        now = time.time()
+        if now - self._last_purge < min(self.ttl, 60.0):
+            return
+        self._last_purge = now
+        await self.qdrant_client.delete(
+            collection_name=self.collection,
+            points_selector=models.FilterSelector(
+                filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="expires_at", range=models.Range(lte=now)
+                        )
+                    ]
+                )
+            ),
+        )
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+
+def _text_content(content: Any) -> Optional[str]:
+    """Text of a message; None when it holds anything but text parts."""
+    if isinstance(content, str):
+        return content
+    if not isinstance(content, list):
+        return None
+    texts = []
+    for part in content:
+        if not isinstance(part, dict) or part.get("type") != "text":
+            return None
+        texts.append(part.get("text") or "")
+    return "\n".join(texts)
+
+
+def _parse_thresholds(raw: Optional[str]) -> Dict[str, float]:
+    if not raw:
+        return {}
+    try:
+        thresholds = json.loads(raw)
+        return {str(model): float(value) for model, value in thresholds.items()}
+    except (ValueError, TypeError, AttributeError):
+        logger.error("SEMANTIC_CACHE_MODEL_THRESHOLDS is not a JSON object; ignoring")
+        return {}
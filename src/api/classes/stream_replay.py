@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+from api.config import get_settings
+from api.utils import CustomLogger, SSEEventSplitter
+
+logger = CustomLogger.get_logger(__name__)
+
+
+class ReplayGapError(LookupError):
+    """Events after `Last-Event-ID` were already dropped from the buffer."""
+
+
+def _error_event(message: str) -> bytes:
+    """An OpenAI-style streamed error, so clients do not take it for an end."""
+    error = {"error": {"message": message, "type": "stream_replay_gap"}}
+    return b"data: " + json.dumps(error).encode() + b"\n\n"
+
+
+class StreamJob:
+    """Numbered SSE events of one streamed generation, in a ring buffer.
+
+    Events get increasing ids from 0; the oldest are dropped once the buffer
+    holds more than `max_bytes`. Readers follow the buffer from any id still
+    in it and wait for new events until the generation is done.
+    """
+
+    def __init__(self, job_id: str, user_id: Any, max_bytes: int) -> None:
+        self.job_id = job_id
+        self.user_id = str(user_id)
+        self.max_bytes = max_bytes
+        self.done = False
+        self.readers = 0
+        self.pump: Optional[asyncio.Task] = None
+        self._events: Deque[Tuple[int, bytes]] = deque()
+        self._size = 0
+        self._next_id = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def append(self, event: bytes) -> int:
+        """Buffer `event`; returns how much the buffer grew (or shrank)."""
+        before = self._size
+        framed = b"id: %d\n%s" % (self._next_id, event)
+        self._events.append((self._next_id, framed))
+        self._next_id += 1
+        self._size += len(framed)
+        while self._size > self.max_bytes and len(self._events) > 1:
+            self._size -= len(self._events.popleft()[1])
+        self._notify()
+        return self._size - before
+
+    def finish(self) -> None:
+        self.done = True
+        self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _first_id(self) -> int:
+        return self._events[0][0] if self._events else self._next_id
+
+    def can_replay(self, last_event_id: int) -> bool:
+        return last_event_id + 1 >= self._first_id()
+
+    async def follow(self, last_event_id: int = -1) -> AsyncIterator[bytes]:
+        """Events after `last_event_id`, then the live ones until done."""
+        next_id = last_event_id + 1
+        while True:
+            first_id = self._first_id()
+            if next_id < first_id:
+                raise ReplayGapError(f"Events {next_id} to {first_id - 1} were dropped")
+            # Copied first: the buffer may move while the events are sent
+            pending = list(islice(self._events, next_id - first_id, None))
+            for event_id, framed in pending:
+                yield framed
+                next_id = event_id + 1
+            if self.done and next_id >= self._next_id:
+                return
+            if not pending:
+                await self._changed.wait()
+
+
+class StreamReplay:
+    """Keep streamed generations replayable after a client drops.
+
+    A stream started with `start` is read from the upstream by a background
+    task, so the generation is not lost with the client connection. Its SSE
+    events are numbered (`id:`) and kept in a `StreamJob` ring buffer of
+    `max_job_bytes`; a client reconnecting with `Last-Event-ID` gets the
+    events it missed, then the live ones. A finished job stays replayable
+    for `ttl` seconds; at most `max_jobs` jobs and `max_total_bytes` of
+    buffered events are kept, oldest jobs dropped first.
+
+    A generation nobody reads is not paid for long: once its last reader
+    left, it is cancelled unless a client resumes it within `abandon_after`
+    seconds.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl: float = 300.0,
+        max_job_bytes: int = 1024 * 1024,
+        max_jobs: int = 10_000,
+        max_total_bytes: int = 64 * 1024 * 1024,
+        abandon_after: float = 30.0,
+    ) -> None:
+        self.ttl = ttl
+        self.abandon_after = abandon_after
+        self.max_job_bytes = max_job_bytes
+        self.max_jobs = max(1, max_jobs)
+        self.max_total_bytes = max_total_bytes
+        self._jobs: "OrderedDict[str, StreamJob]" = OrderedDict()
+        self._bytes = 0
+        self._pumps: set[asyncio.Task] = set()
+
+        self._started = 0
+        self._resumed = 0
+        self._gaps = 0
+        self._abandoned = 0
+
+    @classmethod
+    def from_settings(cls) -> Optional["StreamReplay"]:
+        settings = get_settings()
+        if not settings.stream_replay_enabled:
+            return None
+        return cls(
+            ttl=settings.stream_replay_ttl,
+            max_job_bytes=settings.stream_replay_max_job_bytes,
+            max_jobs=settings.stream_replay_max_jobs,
+            max_total_bytes=settings.stream_replay_max_total_bytes,
+            abandon_after=settings.stream_replay_abandon_after,
+        )
+
+    def start(
+        self, job_id: str, user_id: Any, source: AsyncIterator[bytes]
+    ) -> StreamJob:
+        """Pump `source` into a new job in the background and return it."""
+        job = StreamJob(job_id, user_id, self.max_job_bytes)
+        while len(self._jobs) >= self.max_jobs:
+            self._drop(next(iter(self._jobs.values())))
+        self._jobs[job_id] = job
+        self._started += 1
+        task = job.pump = asyncio.create_task(self._pump(job, source))
+        self._pumps.add(task)
+        task.add_done_callback(self._pumps.discard)
+        return job
+
+    def get(self, job_id: str, user_id: Any) -> Optional[StreamJob]:
+        """The job, or None when unknown, expired or owned by someone else."""
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != str(user_id):
+            return None
+        return job
+
+    async def follow(
+        self, job: StreamJob, last_event_id: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """Events of `job` for a client; `last_event_id` is set on a resume."""
+        if last_event_id is None:
+            last_event_id = -1
+        else:
+            self._resumed += 1
+        job.readers += 1
+        try:
+            async for event in job.follow(last_event_id):
+                yield event
+        except ReplayGapError as e:
+            # The client fell behind the buffer; a reconnect gets a 410
+            self._gaps += 1
+            logger.warning(f"Stream {job.job_id} reader cut off: {e}")
+            yield _error_event(f"Stream fell behind the replay buffer: {e}")
+        finally:
+            job.readers -= 1
+            if job.readers == 0 and not job.done:
+                asyncio.get_running_loop().call_later(
+                    self.abandon_after, self._abandon, job
+                )
+
+    async def aclose(self) -> None:
+        for task in list(self._pumps):
+            task.cancel()
+        if self._pumps:
+            await asyncio.gather(*self._pumps, return_exceptions=True)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "jobs": len(self._jobs),
+            "bytes": self._bytes,
+            "running": len(self._pumps),
+            "started": self._started,
+            "resumed": self._resumed,
+            "gaps": self._gaps,
+            "abandoned": self._abandoned,
+        }
+
+    async def _pump(self, job: StreamJob, source: AsyncIterator[bytes]) -> None:
+        splitter = SSEEventSplitter()
+        try:
+            async for chunk in source:
+                for event in splitter.feed(chunk):
+                    self._append(job, event)
+            tail = splitter.close()
+            if tail.strip():
+                self._append(job, tail + b"\n\n")
+        except Exception as e:
+            logger.warning(f"Stream {job.job_id} ended early: {e}")
+        finally:
+            job.finish()
+            asyncio.get_running_loop().call_later(self.ttl, self._expire, job)
+
+    def _abandon(self, job: StreamJob) -> None:
+        if job.readers == 0 and not job.done and job.pump is not None:
+            self._abandoned += 1
+            job.pump.cancel()
+
+    def _append(self, job: StreamJob, event: bytes) -> None:
+        grown = job.append(event)
+        if self._jobs.get(job.job_id) is not job:
+            return
+        self._bytes += grown
+        # Readers attached to a dropped job keep it alive; it just cannot be
+        # resumed anymore
+        while self._bytes > self.max_total_bytes and self._jobs:
+            self._drop(next(iter(self._jobs.values())))
+
+    def _drop(self, job: StreamJob) -> None:
+        if self._jobs.get(job.job_id) is job:
+            del self._jobs[job.job_id]
+            self._bytes -= job.size
+
+    def _expire(self, job: StreamJob) -> None:
+        self._drop(job)
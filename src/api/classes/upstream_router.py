@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import fnmatch
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+
+from api.config import get_settings
+from api.utils import CustomLogger
+
+from .http_client import build_http_limits, build_openrouter_client, http2_enabled
+from .resilience import CircuitBreaker
+
+logger = CustomLogger.get_logger(__name__)
+
+
+class Upstream:
+    """One OpenAI-compatible upstream and its health statistics.
+
+    `latency_ms` is an EWMA of the time to response headers and `error_rate`
+    an EWMA of failures (connect errors and 5xx), both updated by `record`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        client: httpx.AsyncClient,
+        *,
+        weight: float = 1.0,
+        models: Optional[Sequence[str]] = None,
+        owns_client: bool = True,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        self.name = name
+        self.client = client
+        self.weight = max(float(weight), 1e-6)
+        self.models = list(models) if models else None
+        self.owns_client = owns_client
+        self.breaker = breaker or CircuitBreaker()
+
+        self.latency_ms: Optional[float] = None
+        self.error_rate = 0.0
+        self.last_failure = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def serves(self, model: Optional[str]) -> bool:
+        if self.models is None or model is None:
+            return True
+        return any(fnmatch.fnmatchcase(model, pattern) for pattern in self.models)
+
+    def record(self, latency_ms: float, ok: bool, alpha: float) -> None:
+        self.requests += 1
+        self.error_rate += alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if not ok:
+            # A refused connection is fast; it says nothing about latency
+            self.failures += 1
+            self.last_failure = time.monotonic()
+        elif self.latency_ms is None:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms += alpha * (latency_ms - self.latency_ms)
+
+    def score(self) -> float:
+        """Expected latency per unit of weight, inflated by the error rate."""
+        if self.latency_ms is None:
+            return float("inf")
+        return self.latency_ms / self.weight / max(1.0 - self.error_rate, 0.05)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "weight": self.weight,
+            "models": self.models,
+            "latency_ms": self.latency_ms,
+            "error_rate": self.error_rate,
+            "requests": self.requests,
+            "failures": self.failures,
+            "circuit": self.breaker.metrics(),
+        }
+
+
+class UpstreamRouter:
+    """Order upstreams for a request by health, latency and weight.
+
+    Healthy upstreams come first (an upstream that was never tried comes
+    first of all so it gets measured), in a weighted random order: each one
+    leads in proportion to `1 / Upstream.score`, i.e. to its weight over its
+    latency, so load is spread instead of piling on the single best one. An
+    upstream whose error rate is above `max_error_rate` is only tried after
+    the healthy ones, by score, until `cooldown` seconds have passed since
+    its last failure.
+    """
+
+    def __init__(
+        self,
+        upstreams: Sequence[Upstream],
+        *,
+        alpha: float = 0.2,
+        max_error_rate: float = 0.5,
+        cooldown: float = 30.0,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.upstreams = list(upstreams)
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self._rng = rng or random.Random()
+
+    @classmethod
+    def from_settings(
+        cls, openrouter_client: Optional[httpx.AsyncClient]
+    ) -> "UpstreamRouter":
+        settings = get_settings()
+        upstreams: List[Upstream] = []
+        if openrouter_client is not None:
+            upstreams.append(
+                Upstream(
+                    "openrouter",
+                    openrouter_client,
+                    weight=settings.openrouter_weight,
+                    breaker=_breaker(),
+                )
+            )
+        for spec in _parse_upstreams(settings.upstreams):
+            upstreams.append(
+                Upstream(
+                    spec["name"],
+                    httpx.AsyncClient(
+                        base_url=spec["base_url"],
+                        headers=_upstream_headers(spec),
+                        timeout=httpx.Timeout(60.0, read=None),
+                        limits=build_http_limits(),
+                        http2=http2_enabled(),
+                    ),
+                    weight=spec.get("weight", 1.0),
+                    models=spec.get("models"),
+                    breaker=_breaker(),
+                )
+            )
+        return cls(
+            upstreams,
+            alpha=settings.upstream_ewma_alpha,
+            max_error_rate=settings.upstream_max_error_rate,
+            cooldown=settings.upstream_failure_cooldown,
+        )
+
+    def candidates(self, model: Optional[str] = None) -> List[Upstream]:
+        now = time.monotonic()
+
+        def rank(upstream: Upstream):
+            degraded = (
+                upstream.error_rate > self.max_error_rate
+                and now - upstream.last_failure < self.cooldown
+            )
+            if degraded or upstream.requests == 0:
+                return (degraded, upstream.requests > 0, upstream.score())
+            # Weighted sampling without replacement: the smallest of these
+            # exponential draws leads with probability ∝ 1 / score
+            return (False, True, self._rng.expovariate(1.0) * upstream.score())
+
+        return sorted(
+            (u for u in self.upstreams if u.serves(model)),
+            key=rank,
+        )
+
+    def record(self, upstream: Upstream, latency_ms: float, ok: bool) -> None:
+        upstream.record(latency_ms, ok, self.alpha)
+
+    async def aclose(self) -> None:
+        for upstream in self.upstreams:
+            if upstream.owns_client:
+                await upstream.client.aclose()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {u.name: u.metrics() for u in self.upstreams}
+
+
+def _breaker() -> CircuitBreaker:
+    settings = get_settings()
+    return CircuitBreaker(
+        failure_threshold=settings.circuit_failure_threshold,
+        reset_timeout=settings.circuit_reset_timeout,
+    )
+
+
+def _parse_upstreams(raw: Optional[str]) -> List[Dict[str, Any]]:
+    if not raw:
+        return []
+    try:
+        specs = json.loads(raw)
+    except ValueError:
+        logger.error("UPSTREAMS is not valid JSON; ignoring extra upstreams")
+        return []
+    valid = []
+    for spec in specs if isinstance(specs, list) else []:
+        if isinstance(spec, dict) and spec.get("name") and spec.get("base_url"):
+            valid.append(spec)
+        else:
+            logger.error(f"Ignoring invalid upstream definition: {spec!r}")
+    return valid
+
+
+def _upstream_headers(spec: Dict[str, Any]) -> Dict[str, str]:
+    headers = {"Content-Type": "application/json"}
+    if spec.get("api_key"):
+        headers["Authorization"] = f"Bearer {spec['api_key']}"
+    return headers
+
+
+def build_default_router() -> UpstreamRouter:
+    return UpstreamRouter.from_settings(
+        build_openrouter_client(httpx.Timeout(60.0, read=None))
+    )
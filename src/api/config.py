@@ -21,6 +21,13 @@ class Settings(BaseSettings):
     mongodb_password: str = "example"
     mongodb_database: str = "api-database"
 
+    # Écriture différée des logs llm_requests
+    llm_log_batch_size: int = 200
+    llm_log_flush_interval: float = 0.5
+    llm_log_max_queue: int = 10000
+    llm_log_overflow_policy: str = "drop"  # "drop" ou "block"
+    llm_log_max_retries: int = 3  # nouvelles tentatives d'un lot en échec
+
     qdrant_api_key: str | None = None
     qdrant_url: str | None = None
 
@@ -29,8 +36,151 @@ class Settings(BaseSettings):
     openrouter_site_url: str | None = None
     openrouter_app_name: str | None = None
 
+    # Pool de connexions partagé par les clients HTTP amont (OpenRouter, OpenAI)
+    upstream_max_connections: int = 100
+    upstream_max_keepalive_connections: int = 20
+    upstream_keepalive_expiry: float = 30.0
+    upstream_http2: bool = False
+
+    # Routage multi-amont : liste JSON d'upstreams compatibles OpenAI en plus
+    # d'OpenRouter, ex. [{"name": "vllm", "base_url": "http://vllm:8000/v1",
+    # "api_key": "...", "weight": 2, "models": ["meta-llama/*"]}]
+    upstreams: str | None = None
+    openrouter_weight: float = 1.0
+    upstream_ewma_alpha: float = 0.2
+    upstream_max_error_rate: float = 0.5
+    upstream_failure_cooldown: float = 30.0
+
+    # Réessais (erreurs de connexion, 429, 5xx) avec backoff exponentiel
+    # et jitter, et disjoncteur par upstream
+    retry_max_attempts: int = 3
+    retry_base_delay: float = 0.25
+    retry_max_delay: float = 8.0
+    circuit_failure_threshold: int = 5
+    circuit_reset_timeout: float = 30.0
+
+    # Hedging des requêtes non-stream : une requête dupliquée part lorsque la
+    # première dépasse un délai fixe ou le percentile de latence du modèle
+    hedge_enabled: bool = False
+    hedge_delay_ms: float | None = None
+    hedge_percentile: float = 0.95
+    hedge_min_samples: int = 20
+    hedge_budget_per_minute: int = 10
+
+    # Contrôle d'admission : appels amont simultanés (global et par utilisateur)
+    # avec une file d'attente bornée, puis 429 + Retry-After
+    admission_enabled: bool = True
+    admission_max_concurrent: int = 256
+    admission_max_per_user: int = 32
+    admission_max_queue: int = 512
+    admission_queue_timeout: float = 10.0
+
+    # Limitation de débit (token buckets) par clé API, utilisateur et modèle :
+    # requêtes/min et tokens estimés/min, 0 pour désactiver une limite.
+    # rate_limit_shared partage des compteurs atomiques via MongoDB entre workers
+    rate_limit_enabled: bool = False
+    rate_limit_shared: bool = False
+    rate_limit_key_requests_per_minute: int = 120
+    rate_limit_key_tokens_per_minute: int = 200_000
+    rate_limit_user_requests_per_minute: int = 300
+    rate_limit_user_tokens_per_minute: int = 500_000
+    rate_limit_model_requests_per_minute: int = 120
+    rate_limit_model_tokens_per_minute: int = 200_000
+
+    # Estimation locale des tokens : une requête qui ne tient pas dans le
+    # contexte du modèle est rejetée (400) avant l'appel amont.
+    # context_check_tiktoken_models : motifs de modèles comptés avec tiktoken,
+    # séparés par des virgules, ex. "openai/*"
+    context_check_enabled: bool = True
+    context_check_margin: float = 0.2
+    context_check_cache_ttl: float = 3600.0
+    context_check_tiktoken_models: str = ""
+
     openai_api_key: str | None = None
 
+    # Cache des réponses déterministes (temperature 0 ou X-Cache: allow)
+    response_cache_enabled: bool = False
+    response_cache_ttl: float = 3600.0
+    response_cache_max_bytes: int = 64 * 1024 * 1024
+    response_cache_max_entry_bytes: int = 1024 * 1024
+    response_cache_persistent: bool = False
+
+    # Cache des embeddings par (modèle, dimensions, sha256 du texte) : seuls
+    # les textes absents partent en amont ; vecteurs stockés en float32
+    embedding_cache_enabled: bool = True
+    embedding_cache_max_bytes: int = 128 * 1024 * 1024
+    embedding_cache_persistent: bool = False
+    embedding_cache_ttl: float = 30 * 24 * 3600.0
+
+    # Regroupement des appels d'embeddings temps réel simultanés (même modèle)
+    # en une requête amont : attente max de max_delay_ms ou max_items entrées
+    embedding_micro_batch_enabled: bool = True
+    embedding_micro_batch_max_items: int = 256
+    embedding_micro_batch_max_delay_ms: float = 5.0
+
+    # Découpage des gros appels d'embeddings temps réel en morceaux (nombre
+    # d'entrées et tokens estimés) lancés en parallèle avec reprises ; le mode
+    # "auto" n'utilise alors plus la Batch API
+    embedding_chunk_enabled: bool = True
+    embedding_chunk_max_items: int = 512
+    embedding_chunk_max_tokens: int = 250_000
+    embedding_chunk_concurrency: int = 4
+
+    # Jobs d'embeddings via la Batch API du fournisseur : réponse immédiate,
+    # suivi en tâche de fond (repris au redémarrage depuis MongoDB)
+    embedding_jobs_enabled: bool = True
+    embedding_jobs_poll_interval: float = 30.0
+
+    # Cache sémantique (Qdrant) des questions quasi identiques sur
+    # /v1/chat/completions ; seuils par modèle en JSON, ex. {"gpt-4o": 0.97}
+    semantic_cache_enabled: bool = False
+    semantic_cache_embedding_model: str = "text-embedding-3-small"
+    semantic_cache_threshold: float = 0.95
+    semantic_cache_model_thresholds: str | None = None
+    semantic_cache_ttl: float = 24 * 3600.0
+
+    # Idempotency-Key sur /v1/chat/completions et /v1/responses : une requête
+    # rejouée reçoit le résultat stocké ou rejoint l'appel en cours
+    idempotency_enabled: bool = True
+    idempotency_ttl: float = 24 * 3600.0
+    idempotency_max_entry_bytes: int = 1024 * 1024
+
+    # Historique des conversations /v1/responses (previous_response_id) :
+    # LRU en mémoire (borné en nombre et en octets) devant une collection
+    # MongoDB
+    conversation_store_enabled: bool = True
+    conversation_store_hot_entries: int = 10_000
+    conversation_store_hot_bytes: int = 64 * 1024 * 1024
+    conversation_store_ttl: float = 30 * 24 * 3600.0
+
+    # Flux SSE rejouables (demandés avec X-Stream-Resumable: true) : les
+    # événements de chaque job sont numérotés et gardés dans un tampon
+    # circulaire (plafonné par job et au total), relu via
+    # /v1/streams/{job_id} ; une génération sans lecteur depuis abandon_after
+    # secondes est annulée
+    stream_replay_enabled: bool = True
+    stream_replay_ttl: float = 300.0
+    stream_replay_max_job_bytes: int = 1024 * 1024
+    stream_replay_max_jobs: int = 10_000
+    stream_replay_max_total_bytes: int = 64 * 1024 * 1024
+    stream_replay_abandon_after: float = 30.0
+
+    # Regroupement des petits événements SSE en écritures d'au plus N octets
+    # ou M millisecondes ; le premier événement part toujours immédiatement
+    sse_coalesce_enabled: bool = True
+    sse_coalesce_max_bytes: int = 4096
+    sse_coalesce_max_delay_ms: float = 25.0
+
+    # /v1/files et /v1/batches : fichiers JSONL (GridFS) exécutés en tâche de
+    # fond, avec un plafond global et par modèle de requêtes simultanées
+    files_max_bytes: int = 200 * 1024 * 1024
+    batch_enabled: bool = True
+    batch_max_workers: int = 16
+    batch_max_per_model: int = 4
+    batch_retry_max_attempts: int = 3
+    batch_retry_base_delay: float = 2.0
+    batch_retry_max_delay: float = 60.0
+
 
 @lru_cache
 def get_settings() -> Settings:
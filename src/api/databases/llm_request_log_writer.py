@@ -0,0 +1,209 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+OVERFLOW_POLICIES = ("drop", "block")
+
+# A retried upsert racing the write that already went through
+DUPLICATE_KEY = 11000
+
+
+class LLMRequestLogWriter:
+    """Write-behind buffer for the `llm_requests` collection.
+
+    Inserts and updates are queued in memory and merged per `job_id`, so a
+    request whose insert and final update land in the same window costs a
+    single document write. A background task flushes the queue with
+    `bulk_write` when `batch_size` jobs are pending or every `flush_interval`
+    seconds, whichever comes first.
+
+    When `max_queue` jobs are pending, new jobs are either dropped
+    (`overflow_policy="drop"`) or wait for the next flush (`"block"`).
+
+    Jobs whose write failed are queued again for the next flush, up to
+    `max_retries` times, so a short Mongo outage loses nothing. Writes are
+    upserts keyed by `job_id`, so retrying a batch that reached the server
+    before the client saw an error does not write the job twice.
+    """
+
+    def __init__(
+        self,
+        collection,
+        logger,
+        *,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        max_queue: int = 10_000,
+        overflow_policy: str = "drop",
+        max_retries: int = 3,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy must be one of {OVERFLOW_POLICIES}")
+        self.collection = collection
+        self.logger = logger
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.01, float(flush_interval))
+        self.max_queue = max(self.batch_size, int(max_queue))
+        self.overflow_policy = overflow_policy
+        self.max_retries = max(0, int(max_retries))
+
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self._written = 0
+        self._dropped = 0
+        self._flushes = 0
+        self._flush_errors = 0
+        self._retried = 0
+        self._max_depth = 0
+        self._last_flush_ms: Optional[float] = None
+
+    # ------------------------------ Lifecycle ---------------------------------
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and flush whatever is still queued."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        # Failed jobs are queued again until their retries run out
+        while self._pending:
+            await self.flush()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    # ------------------------------- Queueing ---------------------------------
+    async def submit_insert(self, document: Dict[str, Any]) -> None:
+        job_id = document.get("job_id")
+        entry = await self._entry(job_id)
+        if entry is None:
+            return
+        entry["insert"] = document
+
+    async def submit_update(self, job_id: str, fields: Dict[str, Any]) -> None:
+        entry = await self._entry(job_id)
+        if entry is None:
+            return
+        entry["set"].update(fields)
+        entry["set"]["updated_at"] = datetime.now(timezone.utc)
+
+    async def _entry(self, job_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._pending.get(job_id)
+        if entry is not None:
+            return entry
+        while len(self._pending) >= self.max_queue:
+            self._wakeup.set()
+            if self.overflow_policy == "drop" or self._stopping:
+                self._dropped += 1
+                return None
+            self._space.clear()
+            await self._space.wait()
+            entry = self._pending.get(job_id)
+            if entry is not None:
+                return entry
+        entry = self._pending[job_id] = {"insert": None, "set": {}, "attempts": 0}
+        depth = len(self._pending)
+        self._max_depth = max(self._max_depth, depth)
+        if depth >= self.batch_size:
+            self._wakeup.set()
+        return entry
+
+    # ------------------------------- Flushing ---------------------------------
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            self._space.set()
+
+            jobs = list(pending.items())
+            start = time.perf_counter()
+            for i in range(0, len(jobs), self.batch_size):
+                batch = jobs[i : i + self.batch_size]
+                operations = [self._to_operation(job_id, e) for job_id, e in batch]
+                try:
+                    await self.collection.bulk_write(operations, ordered=False)
+                    self._written += len(batch)
+                except BulkWriteError as e:
+                    # Unordered: only the operations listed failed; a duplicate
+                    # key means the job is already written
+                    failed = {
+                        error["index"]
+                        for error in e.details["writeErrors"]
+                        if error.get("code") != DUPLICATE_KEY
+                    }
+                    self._flush_errors += 1
+                    self._written += len(batch) - len(failed)
+                    self.logger.error(f"llm_requests bulk write failed: {e}")
+                    self._requeue([batch[index] for index in sorted(failed)])
+                except Exception as e:
+                    self._flush_errors += 1
+                    self.logger.error(f"llm_requests bulk write failed: {e}")
+                    self._requeue(batch)
+            self._flushes += 1
+            self._last_flush_ms = (time.perf_counter() - start) * 1000
+
+    def _requeue(self, jobs) -> None:
+        for job_id, entry in jobs:
+            if entry["attempts"] >= self.max_retries:
+                self._dropped += 1
+                continue
+            self._retried += 1
+            newer = self._pending.get(job_id)
+            if newer is not None:
+                # Updates submitted since the failed write win over its fields
+                if newer["insert"] is None:
+                    newer["insert"] = entry["insert"]
+                newer["set"] = {**entry["set"], **newer["set"]}
+                newer["attempts"] = entry["attempts"] + 1
+            else:
+                self._pending[job_id] = {**entry, "attempts": entry["attempts"] + 1}
+
+    @staticmethod
+    def _to_operation(job_id: str, entry: Dict[str, Any]):
+        insert = entry["insert"]
+        fields = entry["set"]
+        if insert is None:
+            return UpdateOne({"job_id": job_id}, {"$set": fields})
+        update: Dict[str, Any] = {
+            "$setOnInsert": {k: v for k, v in insert.items() if k not in fields}
+        }
+        if fields:
+            update["$set"] = fields
+        return UpdateOne({"job_id": job_id}, update, upsert=True)
+
+    # ------------------------------- Metrics ----------------------------------
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": len(self._pending),
+            "max_queue_depth": self._max_depth,
+            "max_queue": self.max_queue,
+            "overflow_policy": self.overflow_policy,
+            "written": self._written,
+            "dropped": self._dropped,
+            "flushes": self._flushes,
+            "flush_errors": self._flush_errors,
+            "retried": self._retried,
+            "last_flush_ms": self._last_flush_ms,
+        }
@@ -5,6 +5,8 @@ from motor.motor_asyncio import AsyncIOMotorClient
 
 from api.config import get_settings
 
+from .llm_request_log_writer import LLMRequestLogWriter
+
 
 class MongoDBConnector:
     def __init__(self, logger):
@@ -25,6 +27,27 @@ class MongoDBConnector:
             password=self.password,
         )
 
+        # Écriture différée des logs llm_requests (démarrée dans le lifespan)
+        self.llm_log_writer: LLMRequestLogWriter | None = None
+
+    def start_log_writer(self):
+        settings = get_settings()
+        self.llm_log_writer = LLMRequestLogWriter(
+            self.get_database()["llm_requests"],
+            self.logger,
+            batch_size=settings.llm_log_batch_size,
+            flush_interval=settings.llm_log_flush_interval,
+            max_queue=settings.llm_log_max_queue,
+            overflow_policy=settings.llm_log_overflow_policy,
+            max_retries=settings.llm_log_max_retries,
+        )
+        self.llm_log_writer.start()
+
+    async def stop_log_writer(self):
+        if self.llm_log_writer is not None:
+            await self.llm_log_writer.stop()
+            self.llm_log_writer = None
+
     async def check_connection(self):
         try:
             # timeout = 5
@@ -85,9 +108,6 @@ class MongoDBConnector:
         return result.inserted_id
 
     async def log_llm_request(self, document: dict):
-        collection_name = "llm_requests"
-        collection = self.get_database()[collection_name]
-
         doc = document.copy()
         if "created_at" not in doc:
             doc["created_at"] = datetime.now(timezone.utc)
@@ -100,10 +120,18 @@ class MongoDBConnector:
                 # If it's not a valid ObjectId, keep the original value
                 doc["user_id"] = user_id
 
-        result = await collection.insert_one(doc)
+        if self.llm_log_writer is not None:
+            doc.setdefault("_id", ObjectId())
+            await self.llm_log_writer.submit_insert(doc)
+            return doc["_id"]
+
+        result = await self.get_database()["llm_requests"].insert_one(doc)
         return result.inserted_id
 
     async def update_llm_request(self, job_id: str, update: dict):
+        if self.llm_log_writer is not None:
+            await self.llm_log_writer.submit_update(job_id, update)
+            return None
         return await self.update_one("llm_requests", {"job_id": job_id}, update)
 
     async def insert_many(self, collection_name, documents):
@@ -4,23 +4,126 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
+from api.classes import (
+    AdmissionController,
+    BatchRunner,
+    ContextGuard,
+    ConversationStore,
+    EmbeddingBatcher,
+    EmbeddingCache,
+    EmbeddingChunker,
+    EmbeddingJobs,
+    Embeddings,
+    FileStore,
+    IdempotencyStore,
+    Models,
+    OpenRouterProxy,
+    RateLimiter,
+    ResponseCache,
+    SemanticCache,
+    SSECoalescer,
+    StreamReplay,
+)
 from api.config import get_settings
-from api.utils import CustomLogger, ensure_database_connection
+from api.utils import CustomLogger, InvalidJSONBodyError, ensure_database_connection
 from api.v1 import v1_router
+from api.v1.services import RateLimitHeadersMiddleware
 
 logger = CustomLogger().get_logger("main")
 
 
+async def _ensure_indexes(*components) -> None:
+    """Crée les index MongoDB des fonctionnalités activées (None sinon)."""
+    for component in components:
+        if component is not None:
+            await component.ensure_indexes()
+
+
+async def _aclose(*components) -> None:
+    """Arrête les tâches de fond des fonctionnalités activées (None sinon)."""
+    for component in components:
+        if component is not None:
+            await component.aclose()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Code de démarrage
     mongodb, qdrant = await ensure_database_connection()
     app.mongodb_client = mongodb
     app.qdrant_client = qdrant
+    mongodb.start_log_writer()
     logger.info("MongoDB and Qdrant clients initialized.")
 
+    # Clients amont partagés : les connexions sont réutilisées entre les requêtes
+    app.openrouter_proxy = OpenRouterProxy()
+    app.models_client = Models()
+    app.embeddings = Embeddings(
+        cache=EmbeddingCache.from_settings(mongodb),
+        batcher=EmbeddingBatcher.from_settings(),
+        chunker=EmbeddingChunker.from_settings(),
+    )
+    logger.info("Upstream HTTP clients initialized.")
+
+    app.response_cache = ResponseCache.from_settings(mongodb)
+    if app.response_cache is not None:
+        await app.response_cache.ensure_indexes()
+        logger.info("Response cache enabled.")
+
+    # Jobs d'embeddings par la Batch API, suivis en tâche de fond (None si
+    # désactivés) ; les jobs en cours sont repris depuis MongoDB
+    app.embedding_jobs = EmbeddingJobs.from_settings(app.embeddings, mongodb, qdrant)
+    if app.embedding_jobs is not None:
+        await app.embedding_jobs.ensure_indexes()
+        await app.embedding_jobs.start()
+
+    # Cache sémantique dans Qdrant (None si désactivé)
+    app.semantic_cache = SemanticCache.from_settings(
+        qdrant.get_client(), app.embeddings
+    )
+
+    # Rejet local des requêtes trop longues pour le modèle (None si désactivé)
+    app.context_guard = ContextGuard.from_settings(app.models_client)
+
+    # Limite des appels amont simultanés (None si désactivé)
+    app.admission_controller = AdmissionController.from_settings()
+
+    # Limitation de débit par clé API, utilisateur et modèle (None si désactivée)
+    app.rate_limiter = RateLimiter.from_settings(mongodb)
+
+    # Résultats des requêtes avec Idempotency-Key (None si désactivé)
+    app.idempotency_store = IdempotencyStore.from_settings(mongodb)
+
+    # Historique des conversations pour previous_response_id (None si désactivé)
+    app.conversation_store = ConversationStore.from_settings(mongodb)
+
+    # Tampons des flux SSE rejouables après une déconnexion (None si désactivé)
+    app.stream_replay = StreamReplay.from_settings()
+
+    # Regroupement des écritures SSE (None si désactivé)
+    app.sse_coalescer = SSECoalescer.from_settings()
+
+    # Fichiers JSONL (GridFS) et exécution locale des batches (None si désactivé)
+    app.file_store = FileStore.from_settings(mongodb)
+    app.batch_runner = BatchRunner.from_settings(
+        app.openrouter_proxy, app.file_store, mongodb
+    )
+
+    await _ensure_indexes(
+        app.embeddings.cache,
+        app.rate_limiter,
+        app.idempotency_store,
+        app.conversation_store,
+        app.batch_runner,
+    )
+
     yield
     # Code d'arrêt
+    await _aclose(app.batch_runner, app.stream_replay, app.embedding_jobs)
+    await app.openrouter_proxy.aclose()
+    await app.models_client.aclose()
+    await app.embeddings.aclose()
+    await app.mongodb_client.stop_log_writer()
     app.mongodb_client.get_client().close()
     await app.qdrant_client.get_client().close()
 
@@ -58,6 +161,10 @@ async def check_maintenance(request, call_next):
     return response
 
 
+# En-têtes X-RateLimit-* renseignés par la dépendance enforce_rate_limit
+app.add_middleware(RateLimitHeadersMiddleware)
+
+
 # Inclure les routes pour chaque version
 app.include_router(v1_router, prefix="/v1")
 
@@ -76,6 +183,12 @@ async def generic_exception_handler(request, exc):
     return JSONResponse(status_code=500, content={"message": "Internal server error"})
 
 
+@app.exception_handler(InvalidJSONBodyError)
+async def invalid_json_body_exception_handler(request, exc):
+    # Les corps volumineux sont décodés champ par champ, à la première lecture
+    return JSONResponse(status_code=400, content={"error": str(exc)})
+
+
 @app.exception_handler(404)
 async def not_found_exception_handler(request, exc):
     return JSONResponse(status_code=404, content={"message": "Not found"})
@@ -1,4 +1,19 @@
 from .ensure_database_connection import ensure_database_connection
+from .json_usage_scanner import JSONUsageScanner
+from .lazy_json import InvalidJSONBodyError, LazyJSONObject
 from .logger import CustomLogger
+from .sse_events import SSEEventSplitter
+from .sse_usage_parser import SSEUsageParser
+from .token_estimator import TokenEstimate, TokenEstimator
 
-__all__ = ["CustomLogger", "ensure_database_connection"]
+__all__ = [
+    "CustomLogger",
+    "InvalidJSONBodyError",
+    "JSONUsageScanner",
+    "LazyJSONObject",
+    "SSEEventSplitter",
+    "SSEUsageParser",
+    "TokenEstimate",
+    "TokenEstimator",
+    "ensure_database_connection",
+]
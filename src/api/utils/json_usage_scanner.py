@@ -0,0 +1,180 @@
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+_STRUCTURAL_RE = re.compile(rb'["{}\[\]:,]')
+_STRING_RE = re.compile(rb'["\\]')
+
+_QUOTE, _BACKSLASH = ord('"'), ord("\\")
+_COLON, _COMMA = ord(":"), ord(",")
+_OPEN_OBJECT, _OPEN_ARRAY = ord("{"), ord("[")
+_CLOSE = {ord("}"), ord("]")}
+
+MAX_CAPTURE_BYTES = 64 * 1024
+
+
+class JSONUsageScanner:
+    """Incremental scanner for a non-stream completion body.
+
+    `feed` is called with the body chunks as they are forwarded to the client.
+    It tracks the JSON nesting with a couple of regex jumps per structural
+    character (string contents are skipped in bulk) and only keeps the bytes
+    of the values it is looking for: the top-level `id` and `usage`, and
+    `choices[0].finish_reason`.
+    """
+
+    def __init__(self) -> None:
+        self.provider_response_id: Optional[str] = None
+        self.usage: Optional[Dict[str, Any]] = None
+        self.finish_reason: Optional[str] = None
+
+        self._stack: List[int] = []
+        self._expect_key = False
+        self._in_string = False
+        self._escape_pending = False
+        self._string_is_key = False
+        self._key_parts: List[bytes] = []
+        self._key_from = 0
+
+        self._key1: Optional[str] = None
+        self._key3: Optional[str] = None
+        self._choices_index = -1
+
+        self._capture: Optional[str] = None
+        self._capture_parts: List[bytes] = []
+        self._capture_size = 0
+        self._capture_from = 0
+        self._capture_depth = 0
+
+    def feed(self, chunk: bytes) -> None:
+        pos = 0
+        self._key_from = 0
+        self._capture_from = 0
+        if self._escape_pending:
+            self._escape_pending = False
+            pos = 1
+        # Each step returns where to resume, or -1 at the end of the chunk
+        while 0 <= pos < len(chunk):
+            if self._in_string:
+                pos = self._skip_string(chunk, pos)
+            else:
+                pos = self._next_token(chunk, pos)
+
+        if self._in_string and self._string_is_key:
+            self._key_parts.append(chunk[self._key_from :])
+        if self._capture is not None:
+            self._append_capture(chunk[self._capture_from :])
+
+    def close(self) -> None:
+        self._capture = None
+        self._capture_parts = []
+
+    # ------------------------------ Internals ---------------------------------
+    def _skip_string(self, chunk: bytes, pos: int) -> int:
+        m = _STRING_RE.search(chunk, pos)
+        if m is None:
+            return -1
+        i = m.start()
+        if chunk[i] == _BACKSLASH:
+            if i + 1 >= len(chunk):
+                self._escape_pending = True
+                return -1
+            return i + 2
+        self._in_string = False
+        if self._string_is_key:
+            self._key_parts.append(chunk[self._key_from : i])
+            self._on_key(b"".join(self._key_parts))
+        return i + 1
+
+    def _next_token(self, chunk: bytes, pos: int) -> int:
+        m = _STRUCTURAL_RE.search(chunk, pos)
+        if m is None:
+            return -1
+        i = m.start()
+        c = chunk[i]
+        if c == _QUOTE:
+            self._in_string = True
+            self._string_is_key = self._expect_key
+            if self._string_is_key:
+                self._expect_key = False
+                self._key_parts = []
+                self._key_from = i + 1
+        elif c == _COLON:
+            self._on_colon(i + 1)
+        elif c == _COMMA or c in _CLOSE:
+            self._on_value_end(chunk, i, c)
+        else:
+            if c == _OPEN_ARRAY and len(self._stack) == 1 and self._key1 == "choices":
+                self._choices_index = 0
+            self._stack.append(c)
+            self._expect_key = c == _OPEN_OBJECT
+        return i + 1
+
+    def _on_value_end(self, chunk: bytes, i: int, c: int) -> None:
+        depth = len(self._stack)
+        if self._capture is not None and depth == self._capture_depth:
+            self._end_capture(chunk, i)
+        if c == _COMMA:
+            if depth == 2 and self._choices_index >= 0:
+                self._choices_index += 1
+            self._expect_key = bool(self._stack) and (self._stack[-1] == _OPEN_OBJECT)
+            return
+        if self._stack:
+            self._stack.pop()
+        if len(self._stack) == 1:
+            self._choices_index = -1
+        self._expect_key = False
+
+    def _on_key(self, raw_key: bytes) -> None:
+        try:
+            key = raw_key.decode("utf-8")
+        except UnicodeDecodeError:
+            return
+        depth = len(self._stack)
+        if depth == 1:
+            self._key1 = key
+        elif depth == 3 and self._choices_index == 0:
+            self._key3 = key
+
+    def _on_colon(self, value_start: int) -> None:
+        depth = len(self._stack)
+        target = None
+        if depth == 1 and self._key1 in ("id", "usage"):
+            target = self._key1
+        elif (
+            depth == 3 and self._choices_index == 0 and self._key3 == ("finish_reason")
+        ):
+            target = "finish_reason"
+        if target is not None:
+            self._capture = target
+            self._capture_parts = []
+            self._capture_size = 0
+            self._capture_from = value_start
+            self._capture_depth = depth
+
+    def _append_capture(self, part: bytes) -> None:
+        self._capture_size += len(part)
+        if self._capture_size > MAX_CAPTURE_BYTES:
+            self._capture = None
+            self._capture_parts = []
+            return
+        self._capture_parts.append(part)
+
+    def _end_capture(self, chunk: bytes, end: int) -> None:
+        target = self._capture
+        self._append_capture(chunk[self._capture_from : end])
+        if self._capture is None:
+            return
+        raw = b"".join(self._capture_parts)
+        self._capture = None
+        self._capture_parts = []
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        if target == "id" and isinstance(value, str):
+            self.provider_response_id = self.provider_response_id or value
+        elif target == "usage" and isinstance(value, dict):
+            self.usage = value
+        elif target == "finish_reason" and isinstance(value, str):
+            self.finish_reason = value
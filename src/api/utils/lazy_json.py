@@ -0,0 +1,245 @@
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+_STRUCTURAL_RE = re.compile(rb'["{}\[\]:,]')
+
+_QUOTE, _COLON, _COMMA = ord('"'), ord(":"), ord(",")
+_OPEN = {ord("{"), ord("[")}
+_CLOSE = {ord("}"), ord("]")}
+_OPEN_OBJECT, _OPEN_ARRAY = ord("{"), ord("[")
+_CLOSE_OBJECT = ord("}")
+
+_BACKSLASH = ord("\\")
+
+_MISSING = object()
+
+EAGER_DECODE_BYTES = 32 * 1024
+
+# (member_start, value_start, value_end, items when the value is an array)
+_Member = Tuple[int, int, int, Optional[int]]
+
+
+class InvalidJSONBodyError(ValueError):
+    """The request body, or one of its members, is not valid JSON."""
+
+
+class LazyJSONObject:
+    """Read-only view over the raw bytes of a JSON object.
+
+    Construction only indexes the top-level members (key, value span and item
+    count for arrays); a value is decoded the first time it is read with
+    `get`, which raises `InvalidJSONBodyError` when it is malformed. The raw
+    bytes are kept as-is so they can be forwarded upstream without
+    re-serialization, and `with_fields` splices edits at the top level
+    without touching the other members.
+
+    Bodies of at most `EAGER_DECODE_BYTES` are decoded with `json.loads`
+    right away, which is cheaper than indexing them in Python.
+    """
+
+    __slots__ = ("raw", "_members", "_decoded")
+
+    def __init__(self, raw: bytes) -> None:
+        self.raw = raw
+        self._members: Optional[Dict[str, _Member]]
+        if len(raw) <= EAGER_DECODE_BYTES:
+            try:
+                decoded = json.loads(raw)
+            except ValueError as e:
+                raise InvalidJSONBodyError("Invalid JSON body") from e
+            if not isinstance(decoded, dict):
+                raise InvalidJSONBodyError("Request body must be a JSON object")
+            self._members = None
+            self._decoded: Dict[str, Any] = decoded
+        else:
+            self._members = _index_members(raw)
+            self._decoded = {}
+
+    def __contains__(self, key: str) -> bool:
+        members = self._decoded if self._members is None else self._members
+        return key in members
+
+    def __len__(self) -> int:
+        members = self._decoded if self._members is None else self._members
+        return len(members)
+
+    def keys(self) -> Iterator[str]:
+        members = self._decoded if self._members is None else self._members
+        return iter(members)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._decoded.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self._members is None:
+            return default
+        member = self._members.get(key)
+        if member is None:
+            return default
+        _, value_start, value_end, _ = member
+        try:
+            value = json.loads(self.raw[value_start:value_end])
+        except ValueError as e:
+            raise InvalidJSONBodyError(f"Invalid JSON body: bad {key!r}") from e
+        self._decoded[key] = value
+        return value
+
+    def count_items(self, key: str) -> Optional[int]:
+        """Number of items of a top-level array, without decoding it."""
+        if self._members is None:
+            value = self._decoded.get(key)
+            return len(value) if isinstance(value, list) else None
+        member = self._members.get(key)
+        return member[3] if member is not None else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self.get(key) for key in self.keys()}
+
+    def with_fields(
+        self,
+        updates: Optional[Dict[str, Any]] = None,
+        remove: Iterable[str] = (),
+    ) -> "LazyJSONObject":
+        """Return a copy with top-level members replaced, added or removed."""
+        updates = updates or {}
+        removed = set(remove)
+        if self._members is None:
+            body = {k: v for k, v in self._decoded.items() if k not in removed}
+            body.update((k, v) for k, v in updates.items() if k not in removed)
+            return LazyJSONObject(_dumps(body))
+        parts = []
+        for key, (member_start, value_start, value_end, _) in self._members.items():
+            if key in removed:
+                continue
+            if key in updates:
+                parts.append(self.raw[member_start:value_start] + _dumps(updates[key]))
+            else:
+                parts.append(self.raw[member_start:value_end])
+        for key, value in updates.items():
+            if key not in self._members and key not in removed:
+                parts.append(_dumps(key) + b":" + _dumps(value))
+        return LazyJSONObject(b"{" + b",".join(parts) + b"}")
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _index_members(raw: bytes) -> Dict[str, _Member]:
+    """Map each top-level key to its `_Member` spans.
+
+    Only the nesting is checked: raises `InvalidJSONBodyError` when `raw` is
+    not a well-nested JSON object. Values are validated when decoded.
+    """
+    tokens = _tokens(raw)
+    first = next(tokens, None)
+    if first is None or raw[first[0]] != _OPEN_OBJECT or raw[: first[0]].strip():
+        raise InvalidJSONBodyError("Request body must be a JSON object")
+
+    members: Dict[str, _Member] = {}
+    while True:
+        key, member, delimiter = _read_member(raw, tokens)
+        if key is not None:
+            members[key] = member
+        elif raw[delimiter] == _COMMA or members:
+            raise InvalidJSONBodyError("Invalid JSON object")
+        if raw[delimiter] == _CLOSE_OBJECT:
+            break
+    if raw[delimiter + 1 :].strip():
+        raise InvalidJSONBodyError("Trailing data after JSON object")
+    return members
+
+
+def _read_member(
+    raw: bytes, tokens: Iterator[Tuple[int, int]]
+) -> Tuple[Optional[str], _Member, int]:
+    """Read one member up to the `,` or `}` that ends it.
+
+    Returns its key (None when there is no member, as in `{}`), its spans and
+    the position of the delimiter.
+    """
+    key: Optional[str] = None
+    member_start = value_start = 0
+    items: Optional[int] = None
+    for start, end in tokens:
+        c = raw[start]
+        if c == _QUOTE:
+            if key is None:
+                key = json.loads(raw[start:end])
+                member_start = start
+        elif c == _COLON:
+            value_start = end
+            while raw[value_start : value_start + 1].isspace():
+                value_start += 1
+        elif c in _OPEN:
+            items = _skip_nested(raw, tokens, start)
+        elif c == _COMMA or c == _CLOSE_OBJECT:
+            return (
+                key,
+                (member_start, value_start, _value_end(raw, start), items),
+                start,
+            )
+        else:
+            raise InvalidJSONBodyError("Invalid JSON object")
+    raise InvalidJSONBodyError("Unterminated JSON object")
+
+
+def _skip_nested(
+    raw: bytes, tokens: Iterator[Tuple[int, int]], open_start: int
+) -> Optional[int]:
+    """Skip a nested value; return its number of items if it is an array."""
+    depth = 1
+    commas = 0
+    for start, _ in tokens:
+        c = raw[start]
+        if c in _OPEN:
+            depth += 1
+        elif c in _CLOSE:
+            depth -= 1
+            if depth == 0:
+                if raw[open_start] != _OPEN_ARRAY:
+                    return None
+                has_items = commas or raw[open_start + 1 : start].strip()
+                return commas + 1 if has_items else 0
+        elif c == _COMMA and depth == 1:
+            commas += 1
+    raise InvalidJSONBodyError("Unterminated JSON value")
+
+
+def _tokens(raw: bytes) -> Iterator[Tuple[int, int]]:
+    """Yield (start, end) of structural characters and whole strings.
+
+    String ends are located with `bytes.find`, so large string values (base64
+    images, long prompts) are skipped at memchr speed.
+    """
+    search = _STRUCTURAL_RE.search
+    pos = 0
+    while True:
+        m = search(raw, pos)
+        if m is None:
+            return
+        start = m.start()
+        if raw[start] != _QUOTE:
+            pos = start + 1
+            yield start, pos
+            continue
+        end = raw.find(b'"', start + 1)
+        while end != -1:
+            backslashes = 0
+            while raw[end - 1 - backslashes] == _BACKSLASH:
+                backslashes += 1
+            if backslashes % 2 == 0:
+                break
+            end = raw.find(b'"', end + 1)
+        if end == -1:
+            raise InvalidJSONBodyError("Unterminated JSON string")
+        pos = end + 1
+        yield start, pos
+
+
+def _value_end(raw: bytes, delimiter: int) -> int:
+    end = delimiter
+    while end > 0 and raw[end - 1 : end].isspace():
+        end -= 1
+    return end
@@ -0,0 +1,35 @@
+import re
+from typing import List
+
+# Events end with a blank line; upstreams may use CRLF line endings
+_EVENT_END_RE = re.compile(rb"\r?\n\r?\n")
+
+
+class SSEEventSplitter:
+    """Cut an SSE byte stream into whole events, whatever the chunking.
+
+    `feed` returns the events completed by a chunk, each with its trailing
+    blank line; the incomplete tail is kept for the next call and returned
+    by `close` when the stream ends without a final blank line.
+    """
+
+    __slots__ = ("_pending",)
+
+    def __init__(self) -> None:
+        self._pending = b""
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        data = self._pending + chunk if self._pending else chunk
+        events = []
+        start = 0
+        # Only rescan the part that can hold a new boundary
+        search_from = max(0, len(self._pending) - 3)
+        for match in _EVENT_END_RE.finditer(data, search_from):
+            events.append(data[start : match.end()])
+            start = match.end()
+        self._pending = data[start:]
+        return events
+
+    def close(self) -> bytes:
+        pending, self._pending = self._pending, b""
+        return pending
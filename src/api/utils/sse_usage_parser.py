@@ -0,0 +1,97 @@
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+# Only lines matching one of these patterns carry something we log, everything
+# else (token deltas) is skipped without being decoded.
+_INTERESTING_RE = re.compile(
+    rb'"finish_reason"\s*:\s*"'
+    rb'|"usage"\s*:\s*\{'
+    rb'|"type"\s*:\s*"response\.(?:created|completed|incomplete|failed)"'
+)
+
+MAX_PENDING_BYTES = 1 << 20
+
+
+class SSEUsageParser:
+    """Incremental scanner for OpenAI-style SSE streams.
+
+    `feed` is called with every chunk yielded by `aiter_bytes()`; the chunk is
+    not copied or modified, only the trailing incomplete line is kept between
+    calls. It collects the provider response id, the finish reason and the
+    final usage block for both Chat Completions and Responses streams, and
+    the output items of a completed Responses stream.
+    """
+
+    __slots__ = ("_pending", "provider_response_id", "finish_reason", "usage", "output")
+
+    def __init__(self) -> None:
+        self._pending = b""
+        self.provider_response_id: Optional[str] = None
+        self.finish_reason: Optional[str] = None
+        self.usage: Optional[Dict[str, Any]] = None
+        self.output: Optional[List[Any]] = None
+
+    def feed(self, chunk: bytes) -> None:
+        if self._pending:
+            chunk = self._pending + chunk
+        cut = chunk.rfind(b"\n")
+        if cut == -1:
+            self._pending = chunk if len(chunk) <= MAX_PENDING_BYTES else b""
+            return
+        self._pending = chunk[cut + 1 :]
+        complete = chunk[:cut]
+        if self.provider_response_id is not None and not _INTERESTING_RE.search(
+            complete
+        ):
+            return
+        for line in complete.split(b"\n"):
+            if line.startswith(b"data:"):
+                self._handle_data(line[5:].strip())
+
+    def close(self) -> None:
+        """Flush a last event that was not terminated by a newline."""
+        pending, self._pending = self._pending, b""
+        if pending.startswith(b"data:"):
+            self._handle_data(pending[5:].strip())
+
+    def _handle_data(self, data: bytes) -> None:
+        if not data or data == b"[DONE]":
+            return
+        if self.provider_response_id is not None and not _INTERESTING_RE.search(data):
+            return
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return
+        if not isinstance(event, dict):
+            return
+        response = event.get("response")
+        if isinstance(response, dict):
+            self._handle_responses_event(response)
+            return
+        if self.provider_response_id is None and isinstance(event.get("id"), str):
+            self.provider_response_id = event["id"]
+        choices = event.get("choices")
+        if isinstance(choices, list) and choices and isinstance(choices[0], dict):
+            finish_reason = choices[0].get("finish_reason")
+            if finish_reason:
+                self.finish_reason = finish_reason
+        usage = event.get("usage")
+        if isinstance(usage, dict):
+            self.usage = usage
+
+    def _handle_responses_event(self, response: Dict[str, Any]) -> None:
+        if self.provider_response_id is None and isinstance(response.get("id"), str):
+            self.provider_response_id = response["id"]
+        status = response.get("status")
+        if status and status != "in_progress":
+            details = response.get("incomplete_details")
+            reason = details.get("reason") if isinstance(details, dict) else None
+            self.finish_reason = reason or status
+        usage = response.get("usage")
+        if isinstance(usage, dict):
+            self.usage = usage
+        output = response.get("output")
+        if status == "completed" and isinstance(output, list):
+            self.output = output
@@ -0,0 +1,138 @@
+import fnmatch
+import json
+import math
+import re
+from typing import Any, Callable, List, Optional, Tuple
+
+# Inline media (images, files) are sent base64-encoded; their bytes say
+# nothing about their token cost, so they are counted at a flat rate.
+_INLINE_MEDIA_RE = re.compile(rb"data:[\w.+/-]+;base64,[A-Za-z0-9+/=]*")
+
+BYTES_PER_TOKEN = 4
+# A `\uXXXX` escape (6 bytes) is one character; count it as the 3 UTF-8
+# bytes most non-Latin characters take, whichever way the client encoded it
+ESCAPE_DISCOUNT_BYTES = 3
+MEDIA_TOKENS = 1000
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Fields bounding the completion length, by API
+MAX_OUTPUT_FIELDS = ("max_tokens", "max_completion_tokens", "max_output_tokens")
+
+TokenCounter = Callable[[str], int]
+
+
+class TokenEstimate:
+    """Estimated prompt size and the completion budget asked for."""
+
+    __slots__ = ("prompt_tokens", "max_output_tokens", "exact")
+
+    def __init__(
+        self, prompt_tokens: int, max_output_tokens: Optional[int], exact: bool
+    ) -> None:
+        self.prompt_tokens = prompt_tokens
+        self.max_output_tokens = max_output_tokens
+        self.exact = exact
+
+
+class TokenEstimator:
+    """Local, tokenizer-free estimate of the prompt size of a request.
+
+    By default the raw body is counted at `BYTES_PER_TOKEN` bytes per token,
+    after setting inline base64 media aside and shrinking JSON unicode escapes
+    to the size of the character they stand for. That only reads the body once
+    with C-level scans, so it stays well under a millisecond even for large
+    requests. Models matching a pattern given to `register` are counted
+    with that exact tokenizer instead, on the decoded message texts.
+    """
+
+    def __init__(self) -> None:
+        self._counters: List[Tuple[str, TokenCounter]] = []
+
+    def register(self, pattern: str, counter: TokenCounter) -> None:
+        """Use `counter` for models matching the fnmatch `pattern`."""
+        self._counters.append((pattern, counter))
+
+    def estimate(self, payload) -> TokenEstimate:
+        """Estimate a Chat Completions or Responses body (a LazyJSONObject)."""
+        raw = payload.raw
+        media_bytes = media = 0
+        if b";base64," in raw:
+            for match in _INLINE_MEDIA_RE.finditer(raw):
+                media += 1
+                media_bytes += match.end() - match.start()
+        text_bytes = len(raw) - media_bytes
+        if b"\\u" in raw:
+            text_bytes -= raw.count(b"\\u") * ESCAPE_DISCOUNT_BYTES
+
+        counter = self._counter_for(payload.get("model"))
+        if counter is not None:
+            texts, messages = _prompt_texts(payload)
+            prompt_tokens = (
+                sum(counter(text) for text in texts)
+                + messages * MESSAGE_OVERHEAD_TOKENS
+                + media * MEDIA_TOKENS
+            )
+        else:
+            prompt_tokens = (
+                math.ceil(max(0, text_bytes) / BYTES_PER_TOKEN) + media * MEDIA_TOKENS
+            )
+        return TokenEstimate(
+            prompt_tokens, max_output_tokens(payload), exact=counter is not None
+        )
+
+    def _counter_for(self, model: Any) -> Optional[TokenCounter]:
+        if not isinstance(model, str):
+            return None
+        for pattern, counter in self._counters:
+            if fnmatch.fnmatchcase(model, pattern):
+                return counter
+        return None
+
+
+def max_output_tokens(payload) -> Optional[int]:
+    for field in MAX_OUTPUT_FIELDS:
+        value = payload.get(field)
+        if isinstance(value, int) and value > 0:
+            return value
+    return None
+
+
+def tiktoken_counter(encoding_name: str = "o200k_base") -> TokenCounter:
+    """Exact counter for OpenAI models; needs the optional `tiktoken` package."""
+    import tiktoken
+
+    encoding = tiktoken.get_encoding(encoding_name)
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def _prompt_texts(payload) -> Tuple[List[str], int]:
+    """Text of every message (or input item) and tool, and the message count."""
+    items = payload.get("messages")
+    if items is None:
+        items = payload.get("input")
+    if isinstance(items, str):
+        items = [{"content": items}]
+    if not isinstance(items, list):
+        items = []
+    texts = [_item_text(item) for item in items]
+    for field in ("instructions", "tools"):
+        value = payload.get(field)
+        if value:
+            texts.append(value if isinstance(value, str) else json.dumps(value))
+    return texts, len(items)
+
+
+def _item_text(item: Any) -> str:
+    if not isinstance(item, dict):
+        return str(item)
+    content = item.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(
+            part.get("text") or ""
+            for part in content
+            if isinstance(part, dict) and isinstance(part.get("text"), str)
+        )
+    # Tool calls, function outputs...
+    return json.dumps(item, ensure_ascii=False)
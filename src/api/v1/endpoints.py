@@ -1,13 +1,17 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, Request
 
 from .routes import (
     auth_router,
+    batches_router,
     chat_router,
     embeddings_router,
+    files_router,
     models_router,
     responses_router,
+    streams_router,
     vector_store_router,
 )
+from .security import ensure_valid_api_key_or_token
 
 router = APIRouter()
 
@@ -19,6 +23,9 @@ router.include_router(models_router, prefix="/models", tags=["AI Models"])
 router.include_router(
     vector_store_router, prefix="/vector_stores", tags=["Vector Stores"]
 )
+router.include_router(files_router, prefix="/files", tags=["Files"])
+router.include_router(batches_router, prefix="/batches", tags=["Batches"])
+router.include_router(streams_router, prefix="/streams", tags=["Streams"])
 
 # Auth
 router.include_router(auth_router, prefix="/auth", tags=["Authentication"])
@@ -29,3 +36,66 @@ router.include_router(auth_router, prefix="/auth", tags=["Authentication"])
 async def health_check():
     """Health check endpoint."""
     return {"status": "ok", "message": "API is running!"}
+
+
+# Metrics
+@router.get(
+    "/metrics",
+    tags=["Health"],
+    dependencies=[Depends(ensure_valid_api_key_or_token)],
+)
+async def metrics(request: Request):
+    """Internal metrics of the LLM proxy pipeline."""
+    log_writer = getattr(request.app.mongodb_client, "llm_log_writer", None)
+    response_cache = getattr(request.app, "response_cache", None)
+    semantic_cache = getattr(request.app, "semantic_cache", None)
+    openrouter_proxy = getattr(request.app, "openrouter_proxy", None)
+    admission = getattr(request.app, "admission_controller", None)
+    rate_limiter = getattr(request.app, "rate_limiter", None)
+    context_guard = getattr(request.app, "context_guard", None)
+    idempotency = getattr(request.app, "idempotency_store", None)
+    conversations = getattr(request.app, "conversation_store", None)
+    batch_runner = getattr(request.app, "batch_runner", None)
+    stream_replay = getattr(request.app, "stream_replay", None)
+    sse_coalescer = getattr(request.app, "sse_coalescer", None)
+    embeddings = getattr(request.app, "embeddings", None)
+    embedding_jobs = getattr(request.app, "embedding_jobs", None)
+    single_flight = {
+        name: client.single_flight.metrics()
+        for name, client in (
+            ("openrouter", openrouter_proxy),
+            ("models", getattr(request.app, "models_client", None)),
+            ("embeddings", embeddings),
+        )
+        if client is not None
+    }
+    return {
+        "llm_log_writer": log_writer.metrics() if log_writer else None,
+        "response_cache": response_cache.metrics() if response_cache else None,
+        "semantic_cache": semantic_cache.metrics() if semantic_cache else None,
+        "embedding_cache": (
+            embeddings.cache.metrics() if embeddings and embeddings.cache else None
+        ),
+        "embedding_batching": (
+            embeddings.batcher.metrics() if embeddings and embeddings.batcher else None
+        ),
+        "embedding_chunking": (
+            embeddings.chunker.metrics() if embeddings and embeddings.chunker else None
+        ),
+        "embedding_jobs": embedding_jobs.metrics() if embedding_jobs else None,
+        "single_flight": single_flight,
+        "upstreams": openrouter_proxy.router.metrics() if openrouter_proxy else None,
+        "admission": admission.metrics() if admission else None,
+        "rate_limiter": rate_limiter.metrics() if rate_limiter else None,
+        "context_guard": context_guard.metrics() if context_guard else None,
+        "idempotency": idempotency.metrics() if idempotency else None,
+        "conversations": conversations.metrics() if conversations else None,
+        "batches": batch_runner.metrics() if batch_runner else None,
+        "stream_replay": stream_replay.metrics() if stream_replay else None,
+        "sse_coalescing": sse_coalescer.metrics() if sse_coalescer else None,
+        "hedging": (
+            openrouter_proxy.hedging.metrics()
+            if openrouter_proxy and openrouter_proxy.hedging
+            else None
+        ),
+    }
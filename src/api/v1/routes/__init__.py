@@ -1,8 +1,11 @@
 from .auth.auth_routes import router as auth_router
+from .batches.batches_routes import router as batches_router
 from .chat.chat_routes import router as chat_router
 from .embeddings.embeddings_routes import router as embeddings_router
+from .files.files_routes import router as files_router
 from .models.models_routes import router as models_router
 from .responses.responses_routes import router as responses_router
+from .streams.streams_routes import router as streams_router
 from .vector_stores.vector_store_routes import router as vector_store_router
 
 __all__ = [
@@ -12,4 +15,7 @@ __all__ = [
     "embeddings_router",
     "responses_router",
     "vector_store_router",
+    "files_router",
+    "batches_router",
+    "streams_router",
 ]
@@ -0,0 +1,50 @@
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class CreateBatchRequest(BaseModel):
+    input_file_id: str = Field(
+        ..., description="Id of a JSONL file uploaded with purpose `batch`"
+    )
+    endpoint: str = Field(
+        ...,
+        description="Endpoint of every request: /v1/chat/completions, /v1/responses",
+    )
+    completion_window: str = Field("24h", description="Only `24h` is supported")
+    metadata: Optional[Dict[str, str]] = None
+
+
+class BatchRequestCounts(BaseModel):
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+
+
+class Batch(BaseModel):
+    id: str
+    object: str = "batch"
+    endpoint: str
+    errors: Optional[Dict[str, Any]] = None
+    input_file_id: str
+    completion_window: str
+    status: str
+    output_file_id: Optional[str] = None
+    error_file_id: Optional[str] = None
+    created_at: int
+    in_progress_at: Optional[int] = None
+    expires_at: Optional[int] = None
+    finalizing_at: Optional[int] = None
+    completed_at: Optional[int] = None
+    failed_at: Optional[int] = None
+    expired_at: Optional[int] = None
+    cancelling_at: Optional[int] = None
+    cancelled_at: Optional[int] = None
+    request_counts: BatchRequestCounts
+    usage: Optional[Dict[str, int]] = None
+    metadata: Optional[Dict[str, str]] = None
+
+
+class ListBatchesResponse(BaseModel):
+    object: str = "list"
+    data: List[Batch]
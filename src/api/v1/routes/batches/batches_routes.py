@@ -0,0 +1,88 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from api.classes import BatchRunner
+from api.classes.batch_runner import BatchError, public_batch
+from api.v1.security import (
+    ensure_valid_api_key_or_token,
+    get_current_user_with_api_key_or_token,
+)
+from api.v1.services import get_batch_runner
+
+from .batches_models import Batch, CreateBatchRequest, ListBatchesResponse
+
+router = APIRouter(dependencies=[Depends(ensure_valid_api_key_or_token)])
+
+
+def _require(batch_runner: BatchRunner | None) -> BatchRunner:
+    if batch_runner is None:
+        raise HTTPException(status_code=503, detail="Batches are disabled")
+    return batch_runner
+
+
+@router.post(
+    "",
+    response_model=Batch,
+    description="""Run a JSONL file of requests in the background.
+
+    - Each line is `{"custom_id", "method": "POST", "url", "body"}`, with
+      `url` equal to the batch `endpoint`; a file with an invalid line fails
+      validation as a whole.
+    - Lines run with bounded concurrency, overall and per model, and are
+      retried on upstream errors; `request_counts` shows the progress.
+    - Results go to `output_file_id` (successes) and `error_file_id`,
+      readable with `GET /v1/files/{file_id}/content`.
+    """,
+)
+async def create_batch(
+    body: CreateBatchRequest,
+    batch_runner: BatchRunner | None = Depends(get_batch_runner),
+    user: dict = Depends(get_current_user_with_api_key_or_token),
+):
+    try:
+        batch = await _require(batch_runner).create(
+            user_id=user["_id"],
+            input_file_id=body.input_file_id,
+            endpoint=body.endpoint,
+            completion_window=body.completion_window,
+            metadata=body.metadata,
+        )
+    except BatchError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return public_batch(batch)
+
+
+@router.get("", response_model=ListBatchesResponse)
+async def list_batches(
+    limit: int = 20,
+    batch_runner: BatchRunner | None = Depends(get_batch_runner),
+    user: dict = Depends(get_current_user_with_api_key_or_token),
+):
+    batches = await _require(batch_runner).list(
+        user["_id"], limit=max(1, min(limit, 100))
+    )
+    return {"data": [public_batch(b) for b in batches]}
+
+
+@router.get("/{batch_id}", response_model=Batch)
+async def get_batch(
+    batch_id: str,
+    batch_runner: BatchRunner | None = Depends(get_batch_runner),
+    user: dict = Depends(get_current_user_with_api_key_or_token),
+):
+    batch = await _require(batch_runner).get(batch_id, user["_id"])
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return public_batch(batch)
+
+
+@router.post("/{batch_id}/cancel", response_model=Batch)
+async def cancel_batch(
+    batch_id: str,
+    batch_runner: BatchRunner | None = Depends(get_batch_runner),
+    user: dict = Depends(get_current_user_with_api_key_or_token),
+):
+    """Stop a running batch; results of the lines already done are kept."""
+    batch = await _require(batch_runner).cancel(batch_id, user["_id"])
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return public_batch(batch)
@@ -1,19 +1,57 @@
-from fastapi import APIRouter, Body, Depends, Request
-from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi import APIRouter, Depends, Request
 
-from api.classes import OpenRouterProxy
+from api.classes import (
+    AdmissionController,
+    ContextGuard,
+    IdempotencyStore,
+    OpenRouterProxy,
+    ResponseCache,
+    SemanticCache,
+    SSECoalescer,
+    StreamReplay,
+)
 from api.databases import MongoDBConnector
 from api.v1.security import (
     ensure_valid_api_key_or_token,
     get_current_user_with_api_key_or_token,
 )
-from api.v1.services import get_mongo_client, get_openrouter_proxy
+from api.v1.services import (
+    enforce_rate_limit,
+    get_admission_controller,
+    get_context_guard,
+    get_idempotency_store,
+    get_mongo_client,
+    get_openrouter_proxy,
+    get_response_cache,
+    get_semantic_cache,
+    get_sse_coalescer,
+    get_stream_replay,
+)
 
-from ..llm_proxy import proxy_openrouter_request
+from ..llm_proxy import openapi_request_body, proxy_openrouter_request
 from .chat_models import ChatCompletionsRequest
 
 router = APIRouter()
 
+CHAT_COMPLETIONS_EXAMPLES = {
+    "non_stream": {
+        "summary": "Standard request (JSON)",
+        "value": {
+            "model": "mistral-small",
+            "messages": [{"role": "user", "content": "Bonjour"}],
+            "stream": False,
+        },
+    },
+    "stream": {
+        "summary": "Streaming request (SSE)",
+        "value": {
+            "model": "mistral-small",
+            "messages": [{"role": "user", "content": "Bonjour"}],
+            "stream": True,
+        },
+    },
+}
+
 
 @router.post(
     "/completions",
@@ -23,43 +61,54 @@ router = APIRouter()
     - When `stream` = `false` (default), returns a `chat.completion` object.
     - When `stream` = `true`, returns a SSE stream where each `data:` contains
       a serialized `chat.completion.chunk`.
+    - Streams carry SSE `id:` fields and an `X-Job-Id` header; a client that
+      drops can resume with `GET /v1/streams/{job_id}` and `Last-Event-ID`.
+    - Deterministic requests (`temperature` = 0 or `X-Cache: allow`) are served
+      from the response cache when it is enabled.
+    - With the semantic cache enabled, a single question close enough to one
+      already answered (same user, model and system prompt) is served from
+      it, with `X-Cache: SEMANTIC`.
+    - Requests estimated not to fit in the model context window are rejected
+      with a 400 before reaching the upstream.
+    - With an `Idempotency-Key` header, a retried request gets the stored
+      result (or waits for the running call) instead of a new generation.
     """,
     response_model=None,
-    dependencies=[Depends(ensure_valid_api_key_or_token)],
+    dependencies=[
+        Depends(ensure_valid_api_key_or_token),
+        Depends(enforce_rate_limit),
+    ],
+    openapi_extra=openapi_request_body(
+        ChatCompletionsRequest, CHAT_COMPLETIONS_EXAMPLES
+    ),
 )
 async def completions(
     request: Request,
-    chat_request: ChatCompletionsRequest = Body(
-        ...,
-        examples={
-            "non_stream": {
-                "summary": "Standard request (JSON)",
-                "value": {
-                    "model": "mistral-small",
-                    "messages": [{"role": "user", "content": "Bonjour"}],
-                    "stream": False,
-                },
-            },
-            "stream": {
-                "summary": "Streaming request (SSE)",
-                "value": {
-                    "model": "mistral-small",
-                    "messages": [{"role": "user", "content": "Bonjour"}],
-                    "stream": True,
-                },
-            },
-        },
-    ),
     openrouter_proxy: OpenRouterProxy = Depends(get_openrouter_proxy),
     user: dict = Depends(get_current_user_with_api_key_or_token),
     mongodb_client: MongoDBConnector = Depends(get_mongo_client),
+    response_cache: ResponseCache | None = Depends(get_response_cache),
+    admission_controller: AdmissionController | None = Depends(
+        get_admission_controller
+    ),
+    idempotency_store: IdempotencyStore | None = Depends(get_idempotency_store),
+    context_guard: ContextGuard | None = Depends(get_context_guard),
+    stream_replay: StreamReplay | None = Depends(get_stream_replay),
+    sse_coalescer: SSECoalescer | None = Depends(get_sse_coalescer),
+    semantic_cache: SemanticCache | None = Depends(get_semantic_cache),
 ):
     return await proxy_openrouter_request(
         request=request,
-        fallback_body=chat_request.model_dump(exclude_none=True),
         openrouter_proxy=openrouter_proxy,
         mongodb_client=mongodb_client,
         user=user,
         endpoint="/chat/completions",
         operation="chat.completions",
+        response_cache=response_cache,
+        admission_controller=admission_controller,
+        idempotency_store=idempotency_store,
+        context_guard=context_guard,
+        stream_replay=stream_replay,
+        sse_coalescer=sse_coalescer,
+        semantic_cache=semantic_cache,
     )
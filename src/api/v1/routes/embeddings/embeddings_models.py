@@ -1,16 +1,24 @@
-from typing import List
+from typing import Dict, List, Literal, Optional, Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+EncodingFormat = Literal["float", "base64", "float16", "int8"]
 
 
 class EmbeddingsRequest(BaseModel):
     input: List[str]
     model: str
+    dimensions: Optional[int] = Field(None, gt=0)
+    encoding_format: EncodingFormat = Field(
+        "float",
+        description="float (numbers), base64 (float32), float16 or int8 (base64)",
+    )
 
 
 class EmbeddingData(BaseModel):
     object: str = "embedding"
-    embedding: List[float]
+    # A base64 string unless `encoding_format` is "float"
+    embedding: Union[List[float], str]
     index: int
 
 
@@ -25,3 +33,30 @@ class EmbeddingsResponse(BaseModel):
     model: str
     data: List[EmbeddingData]
     usage: EmbeddingsUsage
+
+
+class CreateEmbeddingJobRequest(BaseModel):
+    input: List[str]
+    model: str
+    dimensions: Optional[int] = Field(None, gt=0)
+    vector_store_id: Optional[str] = Field(
+        None, description="Vector store to upsert the vectors into on completion"
+    )
+
+
+class EmbeddingJob(BaseModel):
+    id: str
+    object: str = "embedding.job"
+    model: str
+    dimensions: Optional[int] = None
+    status: str
+    batch_id: str
+    input_count: int
+    request_counts: Dict[str, int]
+    vector_store_id: Optional[str] = None
+    error: Optional[str] = None
+    action_error: Optional[str] = Field(
+        None, description="Why the completion action (vector store upsert) failed"
+    )
+    created_at: int
+    completed_at: Optional[int] = None
@@ -1,16 +1,30 @@
 import json
 import uuid
 
+from bson import ObjectId
 from fastapi import APIRouter, Depends, HTTPException
 
+from api.classes import EmbeddingJobs
+from api.classes.embedding_jobs import public_job
 from api.databases import MongoDBConnector
 from api.v1.security import (
     ensure_valid_api_key_or_token,
     get_current_user_with_api_key_or_token,
 )
-from api.v1.services import get_embeddings, get_mongo_client
+from api.v1.services import (
+    enforce_rate_limit,
+    get_embedding_jobs,
+    get_embeddings,
+    get_mongo_client,
+)
 
-from .embeddings_models import EmbeddingsRequest, EmbeddingsResponse
+from .embeddings_models import (
+    CreateEmbeddingJobRequest,
+    EmbeddingJob,
+    EmbeddingsRequest,
+    EmbeddingsResponse,
+    EncodingFormat,
+)
 
 router = APIRouter()
 
@@ -19,7 +33,10 @@ router = APIRouter()
     "",
     summary="Get embeddings",
     response_model=EmbeddingsResponse,
-    dependencies=[Depends(ensure_valid_api_key_or_token)],
+    dependencies=[
+        Depends(ensure_valid_api_key_or_token),
+        Depends(enforce_rate_limit),
+    ],
 )
 async def embeddings(
     body: EmbeddingsRequest,
@@ -44,6 +61,115 @@ async def embeddings(
         model=body.model,
         inputs=body.input,
         job_id=job_id,
+        dimensions=body.dimensions,
+        encoding_format=body.encoding_format,
     )
 
     return embeddings_data
+
+
+def _require(embedding_jobs: EmbeddingJobs | None) -> EmbeddingJobs:
+    if embedding_jobs is None:
+        raise HTTPException(status_code=503, detail="Embedding jobs are disabled")
+    return embedding_jobs
+
+
+@router.post(
+    "/jobs",
+    summary="Start an embedding batch job",
+    response_model=EmbeddingJob,
+    status_code=202,
+    dependencies=[
+        Depends(ensure_valid_api_key_or_token),
+        Depends(enforce_rate_limit),
+    ],
+    description="""Embed the inputs with the provider Batch API, without waiting.
+
+    - Returns the job at once; `GET /v1/embeddings/jobs/{job_id}` shows its
+      status, `GET /v1/embeddings/jobs/{job_id}/results` the vectors once
+      it is `completed`.
+    - With `vector_store_id`, the vectors are upserted into that vector
+      store on completion, embedded with its model.
+    """,
+)
+async def create_embedding_job(
+    body: CreateEmbeddingJobRequest,
+    embedding_jobs: EmbeddingJobs | None = Depends(get_embedding_jobs),
+    user: dict = Depends(get_current_user_with_api_key_or_token),
+    mongodb_client: MongoDBConnector = Depends(get_mongo_client),
+):
+    embedding_jobs = _require(embedding_jobs)
+    if not body.input:
+        raise HTTPException(status_code=400, detail="No input provided")
+
+    model = body.model
+    if body.vector_store_id is not None:
+        # Ownership check
+        one = await mongodb_client.find_one(
+            "vector_db_collections",
+            {"name": body.vector_store_id, "user_id": ObjectId(user["_id"])},
+        )
+        if not one:
+            raise HTTPException(status_code=404, detail="Vector store not found")
+        model = one["embedding_model"]
+
+    try:
+        job = await embedding_jobs.submit(
+            user_id=user["_id"],
+            model=model,
+            inputs=body.input,
+            dimensions=body.dimensions,
+            vector_store_id=body.vector_store_id,
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e)) from e
+
+    await mongodb_client.log_event(
+        user["_id"],
+        job["id"],
+        "embeddings_job",
+        {
+            "model": model,
+            "inputs_count": len(body.input),
+            "vector_store_id": body.vector_store_id,
+        },
+    )
+    return public_job(job)
+
+
+@router.get(
+    "/jobs/{job_id}",
+    summary="Get an embedding batch job",
+    response_model=EmbeddingJob,
+    dependencies=[Depends(ensure_valid_api_key_or_token)],
+)
+async def get_embedding_job(
+    job_id: str,
+    embedding_jobs: EmbeddingJobs | None = Depends(get_embedding_jobs),
+    user: dict = Depends(get_current_user_with_api_key_or_token),
+):
+    job = await _require(embedding_jobs).get(job_id, user["_id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Embedding job not found")
+    return public_job(job)
+
+
+@router.get(
+    "/jobs/{job_id}/results",
+    summary="Get the embeddings of a completed job",
+    response_model=EmbeddingsResponse,
+    dependencies=[Depends(ensure_valid_api_key_or_token)],
+)
+async def get_embedding_job_results(
+    job_id: str,
+    encoding_format: EncodingFormat = "float",
+    embedding_jobs: EmbeddingJobs | None = Depends(get_embedding_jobs),
+    user: dict = Depends(get_current_user_with_api_key_or_token),
+):
+    embedding_jobs = _require(embedding_jobs)
+    job = await embedding_jobs.get(job_id, user["_id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Embedding job not found")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Embedding job is {job['status']}")
+    return await embedding_jobs.results(job, encoding_format)
@@ -0,0 +1,24 @@
+from typing import List
+
+from pydantic import BaseModel
+
+
+class FileObject(BaseModel):
+    id: str
+    object: str = "file"
+    bytes: int
+    created_at: int
+    filename: str
+    purpose: str
+    status: str = "processed"
+
+
+class ListFilesResponse(BaseModel):
+    object: str = "list"
+    data: List[FileObject]
+
+
+class DeleteFileResponse(BaseModel):
+    id: str
+    object: str = "file"
+    deleted: bool
@@ -0,0 +1,101 @@
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+
+from api.classes import FileStore
+from api.classes.file_store import FileTooLargeError
+from api.v1.security import (
+    ensure_valid_api_key_or_token,
+    get_current_user_with_api_key_or_token,
+)
+from api.v1.services import get_file_store
+
+from .files_models import DeleteFileResponse, FileObject, ListFilesResponse
+
+router = APIRouter(dependencies=[Depends(ensure_valid_api_key_or_token)])
+
+# Uploads are copied to the store in pieces of this size
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+def _require(file_store: FileStore | None) -> FileStore:
+    if file_store is None:
+        raise HTTPException(status_code=503, detail="File storage is not available")
+    return file_store
+
+
+@router.post("", response_model=FileObject)
+async def upload_file(
+    file: UploadFile = File(...),
+    purpose: str = Form(...),
+    file_store: FileStore | None = Depends(get_file_store),
+    user: dict = Depends(get_current_user_with_api_key_or_token),
+):
+    """Upload a JSONL file of requests for `/v1/batches` (`purpose` = `batch`)."""
+    file_store = _require(file_store)
+    if purpose != "batch":
+        raise HTTPException(status_code=400, detail=f"Unsupported purpose: {purpose}")
+    writer = file_store.open_writer(
+        filename=file.filename or "upload.jsonl", purpose=purpose, user_id=user["_id"]
+    )
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            await writer.write(chunk)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e)) from e
+    except BaseException:
+        await writer.abort()
+        raise
+    return await writer.close()
+
+
+@router.get("", response_model=ListFilesResponse)
+async def list_files(
+    purpose: str | None = None,
+    limit: int = 100,
+    file_store: FileStore | None = Depends(get_file_store),
+    user: dict = Depends(get_current_user_with_api_key_or_token),
+):
+    files = await _require(file_store).list(
+        user["_id"], purpose=purpose, limit=max(1, min(limit, 10_000))
+    )
+    return {"data": files}
+
+
+@router.get("/{file_id}", response_model=FileObject)
+async def get_file(
+    file_id: str,
+    file_store: FileStore | None = Depends(get_file_store),
+    user: dict = Depends(get_current_user_with_api_key_or_token),
+):
+    file = await _require(file_store).get(file_id, user["_id"])
+    if file is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return file
+
+
+@router.get("/{file_id}/content")
+async def get_file_content(
+    file_id: str,
+    file_store: FileStore | None = Depends(get_file_store),
+    user: dict = Depends(get_current_user_with_api_key_or_token),
+):
+    """Stream the file back as stored, chunk by chunk."""
+    file_store = _require(file_store)
+    if await file_store.get(file_id, user["_id"]) is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return StreamingResponse(
+        file_store.iter_chunks(file_id), media_type="application/jsonl"
+    )
+
+
+@router.delete("/{file_id}", response_model=DeleteFileResponse)
+async def delete_file(
+    file_id: str,
+    file_store: FileStore | None = Depends(get_file_store),
+    user: dict = Depends(get_current_user_with_api_key_or_token),
+):
+    file_store = _require(file_store)
+    if await file_store.get(file_id, user["_id"]) is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    await file_store.delete(file_id)
+    return {"id": file_id, "deleted": True}
@@ -1,24 +1,197 @@
+import asyncio
+import copy
+import functools
 import hashlib
 import json
 import time
 import uuid
-from typing import Any, AsyncGenerator, Dict, Tuple
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Tuple,
+    Type,
+    TypeVar,
+)
 
 import httpx
 from fastapi import Request
 from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from starlette.background import BackgroundTask, BackgroundTasks
+from starlette.types import Receive, Scope, Send
 
-from api.classes import OpenRouterProxy
+from api.classes import (
+    AdmissionController,
+    ContextGuard,
+    ConversationStore,
+    IdempotencyStore,
+    OpenRouterProxy,
+    ResponseCache,
+    SemanticCache,
+    SSECoalescer,
+    StreamReplay,
+)
+from api.classes.admission_controller import AdmissionRejectedError, AdmissionTicket
+from api.classes.conversation_store import (
+    ConversationNotFoundError,
+    ConversationTurn,
+    input_items,
+)
+from api.classes.idempotency_store import IdempotencyOutcome
+from api.classes.resilience import CircuitOpenError
+from api.classes.response_cache import chat_completion_to_sse, response_to_sse
+from api.classes.semantic_cache import SemanticQuery
 from api.databases import MongoDBConnector
+from api.utils import (
+    JSONUsageScanner,
+    LazyJSONObject,
+    SSEEventSplitter,
+    SSEUsageParser,
+)
+from api.v1.services import read_json_body
+
+T = TypeVar("T")
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+
+def openapi_request_body(
+    model: Type[BaseModel], examples: Dict[str, Any]
+) -> Dict[str, Any]:
+    """OpenAPI `requestBody` for a route that reads its raw body itself.
+
+    The proxy routes skip Pydantic validation, so the schema is attached via
+    `openapi_extra` instead of a `Body` parameter.
+    """
+    schema = model.model_json_schema()
+    definitions = schema.pop("$defs", {})
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": _inline_refs(schema, definitions, ()),
+                    "examples": examples,
+                }
+            },
+        }
+    }
+
+
+def _inline_refs(node: Any, definitions: Dict[str, Any], seen: Tuple[str, ...]):
+    if isinstance(node, list):
+        return [_inline_refs(item, definitions, seen) for item in node]
+    if not isinstance(node, dict):
+        return node
+    ref = node.get("$ref")
+    if isinstance(ref, str) and ref.startswith("#/$defs/"):
+        name = ref[len("#/$defs/") :]
+        if name in seen or name not in definitions:
+            # Recursive definition: stop expanding
+            return {"type": "object"}
+        return _inline_refs(
+            copy.deepcopy(definitions[name]), definitions, seen + (name,)
+        )
+    return {key: _inline_refs(value, definitions, seen) for key, value in node.items()}
 
 
 def _simple_error_payload(message: str) -> Dict[str, Any]:
     return {"error": message}
 
 
+# Logged when the client went away before the end of its response (nginx's
+# "client closed request")
+CLIENT_CLOSED_REQUEST = 499
+CLIENT_CANCELLED = "client_cancelled"
+
+# Streams are kept running for a reconnect only when the client asks for it;
+# otherwise a disconnect stops the generation at once
+RESUMABLE_HEADER = "x-stream-resumable"
+
+
+class ClientDisconnectedError(Exception):
+    """The client went away before its response was ready."""
+
+
+def _resumable(
+    request: Request, stream_replay: StreamReplay | None
+) -> StreamReplay | None:
+    """`stream_replay` when the client opted into resumable streams."""
+    if request.headers.get(RESUMABLE_HEADER, "").lower() in ("1", "true"):
+        return stream_replay
+    return None
+
+
+async def _wait_for_disconnect(receive: Receive) -> None:
+    # The request body has been read: what comes next is the disconnect
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _race_disconnect(receive: Receive, task: asyncio.Future) -> bool:
+    """Wait for `task`; cancel it and return True if the client leaves first."""
+    watcher = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if not task.done() and watcher.exception() is not None:
+            # Cannot tell whether the client is still there: keep going
+            await asyncio.wait({task})
+        return not task.done()
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.wait({task})
+
+
+async def _unless_disconnected(request: Request, awaitable: Awaitable[T]) -> T:
+    """Await `awaitable`, cancelling it if the client disconnects first."""
+    task = asyncio.ensure_future(awaitable)
+    if await _race_disconnect(request.receive, task):
+        raise ClientDisconnectedError()
+    return task.result()
+
+
+class CancellableStreamingResponse(StreamingResponse):
+    """Streaming response that stops reading upstream once the client leaves.
+
+    Starlette only notices a gone client on its next write (ASGI 2.4) and
+    leaves the body iterator to the garbage collector, so a paused upstream
+    keeps generating. Here the body is sent from a task cancelled as soon as
+    `http.disconnect` arrives, and the iterator is always closed.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        sender = asyncio.ensure_future(self.stream_response(send))
+        try:
+            await _race_disconnect(receive, sender)
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        if not sender.cancelled():
+            error = sender.exception()
+            # OSError: the client left during a write (ASGI 2.4)
+            if error is not None and not isinstance(error, OSError):
+                raise error
+        if self.background is not None:
+            await self.background()
+
+
 async def _read_payload(
-    request: Request, fallback_body: Dict[str, Any]
-) -> Tuple[Dict[str, Any] | None, JSONResponse | None, Dict[str, Any]]:
+    request: Request,
+) -> Tuple[LazyJSONObject | None, JSONResponse | None, Dict[str, Any]]:
+    # The raw body is forwarded upstream unchanged; only the fields needed for
+    # logging and routing are decoded, on demand.
     raw_body_bytes = await request.body()
     meta = {
         "request_bytes": len(raw_body_bytes),
@@ -27,8 +200,9 @@ async def _read_payload(
         else None,
     }
     try:
-        raw_body = json.loads(raw_body_bytes) if raw_body_bytes else fallback_body
-    except json.JSONDecodeError:
+        payload = await read_json_body(request)
+        model = payload.get("model")
+    except ValueError:
         return (
             None,
             JSONResponse(
@@ -37,29 +211,28 @@ async def _read_payload(
             ),
             meta,
         )
-    if not isinstance(raw_body, dict):
+    if not isinstance(model, str) or not model:
         return (
             None,
             JSONResponse(
                 status_code=400,
-                content=_simple_error_payload("Invalid request body"),
+                content=_simple_error_payload("Invalid request body: missing model"),
             ),
             meta,
         )
-    return raw_body.copy(), None, meta
+    return payload, None, meta
 
 
 def _build_log_doc(
     *,
     user: dict,
     job_id: str,
-    payload: Dict[str, Any],
+    payload: LazyJSONObject,
     meta: Dict[str, Any],
     operation: str,
     endpoint: str,
+    idempotency_key: str | None = None,
 ) -> Dict[str, Any]:
-    messages = payload.get("messages")
-    input_value = payload.get("input")
     return {
         "user_id": user.get("_id"),
         "job_id": job_id,
@@ -70,25 +243,118 @@ def _build_log_doc(
         "stream": bool(payload.get("stream", False)),
         "request_hash": meta.get("request_hash"),
         "request_bytes": meta.get("request_bytes"),
-        "messages_count": len(messages) if isinstance(messages, list) else None,
-        "input_count": len(input_value) if isinstance(input_value, list) else None,
+        "messages_count": payload.count_items("messages"),
+        "input_count": payload.count_items("input"),
         "status_code": None,
         "latency_ms": None,
         "usage": None,
         "provider_response_id": None,
         "finish_reason": None,
         "error": None,
+        "cache_hit": False,
+        "semantic_similarity": None,
+        "hedged": False,
+        "queue_wait_ms": None,
+        "idempotency_key": idempotency_key,
+        "estimated_prompt_tokens": None,
     }
 
 
-def _response_from_upstream(response: httpx.Response) -> Response:
+def _ensure_stream_usage(payload: LazyJSONObject) -> Tuple[LazyJSONObject, bool]:
+    """Ask upstream for the usage chunk; True when the client did not ask."""
+    # Without it, Chat Completions streams never carry a usage block.
+    stream_options = payload.get("stream_options")
+    if not isinstance(stream_options, dict):
+        stream_options = {}
+    elif "include_usage" in stream_options:
+        return payload, False
+    payload = payload.with_fields(
+        {"stream_options": {**stream_options, "include_usage": True}}
+    )
+    return payload, True
+
+
+def _is_usage_chunk(event: bytes) -> bool:
+    """Whether an SSE event is the `choices: []` chunk carrying only usage."""
+    if b'"usage"' not in event:
+        return False
+    data = b"\n".join(
+        line[5:].strip()
+        for line in event.splitlines()
+        if line.startswith(b"data:")
+    )
+    try:
+        chunk = json.loads(data)
+    except ValueError:
+        return False
+    return (
+        isinstance(chunk, dict)
+        and chunk.get("choices") == []
+        and isinstance(chunk.get("usage"), dict)
+    )
+
+
+async def _without_usage_chunk(
+    body: AsyncIterator[bytes],
+) -> AsyncGenerator[bytes, None]:
+    # The chunk was only requested for logging; clients that did not ask for
+    # it may index choices[0] of every chunk
+    splitter = SSEEventSplitter()
+    async for chunk in body:
+        events = [e for e in splitter.feed(chunk) if not _is_usage_chunk(e)]
+        if events:
+            yield b"".join(events)
+    tail = splitter.close()
+    if tail and not _is_usage_chunk(tail):
+        yield tail
+
+
+def _response_from_upstream(
+    response: httpx.Response, headers: Dict[str, str] | None = None
+) -> Response:
     return Response(
         content=response.content,
         status_code=response.status_code,
         media_type=response.headers.get("content-type"),
+        headers=headers,
+    )
+
+
+def _response_from_cache(
+    entry: Dict[str, Any],
+    payload: LazyJSONObject,
+    *,
+    endpoint: str,
+    status: str = "HIT",
+) -> Response | StreamingResponse:
+    if not payload.get("stream"):
+        return Response(
+            content=entry["content"],
+            status_code=200,
+            media_type=entry["media_type"],
+            headers={"X-Cache": status},
+        )
+    body = json.loads(entry["content"])
+    if endpoint == "/responses":
+        events = response_to_sse(body)
+    else:
+        stream_options = payload.get("stream_options")
+        include_usage = isinstance(stream_options, dict) and bool(
+            stream_options.get("include_usage")
+        )
+        events = chat_completion_to_sse(body, include_usage=include_usage)
+    return StreamingResponse(
+        iter(events),
+        media_type="text/event-stream",
+        headers={**SSE_HEADERS, "X-Cache": status},
     )
 
 
+def _request_error_status(exc: httpx.RequestError) -> int:
+    # An open circuit is a known outage, not a bad gateway answer
+    return 503 if isinstance(exc, CircuitOpenError) else 502
+
+
 def _extract_usage(
     response: httpx.Response,
 ) -> Tuple[dict | None, str | None, str | None]:
@@ -109,28 +375,103 @@ def _extract_usage(
     return usage, provider_response_id, finish_reason
 
 
+async def _with_conversation(
+    store: ConversationStore, user: dict, payload: LazyJSONObject
+) -> Tuple[LazyJSONObject, ConversationTurn | None]:
+    """Expand `previous_response_id` into the stored conversation items.
+
+    Upstreams are stateless, so the full history is sent to them while the
+    client only uploads the new turn.
+    """
+    previous_response_id = payload.get("previous_response_id")
+    if previous_response_id is not None and not isinstance(previous_response_id, str):
+        raise ConversationNotFoundError("previous_response_id must be a string")
+    items = input_items(payload.get("input"))
+    if previous_response_id is not None:
+        history = await store.expand(user.get("_id"), previous_response_id)
+        payload = payload.with_fields(
+            {"input": history + items}, remove=["previous_response_id"]
+        )
+    if payload.get("store") is False:
+        return payload, None
+    return payload, store.turn(user.get("_id"), previous_response_id, items)
+
+
+# (content, media_type, provider_response_id, finish_reason) of a completed
+# non-stream answer
+Remember = Callable[[bytes, str | None, str | None, str | None], None]
+
+
+def _remember_semantic(
+    cache: SemanticCache,
+    query: SemanticQuery,
+    content: bytes,
+    media_type: str | None,
+    provider_response_id: str | None,
+    finish_reason: str | None,
+) -> None:
+    # Truncated answers and tool calls are not worth replaying
+    if finish_reason == "stop":
+        cache.set(
+            query,
+            content,
+            media_type,
+            provider_response_id=provider_response_id,
+            finish_reason=finish_reason,
+        )
+
+
+def _response_output(response: httpx.Response) -> Any:
+    try:
+        return response.json().get("output")
+    except Exception:
+        return None
+
+
+def _body_output(body: List[bytes]) -> Any:
+    try:
+        return json.loads(b"".join(body)).get("output")
+    except Exception:
+        return None
+
+
 async def _handle_non_stream(
     *,
     openrouter_proxy: OpenRouterProxy,
     mongodb_client: MongoDBConnector,
     endpoint: str,
     job_id: str,
-    payload: Dict[str, Any],
+    payload: LazyJSONObject,
+    response_cache: ResponseCache | None = None,
+    cache_key: str | None = None,
+    dedupe_key: str | None = None,
+    hedge_user: Any = None,
+    turn: ConversationTurn | None = None,
+    remember: Remember | None = None,
 ) -> JSONResponse | Response:
     start_time = time.perf_counter()
     try:
-        response = await openrouter_proxy.post(endpoint, payload)
+        response = await openrouter_proxy.post(
+            endpoint,
+            payload.raw,
+            dedupe_key=dedupe_key,
+            model=payload.get("model"),
+            hedge_user=hedge_user,
+        )
     except httpx.RequestError as exc:
         latency_ms = int((time.perf_counter() - start_time) * 1000)
         await mongodb_client.update_llm_request(
             job_id,
             {
-                "status_code": 502,
+                "status_code": _request_error_status(exc),
                 "latency_ms": latency_ms,
                 "error": str(exc),
             },
         )
-        return JSONResponse(status_code=502, content=_simple_error_payload(str(exc)))
+        return JSONResponse(
+            status_code=_request_error_status(exc),
+            content=_simple_error_payload(str(exc)),
+        )
 
     latency_ms = int((time.perf_counter() - start_time) * 1000)
     status_code = response.status_code
@@ -140,6 +481,7 @@ async def _handle_non_stream(
             {
                 "status_code": status_code,
                 "latency_ms": latency_ms,
+                "provider": OpenRouterProxy.upstream_name(response),
                 "error": response.text,
             },
         )
@@ -151,24 +493,51 @@ async def _handle_non_stream(
         {
             "status_code": status_code,
             "latency_ms": latency_ms,
+            "provider": OpenRouterProxy.upstream_name(response),
+            "hedged": OpenRouterProxy.was_hedged(response),
             "usage": usage,
             "provider_response_id": provider_response_id,
             "finish_reason": finish_reason,
         },
     )
-    return _response_from_upstream(response)
+    if turn is not None:
+        turn.complete(provider_response_id, _response_output(response))
+    if remember is not None and status_code == 200:
+        remember(
+            response.content,
+            response.headers.get("content-type"),
+            provider_response_id,
+            finish_reason,
+        )
+    if cache_key is None:
+        return _response_from_upstream(response)
+    if status_code == 200 and "application/json" in response.headers.get(
+        "content-type", ""
+    ):
+        response_cache.set(
+            cache_key,
+            response.content,
+            response.headers.get("content-type"),
+            provider_response_id=provider_response_id,
+            finish_reason=finish_reason,
+        )
+    return _response_from_upstream(response, headers={"X-Cache": "MISS"})
 
 
-async def _handle_stream(
+async def _open_upstream_stream(
     *,
     openrouter_proxy: OpenRouterProxy,
     mongodb_client: MongoDBConnector,
     endpoint: str,
     job_id: str,
-    payload: Dict[str, Any],
-) -> JSONResponse | Response | StreamingResponse:
-    start_time = time.perf_counter()
-    stream_cm = openrouter_proxy.stream(endpoint, payload)
+    payload: LazyJSONObject,
+    start_time: float,
+    hedge_user: Any = None,
+) -> Tuple[Any, httpx.Response | None, JSONResponse | Response | None]:
+    """Open an upstream stream, or log the failure and return the error."""
+    stream_cm = openrouter_proxy.stream(
+        endpoint, payload.raw, model=payload.get("model"), hedge_user=hedge_user
+    )
     try:
         response = await stream_cm.__aenter__()
     except httpx.RequestError as exc:
@@ -176,69 +545,361 @@ async def _handle_stream(
         await mongodb_client.update_llm_request(
             job_id,
             {
-                "status_code": 502,
+                "status_code": _request_error_status(exc),
                 "latency_ms": latency_ms,
                 "error": str(exc),
             },
         )
-        return JSONResponse(status_code=502, content=_simple_error_payload(str(exc)))
+        return (
+            None,
+            None,
+            JSONResponse(
+                status_code=_request_error_status(exc),
+                content=_simple_error_payload(str(exc)),
+            ),
+        )
 
     status_code = response.status_code
     if status_code >= 400:
-        await stream_cm.__aexit__(None, None, None)
+        # Error bodies are small: read them before releasing the connection
+        try:
+            await response.aread()
+        finally:
+            await stream_cm.__aexit__(None, None, None)
         latency_ms = int((time.perf_counter() - start_time) * 1000)
         await mongodb_client.update_llm_request(
             job_id,
             {
                 "status_code": status_code,
                 "latency_ms": latency_ms,
+                "provider": OpenRouterProxy.upstream_name(response),
                 "error": response.text,
             },
         )
-        return _response_from_upstream(response)
+        return None, None, _response_from_upstream(response)
+    return stream_cm, response, None
+
+
+async def _handle_non_stream_passthrough(
+    *,
+    openrouter_proxy: OpenRouterProxy,
+    mongodb_client: MongoDBConnector,
+    endpoint: str,
+    job_id: str,
+    payload: LazyJSONObject,
+    hedge_user: Any = None,
+    turn: ConversationTurn | None = None,
+    remember: Remember | None = None,
+) -> JSONResponse | Response | StreamingResponse:
+    # The body is forwarded as it arrives; usage and ids are picked up on the
+    # way by an incremental scanner instead of buffering and re-parsing it.
+    start_time = time.perf_counter()
+    stream_cm, response, error_response = await _open_upstream_stream(
+        openrouter_proxy=openrouter_proxy,
+        mongodb_client=mongodb_client,
+        endpoint=endpoint,
+        job_id=job_id,
+        payload=payload,
+        start_time=start_time,
+        hedge_user=hedge_user,
+    )
+    if error_response is not None:
+        return error_response
+
+    status_code = response.status_code
+    provider = OpenRouterProxy.upstream_name(response)
+    content_type = response.headers.get("content-type")
+    scan = "application/json" in (content_type or "")
+
+    async def body_stream() -> AsyncGenerator[bytes, None]:
+        error: str | None = None
+        scanner = JSONUsageScanner()
+        # Only kept to record a conversation turn or a semantic cache entry
+        keep_body = scan and (turn is not None or remember is not None)
+        body: List[bytes] | None = [] if keep_body else None
+        cancelled = False
+        try:
+            async for chunk in response.aiter_bytes():
+                if scan:
+                    scanner.feed(chunk)
+                if body is not None:
+                    body.append(chunk)
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            cancelled = True
+            raise
+        except Exception as exc:
+            error = str(exc)
+            raise
+        finally:
+            await stream_cm.__aexit__(None, None, None)
+            scanner.close()
+            update = _body_update(
+                scanner,
+                status_code=status_code,
+                provider=provider,
+                start_time=start_time,
+                cancelled=cancelled,
+                error=error,
+            )
+            update["hedged"] = OpenRouterProxy.was_hedged(response)
+            if "error" not in update and body is not None:
+                _keep_body(body, scanner, status_code, content_type, turn, remember)
+            await mongodb_client.update_llm_request(job_id, update)
+
+    return CancellableStreamingResponse(
+        body_stream(), status_code=status_code, media_type=content_type
+    )
+
+
+async def _handle_stream(
+    *,
+    openrouter_proxy: OpenRouterProxy,
+    mongodb_client: MongoDBConnector,
+    endpoint: str,
+    job_id: str,
+    payload: LazyJSONObject,
+    turn: ConversationTurn | None = None,
+    stream_replay: StreamReplay | None = None,
+    user_id: Any = None,
+    sse_coalescer: SSECoalescer | None = None,
+    hide_usage_chunk: bool = False,
+) -> JSONResponse | Response | StreamingResponse:
+    start_time = time.perf_counter()
+    stream_cm, response, error_response = await _open_upstream_stream(
+        openrouter_proxy=openrouter_proxy,
+        mongodb_client=mongodb_client,
+        endpoint=endpoint,
+        job_id=job_id,
+        payload=payload,
+        start_time=start_time,
+    )
+    if error_response is not None:
+        return error_response
+
+    status_code = response.status_code
+    provider = OpenRouterProxy.upstream_name(response)
 
     async def event_stream() -> AsyncGenerator[bytes, None]:
         error: str | None = None
+        parser = SSEUsageParser()
+        cancelled = False
         try:
             async for chunk in response.aiter_bytes():
+                parser.feed(chunk)
                 yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            cancelled = True
+            raise
         except Exception as exc:
             error = str(exc)
             raise
         finally:
             await stream_cm.__aexit__(None, None, None)
-            latency_ms = int((time.perf_counter() - start_time) * 1000)
-            update = {
-                "status_code": status_code,
-                "latency_ms": latency_ms,
-                "usage": None,
-                "provider_response_id": None,
-                "finish_reason": None,
-            }
-            if error is not None:
-                update["error"] = error
+            parser.close()
+            update = _body_update(
+                parser,
+                status_code=status_code,
+                provider=provider,
+                start_time=start_time,
+                cancelled=cancelled,
+                error=error,
+            )
+            if "error" not in update and turn is not None:
+                turn.complete(parser.provider_response_id, parser.output)
             await mongodb_client.update_llm_request(job_id, update)
 
-    return StreamingResponse(
-        event_stream(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        },
+    body: AsyncIterator[bytes] = event_stream()
+    if hide_usage_chunk:
+        body = _without_usage_chunk(body)
+    headers = SSE_HEADERS
+    if stream_replay is not None:
+        # Read in the background: a client that drops can resume the job
+        job = stream_replay.start(job_id, user_id, body)
+        body = stream_replay.follow(job)
+        headers = {**SSE_HEADERS, "X-Job-Id": job_id}
+    if sse_coalescer is not None:
+        body = sse_coalescer.wrap(body)
+    return CancellableStreamingResponse(
+        body, media_type="text/event-stream", headers=headers
+    )
+
+
+def _body_update(
+    reader: JSONUsageScanner | SSEUsageParser,
+    *,
+    status_code: int,
+    provider: str | None,
+    start_time: float,
+    cancelled: bool,
+    error: str | None,
+) -> Dict[str, Any]:
+    """Log update once a forwarded body has ended, was cut or failed."""
+    update = {
+        "status_code": CLIENT_CLOSED_REQUEST if cancelled else status_code,
+        "latency_ms": int((time.perf_counter() - start_time) * 1000),
+        "provider": provider,
+        "usage": reader.usage,
+        "provider_response_id": reader.provider_response_id,
+        "finish_reason": reader.finish_reason,
+    }
+    if cancelled:
+        update["error"] = CLIENT_CANCELLED
+    elif error is not None:
+        update["error"] = error
+    return update
+
+
+def _keep_body(
+    body: List[bytes],
+    scanner: JSONUsageScanner,
+    status_code: int,
+    content_type: str | None,
+    turn: ConversationTurn | None,
+    remember: Remember | None,
+) -> None:
+    """Record a fully forwarded body as a conversation turn or cache entry."""
+    if turn is not None:
+        turn.complete(scanner.provider_response_id, _body_output(body))
+    if remember is not None and status_code == 200:
+        remember(
+            b"".join(body),
+            content_type,
+            scanner.provider_response_id,
+            scanner.finish_reason,
+        )
+
+
+def _add_background(response: Response, func: Callable[[], Any]) -> None:
+    if response.background is None:
+        response.background = BackgroundTask(func)
+        return
+    if not isinstance(response.background, BackgroundTasks):
+        response.background = BackgroundTasks([response.background])
+    response.background.add_task(func)
+
+
+def _release_after_response(response: Response, ticket: AdmissionTicket) -> None:
+    """Hold the admission slot until the response has been fully sent."""
+    if isinstance(response, StreamingResponse):
+        response.body_iterator = _release_after(response.body_iterator, ticket)
+    # Also covers a stream that is never iterated; release is idempotent
+    _add_background(response, ticket.release)
+
+
+async def _release_after(
+    body: AsyncIterator[bytes], ticket: AdmissionTicket
+) -> AsyncGenerator[bytes, None]:
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        ticket.release()
+
+
+async def _idempotent_response(outcome: IdempotencyOutcome) -> Response:
+    if outcome.kind == "mismatch":
+        return JSONResponse(
+            status_code=422,
+            content=_simple_error_payload(
+                "Idempotency-Key was already used with a different request body"
+            ),
+        )
+    entry = outcome.entry
+    if outcome.kind == "join":
+        entry = await asyncio.shield(outcome.future)
+    if entry is None or outcome.kind == "conflict":
+        return JSONResponse(
+            status_code=409,
+            content=_simple_error_payload(
+                "A request with this Idempotency-Key is in progress or failed; "
+                "retry later"
+            ),
+        )
+    return Response(
+        content=entry["content"],
+        status_code=entry["status_code"],
+        media_type=entry["media_type"],
+        headers={"Idempotent-Replayed": "true"},
     )
 
 
+def _remember_response(
+    response: Response, store: IdempotencyStore, key: str, job_id: str
+) -> None:
+    """Record the response sent for a new Idempotency-Key."""
+
+    def entry(content: bytes) -> Dict[str, Any]:
+        return {
+            "content": content,
+            "status_code": response.status_code,
+            "media_type": response.media_type,
+            "job_id": job_id,
+        }
+
+    if not isinstance(response, StreamingResponse):
+        store.complete(key, entry(response.body))
+        return
+    recorder = _StreamRecorder(store, key, entry)
+    response.body_iterator = recorder.record(response.body_iterator)
+    _add_background(response, recorder.abandon)
+
+
+class _StreamRecorder:
+    """Completes an Idempotency-Key once its streamed body was fully sent."""
+
+    def __init__(
+        self,
+        store: IdempotencyStore,
+        key: str,
+        entry: Callable[[bytes], Dict[str, Any]],
+    ) -> None:
+        self.store = store
+        self.key = key
+        self.entry = entry
+        self.finished = False
+
+    def abandon(self) -> None:
+        if not self.finished:
+            self.finished = True
+            self.store.fail(self.key)
+
+    async def record(self, body: AsyncIterator[bytes]) -> AsyncGenerator[bytes, None]:
+        parts: List[bytes] = []
+        size = 0
+        try:
+            async for chunk in body:
+                if size <= self.store.max_entry_bytes:
+                    size += len(chunk)
+                    parts.append(chunk)
+                yield chunk
+        except BaseException:
+            # Client gone or upstream failed: let a retry run again
+            self.abandon()
+            raise
+        if size > self.store.max_entry_bytes:
+            self.abandon()
+        elif not self.finished:
+            self.finished = True
+            self.store.complete(self.key, self.entry(b"".join(parts)))
+
+
 async def proxy_openrouter_request(
     *,
     request: Request,
-    fallback_body: Dict[str, Any],
     openrouter_proxy: OpenRouterProxy,
     mongodb_client: MongoDBConnector,
     user: dict,
     endpoint: str,
     operation: str,
+    response_cache: ResponseCache | None = None,
+    admission_controller: AdmissionController | None = None,
+    idempotency_store: IdempotencyStore | None = None,
+    conversation_store: ConversationStore | None = None,
+    semantic_cache: SemanticCache | None = None,
+    context_guard: ContextGuard | None = None,
+    stream_replay: StreamReplay | None = None,
+    sse_coalescer: SSECoalescer | None = None,
 ) -> JSONResponse | Response | StreamingResponse:
     if not openrouter_proxy.is_configured():
         return JSONResponse(
@@ -246,7 +907,7 @@ async def proxy_openrouter_request(
             content=_simple_error_payload("OpenRouter client not configured"),
         )
 
-    payload, error_response, meta = await _read_payload(request, fallback_body)
+    payload, error_response, meta = await _read_payload(request)
     if error_response is not None:
         return error_response
     if payload is None:
@@ -256,6 +917,21 @@ async def proxy_openrouter_request(
         )
 
     job_id = str(uuid.uuid4())
+    idempotency_key = request.headers.get("idempotency-key")
+    scoped_key = None
+    if idempotency_store is not None and idempotency_key:
+        scoped_key = idempotency_store.scoped_key(
+            user.get("_id"), endpoint, idempotency_key
+        )
+        outcome = await idempotency_store.begin(
+            scoped_key,
+            request_hash=meta["request_hash"],
+            stream=bool(payload.get("stream")),
+            job_id=job_id,
+        )
+        if outcome.kind != "new":
+            return await _idempotent_response(outcome)
+
     await mongodb_client.log_llm_request(
         _build_log_doc(
             user=user,
@@ -264,22 +940,306 @@ async def proxy_openrouter_request(
             meta=meta,
             operation=operation,
             endpoint=endpoint,
+            idempotency_key=idempotency_key,
+        )
+    )
+
+    try:
+        # Nothing is sent before the upstream answers: a client leaving in the
+        # meantime cancels the call instead of paying for the generation
+        response = await _unless_disconnected(
+            request,
+            _serve(
+                request=request,
+                openrouter_proxy=openrouter_proxy,
+                mongodb_client=mongodb_client,
+                user=user,
+                endpoint=endpoint,
+                job_id=job_id,
+                payload=payload,
+                meta=meta,
+                response_cache=response_cache,
+                admission_controller=admission_controller,
+                conversation_store=conversation_store,
+                semantic_cache=semantic_cache,
+                context_guard=context_guard,
+                stream_replay=_resumable(request, stream_replay),
+                sse_coalescer=sse_coalescer,
+            ),
+        )
+    except BaseException as exc:
+        if scoped_key is not None:
+            idempotency_store.fail(scoped_key)
+        if not isinstance(exc, ClientDisconnectedError):
+            raise
+        await mongodb_client.update_llm_request(
+            job_id,
+            {"status_code": CLIENT_CLOSED_REQUEST, "error": CLIENT_CANCELLED},
+        )
+        # Never delivered; only keeps the ASGI exchange well-formed
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    if scoped_key is not None:
+        _remember_response(response, idempotency_store, scoped_key, job_id)
+    return response
+
+
+async def _serve(
+    *,
+    request: Request,
+    openrouter_proxy: OpenRouterProxy,
+    mongodb_client: MongoDBConnector,
+    user: dict,
+    endpoint: str,
+    job_id: str,
+    payload: LazyJSONObject,
+    meta: Dict[str, Any],
+    response_cache: ResponseCache | None,
+    admission_controller: AdmissionController | None,
+    conversation_store: ConversationStore | None,
+    semantic_cache: SemanticCache | None,
+    context_guard: ContextGuard | None,
+    stream_replay: StreamReplay | None = None,
+    sse_coalescer: SSECoalescer | None = None,
+) -> JSONResponse | Response | StreamingResponse:
+    turn = None
+    if conversation_store is not None and endpoint == "/responses":
+        payload, turn, rejected = await _expand_conversation(
+            conversation_store, mongodb_client, job_id, user, payload
+        )
+        if rejected is not None:
+            return rejected
+
+    if context_guard is not None:
+        rejected = await _check_context(context_guard, mongodb_client, job_id, payload)
+        if rejected is not None:
+            return rejected
+
+    deterministic = ResponseCache.is_cacheable(payload, request.headers)
+    cache_key = None
+    if response_cache is not None and deterministic:
+        cache_key = response_cache.make_key(user.get("_id"), endpoint, payload)
+        cached_response = await _from_response_cache(
+            response_cache, cache_key, mongodb_client, job_id, payload, endpoint
+        )
+        if cached_response is not None:
+            return cached_response
+
+    semantic_query = None
+    if semantic_cache is not None and endpoint == "/chat/completions":
+        semantic_query = semantic_cache.query(user.get("_id"), payload)
+    remember = None
+    if semantic_query is not None:
+        cached_response = await _from_semantic_cache(
+            semantic_cache, semantic_query, mongodb_client, job_id, payload, endpoint
+        )
+        if cached_response is not None:
+            return cached_response
+        remember = functools.partial(_remember_semantic, semantic_cache, semantic_query)
+
+    forward = functools.partial(
+        _forward_upstream,
+        openrouter_proxy=openrouter_proxy,
+        mongodb_client=mongodb_client,
+        user=user,
+        endpoint=endpoint,
+        job_id=job_id,
+        payload=payload,
+        meta=meta,
+        deterministic=deterministic,
+        response_cache=response_cache,
+        cache_key=cache_key,
+        turn=turn,
+        stream_replay=stream_replay,
+        sse_coalescer=sse_coalescer,
+        remember=remember,
+    )
+    return await _forward_admitted(
+        forward, admission_controller, mongodb_client, job_id, user
+    )
+
+
+async def _expand_conversation(
+    conversation_store: ConversationStore,
+    mongodb_client: MongoDBConnector,
+    job_id: str,
+    user: dict,
+    payload: LazyJSONObject,
+) -> Tuple[LazyJSONObject, ConversationTurn | None, JSONResponse | None]:
+    """The payload with its history, or a 400 for an unknown response id."""
+    try:
+        payload, turn = await _with_conversation(conversation_store, user, payload)
+    except ConversationNotFoundError as exc:
+        await mongodb_client.update_llm_request(
+            job_id, {"status_code": 400, "error": str(exc)}
+        )
+        return (
+            payload,
+            None,
+            JSONResponse(status_code=400, content=_simple_error_payload(str(exc))),
         )
+    return payload, turn, None
+
+
+async def _check_context(
+    context_guard: ContextGuard,
+    mongodb_client: MongoDBConnector,
+    job_id: str,
+    payload: LazyJSONObject,
+) -> JSONResponse | None:
+    """Log the prompt estimate; a 400 when it cannot fit the model."""
+    estimate = context_guard.estimate(payload)
+    reason = context_guard.check(payload.get("model"), estimate)
+    update = {"estimated_prompt_tokens": estimate.prompt_tokens}
+    if reason is not None:
+        await mongodb_client.update_llm_request(
+            job_id, {**update, "status_code": 400, "error": reason}
+        )
+        return JSONResponse(status_code=400, content=_simple_error_payload(reason))
+    await mongodb_client.update_llm_request(job_id, update)
+    return None
+
+
+async def _from_response_cache(
+    response_cache: ResponseCache,
+    cache_key: str,
+    mongodb_client: MongoDBConnector,
+    job_id: str,
+    payload: LazyJSONObject,
+    endpoint: str,
+) -> Response | None:
+    start_time = time.perf_counter()
+    cached = await response_cache.get(cache_key)
+    if cached is None:
+        return None
+    await mongodb_client.update_llm_request(
+        job_id,
+        {
+            "status_code": 200,
+            "latency_ms": int((time.perf_counter() - start_time) * 1000),
+            "provider_response_id": cached["provider_response_id"],
+            "finish_reason": cached["finish_reason"],
+            "cache_hit": True,
+        },
+    )
+    return _response_from_cache(cached, payload, endpoint=endpoint)
+
+
+async def _from_semantic_cache(
+    semantic_cache: SemanticCache,
+    semantic_query: SemanticQuery,
+    mongodb_client: MongoDBConnector,
+    job_id: str,
+    payload: LazyJSONObject,
+    endpoint: str,
+) -> Response | None:
+    start_time = time.perf_counter()
+    cached = await semantic_cache.get(semantic_query)
+    if cached is None:
+        return None
+    await mongodb_client.update_llm_request(
+        job_id,
+        {
+            "status_code": 200,
+            "latency_ms": int((time.perf_counter() - start_time) * 1000),
+            "provider_response_id": cached["provider_response_id"],
+            "finish_reason": cached["finish_reason"],
+            "cache_hit": True,
+            "semantic_similarity": cached["similarity"],
+        },
     )
+    return _response_from_cache(cached, payload, endpoint=endpoint, status="SEMANTIC")
+
+
+async def _forward_admitted(
+    forward: Callable[[], Awaitable[Response]],
+    admission_controller: AdmissionController | None,
+    mongodb_client: MongoDBConnector,
+    job_id: str,
+    user: dict,
+) -> Response:
+    """Run `forward` holding an admission slot until the response is sent."""
+    if admission_controller is None:
+        return await forward()
+    try:
+        ticket = await admission_controller.acquire(user.get("_id"))
+    except AdmissionRejectedError as exc:
+        await mongodb_client.update_llm_request(
+            job_id, {"status_code": 429, "error": exc.reason}
+        )
+        return JSONResponse(
+            status_code=429,
+            content=_simple_error_payload(exc.reason),
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    await mongodb_client.update_llm_request(job_id, {"queue_wait_ms": ticket.wait_ms})
+    try:
+        response = await forward()
+    except BaseException:
+        ticket.release()
+        raise
+    _release_after_response(response, ticket)
+    return response
+
 
+async def _forward_upstream(
+    *,
+    openrouter_proxy: OpenRouterProxy,
+    mongodb_client: MongoDBConnector,
+    user: dict,
+    endpoint: str,
+    job_id: str,
+    payload: LazyJSONObject,
+    meta: Dict[str, Any],
+    deterministic: bool,
+    response_cache: ResponseCache | None,
+    cache_key: str | None,
+    turn: ConversationTurn | None = None,
+    remember: Remember | None = None,
+    stream_replay: StreamReplay | None = None,
+    sse_coalescer: SSECoalescer | None = None,
+) -> JSONResponse | Response | StreamingResponse:
     if payload.get("stream"):
+        hide_usage_chunk = False
+        if endpoint == "/chat/completions":
+            payload, hide_usage_chunk = _ensure_stream_usage(payload)
         return await _handle_stream(
             openrouter_proxy=openrouter_proxy,
             mongodb_client=mongodb_client,
             endpoint=endpoint,
             job_id=job_id,
             payload=payload,
+            turn=turn,
+            stream_replay=stream_replay,
+            user_id=user.get("_id"),
+            sse_coalescer=sse_coalescer,
+            hide_usage_chunk=hide_usage_chunk,
+        )
+
+    if not deterministic:
+        return await _handle_non_stream_passthrough(
+            openrouter_proxy=openrouter_proxy,
+            mongodb_client=mongodb_client,
+            endpoint=endpoint,
+            job_id=job_id,
+            payload=payload,
+            hedge_user=user.get("_id"),
+            turn=turn,
+            remember=remember,
         )
 
+    # Deterministic answers are buffered so they can be cached and shared
     return await _handle_non_stream(
         openrouter_proxy=openrouter_proxy,
         mongodb_client=mongodb_client,
         endpoint=endpoint,
         job_id=job_id,
         payload=payload,
+        response_cache=response_cache,
+        cache_key=cache_key,
+        # Identical deterministic requests of one user share one upstream
+        # call; across users each pays for (and logs) its own usage
+        dedupe_key=f"{user.get('_id')}:{meta['request_hash']}",
+        hedge_user=user.get("_id"),
+        turn=turn,
+        remember=remember,
     )
@@ -7,5 +7,6 @@ class ResponsesRequest(BaseModel):
     model: str
     input: Any
     stream: Optional[bool] = None
+    previous_response_id: Optional[str] = None
 
     model_config = ConfigDict(extra="allow")
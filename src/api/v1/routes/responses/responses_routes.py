@@ -1,19 +1,57 @@
-from fastapi import APIRouter, Body, Depends, Request
-from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi import APIRouter, Depends, Request
 
-from api.classes import OpenRouterProxy
+from api.classes import (
+    AdmissionController,
+    ContextGuard,
+    ConversationStore,
+    IdempotencyStore,
+    OpenRouterProxy,
+    ResponseCache,
+    SSECoalescer,
+    StreamReplay,
+)
 from api.databases import MongoDBConnector
 from api.v1.security import (
     ensure_valid_api_key_or_token,
     get_current_user_with_api_key_or_token,
 )
-from api.v1.services import get_mongo_client, get_openrouter_proxy
+from api.v1.services import (
+    enforce_rate_limit,
+    get_admission_controller,
+    get_context_guard,
+    get_conversation_store,
+    get_idempotency_store,
+    get_mongo_client,
+    get_openrouter_proxy,
+    get_response_cache,
+    get_sse_coalescer,
+    get_stream_replay,
+)
 
-from ..llm_proxy import proxy_openrouter_request
+from ..llm_proxy import openapi_request_body, proxy_openrouter_request
 from .responses_models import ResponsesRequest
 
 router = APIRouter()
 
+RESPONSES_EXAMPLES = {
+    "non_stream": {
+        "summary": "Standard request (JSON)",
+        "value": {
+            "model": "openai/gpt-4.1-mini",
+            "input": "Hello!",
+            "stream": False,
+        },
+    },
+    "stream": {
+        "summary": "Streaming request (SSE)",
+        "value": {
+            "model": "openai/gpt-4.1-mini",
+            "input": "Hello!",
+            "stream": True,
+        },
+    },
+}
+
 
 @router.post(
     "",
@@ -23,43 +61,51 @@ router = APIRouter()
     - When `stream` = `false` (default), returns a `response` object.
     - When `stream` = `true`, returns a SSE stream where each `data:` contains
       a serialized response event.
+    - Streams carry SSE `id:` fields and an `X-Job-Id` header; a client that
+      drops can resume with `GET /v1/streams/{job_id}` and `Last-Event-ID`.
+    - Deterministic requests (`temperature` = 0 or `X-Cache: allow`) are served
+      from the response cache when it is enabled.
+    - Requests estimated not to fit in the model context window are rejected
+      with a 400 before reaching the upstream.
+    - With an `Idempotency-Key` header, a retried request gets the stored
+      result (or waits for the running call) instead of a new generation.
+    - With `previous_response_id`, only the new `input` items need to be sent:
+      the earlier turns are restored from the conversation store.
     """,
     response_model=None,
-    dependencies=[Depends(ensure_valid_api_key_or_token)],
+    dependencies=[
+        Depends(ensure_valid_api_key_or_token),
+        Depends(enforce_rate_limit),
+    ],
+    openapi_extra=openapi_request_body(ResponsesRequest, RESPONSES_EXAMPLES),
 )
 async def create_response(
     request: Request,
-    responses_request: ResponsesRequest = Body(
-        ...,
-        examples={
-            "non_stream": {
-                "summary": "Standard request (JSON)",
-                "value": {
-                    "model": "openai/gpt-4.1-mini",
-                    "input": "Hello!",
-                    "stream": False,
-                },
-            },
-            "stream": {
-                "summary": "Streaming request (SSE)",
-                "value": {
-                    "model": "openai/gpt-4.1-mini",
-                    "input": "Hello!",
-                    "stream": True,
-                },
-            },
-        },
-    ),
     openrouter_proxy: OpenRouterProxy = Depends(get_openrouter_proxy),
     user: dict = Depends(get_current_user_with_api_key_or_token),
     mongodb_client: MongoDBConnector = Depends(get_mongo_client),
+    response_cache: ResponseCache | None = Depends(get_response_cache),
+    admission_controller: AdmissionController | None = Depends(
+        get_admission_controller
+    ),
+    idempotency_store: IdempotencyStore | None = Depends(get_idempotency_store),
+    context_guard: ContextGuard | None = Depends(get_context_guard),
+    stream_replay: StreamReplay | None = Depends(get_stream_replay),
+    sse_coalescer: SSECoalescer | None = Depends(get_sse_coalescer),
+    conversation_store: ConversationStore | None = Depends(get_conversation_store),
 ):
     return await proxy_openrouter_request(
         request=request,
-        fallback_body=responses_request.model_dump(exclude_none=True),
         openrouter_proxy=openrouter_proxy,
         mongodb_client=mongodb_client,
         user=user,
         endpoint="/responses",
         operation="responses",
+        response_cache=response_cache,
+        admission_controller=admission_controller,
+        idempotency_store=idempotency_store,
+        context_guard=context_guard,
+        stream_replay=stream_replay,
+        sse_coalescer=sse_coalescer,
+        conversation_store=conversation_store,
     )
@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from api.classes import SSECoalescer, StreamReplay
+from api.v1.security import (
+    ensure_valid_api_key_or_token,
+    get_current_user_with_api_key_or_token,
+)
+from api.v1.services import get_sse_coalescer, get_stream_replay
+
+from ..llm_proxy import SSE_HEADERS, CancellableStreamingResponse
+
+router = APIRouter(dependencies=[Depends(ensure_valid_api_key_or_token)])
+
+
+@router.get(
+    "/{job_id}",
+    summary="Resume a stream",
+    description="""Reattach to a streamed chat completion or response.
+
+    - `job_id` is the `X-Job-Id` header of the original stream, which must
+      have been sent with `X-Stream-Resumable: true`.
+    - Events after `Last-Event-ID` are replayed, then the live ones follow
+      while the generation is still running; without the header the stream
+      is replayed from the start.
+    - 404 once the job has expired, 410 when the missed events were already
+      dropped from the replay buffer.
+    """,
+    response_model=None,
+)
+async def resume_stream(
+    job_id: str,
+    last_event_id: str | None = Header(None),
+    stream_replay: StreamReplay | None = Depends(get_stream_replay),
+    sse_coalescer: SSECoalescer | None = Depends(get_sse_coalescer),
+    user: dict = Depends(get_current_user_with_api_key_or_token),
+):
+    if stream_replay is None:
+        raise HTTPException(status_code=503, detail="Stream replay is disabled")
+    job = stream_replay.get(job_id, user["_id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    try:
+        after = int(last_event_id) if last_event_id else -1
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID") from None
+    if not job.can_replay(after):
+        raise HTTPException(status_code=410, detail="Missed events are gone")
+    body = stream_replay.follow(job, after)
+    if sse_coalescer is not None:
+        body = sse_coalescer.wrap(body)
+    return CancellableStreamingResponse(
+        body,
+        media_type="text/event-stream",
+        headers={**SSE_HEADERS, "X-Job-Id": job_id},
+    )
@@ -7,6 +7,7 @@ from fastapi import APIRouter, Depends, HTTPException
 
 from api.classes import Embeddings
 from api.classes.embeddings import EMBEDDING_MODELS
+from api.classes.semantic_cache import SEMANTIC_CACHE_COLLECTION
 from api.databases import MongoDBConnector, QdrantConnector
 from api.utils import CustomLogger
 from api.v1.security import (
@@ -47,6 +48,10 @@ async def create_vector_store(
     mongo: MongoDBConnector = Depends(get_mongo_client),
     user: dict = Depends(get_current_user_with_api_key_or_token),
 ):
+    # The semantic cache lives in a Qdrant collection of its own
+    if body.name == SEMANTIC_CACHE_COLLECTION:
+        raise HTTPException(status_code=400, detail="Vector store name is reserved")
+
     # Check logical existence on MongoDB
     existing = await mongo.find_one(
         "vector_db_collections",
@@ -1,17 +1,44 @@
 from .check import check_collection_non_existence, check_collection_ownership
 from .get_classes import (
+    get_admission_controller,
+    get_batch_runner,
+    get_context_guard,
+    get_conversation_store,
+    get_embedding_jobs,
     get_embeddings,
+    get_file_store,
+    get_idempotency_store,
     get_models,
     get_openrouter_proxy,
+    get_response_cache,
+    get_semantic_cache,
+    get_sse_coalescer,
+    get_stream_replay,
 )
 from .get_databases import get_mongo_client, get_qdrant_client
+from .rate_limit import RateLimitHeadersMiddleware, enforce_rate_limit
+from .request_body import read_json_body
 
 __all__ = [
     "get_mongo_client",
     "get_qdrant_client",
     "get_embeddings",
+    "get_embedding_jobs",
     "get_openrouter_proxy",
     "get_models",
+    "get_response_cache",
+    "get_semantic_cache",
+    "get_admission_controller",
+    "get_idempotency_store",
+    "get_conversation_store",
+    "get_context_guard",
+    "get_file_store",
+    "get_batch_runner",
+    "get_stream_replay",
+    "get_sse_coalescer",
+    "enforce_rate_limit",
+    "RateLimitHeadersMiddleware",
+    "read_json_body",
     "check_collection_ownership",
     "check_collection_non_existence",
 ]
@@ -1,13 +1,99 @@
-from api.classes import Embeddings, Models, OpenRouterProxy
+from typing import Optional
 
+from fastapi import Request
 
-def get_embeddings() -> Embeddings:
-    return Embeddings()
+from api.classes import (
+    AdmissionController,
+    BatchRunner,
+    ContextGuard,
+    ConversationStore,
+    EmbeddingJobs,
+    Embeddings,
+    FileStore,
+    IdempotencyStore,
+    Models,
+    OpenRouterProxy,
+    ResponseCache,
+    SemanticCache,
+    SSECoalescer,
+    StreamReplay,
+)
 
 
-def get_models() -> Models:
-    return Models()
+def get_embeddings(request: Request) -> Embeddings:
+    """Get the app-scoped Embeddings helper from request."""
+    embeddings = getattr(request.app, "embeddings", None)
+    if embeddings is None:
+        embeddings = request.app.embeddings = Embeddings()
+    return embeddings
 
 
-def get_openrouter_proxy() -> OpenRouterProxy:
-    return OpenRouterProxy()
+def get_models(request: Request) -> Models:
+    """Get the app-scoped Models client from request."""
+    models = getattr(request.app, "models_client", None)
+    if models is None:
+        models = request.app.models_client = Models()
+    return models
+
+
+def get_openrouter_proxy(request: Request) -> OpenRouterProxy:
+    """Get the app-scoped OpenRouter proxy from request."""
+    proxy = getattr(request.app, "openrouter_proxy", None)
+    if proxy is None:
+        proxy = request.app.openrouter_proxy = OpenRouterProxy()
+    return proxy
+
+
+def get_response_cache(request: Request) -> Optional[ResponseCache]:
+    """Get the app-scoped response cache from request, None when disabled."""
+    return getattr(request.app, "response_cache", None)
+
+
+def get_semantic_cache(request: Request) -> Optional[SemanticCache]:
+    """Get the app-scoped semantic cache from request, None when disabled."""
+    return getattr(request.app, "semantic_cache", None)
+
+
+def get_admission_controller(request: Request) -> Optional[AdmissionController]:
+    """Get the app-scoped admission controller from request, None when disabled."""
+    return getattr(request.app, "admission_controller", None)
+
+
+def get_idempotency_store(request: Request) -> Optional[IdempotencyStore]:
+    """Get the app-scoped Idempotency-Key store from request, None when disabled."""
+    return getattr(request.app, "idempotency_store", None)
+
+
+def get_conversation_store(request: Request) -> Optional[ConversationStore]:
+    """Get the app-scoped conversation store from request, None when disabled."""
+    return getattr(request.app, "conversation_store", None)
+
+
+def get_context_guard(request: Request) -> Optional[ContextGuard]:
+    """Get the app-scoped context-window guard from request, None when disabled."""
+    return getattr(request.app, "context_guard", None)
+
+
+def get_file_store(request: Request) -> Optional[FileStore]:
+    """Get the app-scoped file store from request."""
+    return getattr(request.app, "file_store", None)
+
+
+def get_batch_runner(request: Request) -> Optional[BatchRunner]:
+    """Get the app-scoped batch runner from request, None when disabled."""
+    return getattr(request.app, "batch_runner", None)
+
+
+def get_stream_replay(request: Request) -> Optional[StreamReplay]:
+    """Get the app-scoped stream replay buffers from request, None when disabled."""
+    return getattr(request.app, "stream_replay", None)
+
+
+def get_sse_coalescer(request: Request) -> Optional[SSECoalescer]:
+    """Get the app-scoped SSE write coalescer from request, None when disabled."""
+    return getattr(request.app, "sse_coalescer", None)
+
+
+def get_embedding_jobs(request: Request) -> Optional[EmbeddingJobs]:
+    """Get the app-scoped embedding batch jobs from request, None when disabled."""
+    return getattr(request.app, "embedding_jobs", None)
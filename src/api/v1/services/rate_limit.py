@@ -0,0 +1,83 @@
+import hashlib
+import math
+from typing import Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.utils import TokenEstimator
+from api.utils.token_estimator import BYTES_PER_TOKEN
+from api.v1.security import get_current_user_with_api_key_or_token
+
+from .request_body import read_json_body
+
+_estimator = TokenEstimator()
+
+
+async def _estimate_request(request: Request) -> Tuple[Optional[str], int]:
+    """Model and a rough token estimate (prompt estimate + output cap)."""
+    try:
+        payload = await read_json_body(request)
+    except ValueError:
+        return None, math.ceil(len(await request.body()) / BYTES_PER_TOKEN)
+    estimate = _estimator.estimate(payload)
+    tokens = estimate.prompt_tokens + (estimate.max_output_tokens or 0)
+    model = payload.get("model")
+    return (model if isinstance(model, str) else None), tokens
+
+
+async def enforce_rate_limit(
+    request: Request,
+    user: dict = Depends(get_current_user_with_api_key_or_token),
+) -> None:
+    """Charge the request to the API key, user and model buckets.
+
+    Only the routes that declare this dependency are limited: the chat,
+    responses and embeddings POST routes. The `X-RateLimit-*` headers are
+    stored on `request.state` and added to their response by
+    `RateLimitHeadersMiddleware`; a 429 carries them directly.
+    """
+    limiter = getattr(request.app, "rate_limiter", None)
+    if limiter is None:
+        return
+    model, tokens = await _estimate_request(request)
+    api_key = request.headers.get("X-ML-API-Key")
+    result = await limiter.check(
+        user_id=user.get("_id"),
+        api_key_id=(
+            hashlib.sha256(api_key.encode()).hexdigest()[:16] if api_key else None
+        ),
+        model=model,
+        tokens=tokens,
+    )
+    request.state.rate_limit_headers = result.headers
+    if not result.allowed:
+        raise HTTPException(
+            status_code=429, detail="Rate limit exceeded", headers=result.headers
+        )
+
+
+class RateLimitHeadersMiddleware:
+    """Add the headers left on `request.state` by `enforce_rate_limit`.
+
+    Plain ASGI: only the response start message is touched, so streamed
+    bodies pass through without an extra task or buffering per chunk.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = scope.get("state", {}).get("rate_limit_headers")
+                if headers:
+                    MutableHeaders(scope=message).update(headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
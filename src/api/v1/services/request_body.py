@@ -0,0 +1,17 @@
+from fastapi import Request
+
+from api.utils import LazyJSONObject
+
+
+async def read_json_body(request: Request) -> LazyJSONObject:
+    """The request body as a `LazyJSONObject`, parsed once per request.
+
+    The rate-limit dependency and the proxy routes both read it; the parsed
+    object is kept on `request.state`. Raises `InvalidJSONBodyError` (a
+    `ValueError`) when the body is not a JSON object.
+    """
+    payload = getattr(request.state, "json_body", None)
+    if payload is None:
+        payload = LazyJSONObject(await request.body())
+        request.state.json_body = payload
+    return payload
@@ -364,3 +364,28 @@ def test_app():
 @pytest.fixture()
 def client(test_app):
     return TestClient(test_app)
+
+
+@pytest.fixture()
+def mock_upstream(client):
+    """Route the OpenRouterProxy of `client` to an httpx MockTransport handler.
+
+    `mock_upstream(handler)` installs the proxy and returns it; the override
+    of `test_app` is put back after the test.
+    """
+    overrides = client.app.dependency_overrides
+    previous_override = overrides.get(_get_openrouter_proxy_dep)
+
+    def install(handler) -> OpenRouterProxy:
+        http_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(handler), base_url="https://upstream.test"
+        )
+        proxy = OpenRouterProxy(http_client=http_client)
+        overrides[_get_openrouter_proxy_dep] = lambda: proxy
+        return proxy
+
+    yield install
+    if previous_override is None:
+        overrides.pop(_get_openrouter_proxy_dep, None)
+    else:
+        overrides[_get_openrouter_proxy_dep] = previous_override
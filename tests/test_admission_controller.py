@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.classes import AdmissionController
+from api.classes.admission_controller import AdmissionRejectedError
+
+
+@pytest.mark.asyncio
+async def test_queued_request_gets_slot_on_release():
+    controller = AdmissionController(max_concurrent=1, max_per_user=1, max_queue=1)
+    first = await controller.acquire("u1")
+    waiter = asyncio.ensure_future(controller.acquire("u2"))
+    await asyncio.sleep(0)
+    assert controller.metrics()["queued"] == 1
+
+    with pytest.raises(AdmissionRejectedError) as exc:
+        await controller.acquire("u3")
+    assert exc.value.retry_after >= 1
+
+    first.release()
+    first.release()
+    second = await waiter
+    assert controller.metrics()["active"] == 1
+    second.release()
+    assert controller.metrics()["active"] == 0
+
+
+@pytest.mark.asyncio
+async def test_per_user_limit_does_not_block_other_users():
+    controller = AdmissionController(max_concurrent=2, max_per_user=1, max_queue=4)
+    ticket = await controller.acquire("u1")
+    blocked = asyncio.ensure_future(controller.acquire("u1"))
+    await asyncio.sleep(0)
+    other = await asyncio.wait_for(controller.acquire("u2"), timeout=1)
+    assert not blocked.done()
+    ticket.release()
+    (await blocked).release()
+    other.release()
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout_rejects_and_frees_queue():
+    controller = AdmissionController(
+        max_concurrent=1, max_per_user=1, max_queue=1, queue_timeout=0.01
+    )
+    ticket = await controller.acquire("u1")
+    with pytest.raises(AdmissionRejectedError):
+        await controller.acquire("u1")
+    metrics = controller.metrics()
+    assert metrics["queued"] == 0 and metrics["rejected_timeout"] == 1
+    ticket.release()
+
+
+def test_route_returns_429_with_retry_after_when_saturated(client: TestClient):
+    controller = AdmissionController(max_concurrent=1, max_per_user=1, max_queue=0)
+    client.app.admission_controller = controller
+    try:
+        payload = {"model": "mistral-small", "messages": [], "stream": False}
+        assert client.post("/v1/chat/completions", json=payload).status_code == 200
+        assert controller.metrics()["active"] == 0
+
+        blocker = asyncio.run(controller.acquire("someone"))
+        r = client.post("/v1/chat/completions", json=payload)
+        assert r.status_code == 429
+        assert int(r.headers["Retry-After"]) >= 1
+        blocker.release()
+    finally:
+        client.app.admission_controller = None
@@ -0,0 +1,290 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from api.classes import BatchRunner, FileStore, OpenRouterProxy
+from api.classes.resilience import RetryPolicy
+
+
+def _line(custom_id, content="hi", model="openai/tiny", **extra):
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": model,
+            "messages": [{"role": "user", "content": content}],
+            **extra,
+        },
+    }
+
+
+def _jsonl(lines):
+    return "".join(json.dumps(line) + "\n" for line in lines).encode()
+
+
+def _proxy(handler):
+    http_client = httpx.AsyncClient(
+        transport=httpx.MockTransport(handler), base_url="https://upstream.test"
+    )
+    return OpenRouterProxy(http_client=http_client, retry=RetryPolicy(max_attempts=1))
+
+
+def _completion(content):
+    return {
+        "id": f"gen-{content}",
+        "choices": [{"message": {"content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+    }
+
+
+async def _upload(store, data, user_id="u1"):
+    writer = store.open_writer(filename="in.jsonl", purpose="batch", user_id=user_id)
+    await writer.write(data)
+    return (await writer.close())["id"]
+
+
+async def _content(store, file_id):
+    return [json.loads(line) async for line in store.iter_lines(file_id)]
+
+
+@pytest.mark.asyncio
+async def test_batch_runs_lines_with_per_model_cap_and_retries():
+    running = {"now": 0, "max": 0}
+    attempts = {}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        assert "stream" not in body
+        content = body["messages"][0]["content"]
+        attempts[content] = attempts.get(content, 0) + 1
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(0.01)
+        running["now"] -= 1
+        if content == "flaky" and attempts[content] == 1:
+            return httpx.Response(503, json={"error": "busy"})
+        if content == "bad":
+            return httpx.Response(400, json={"error": "bad request"})
+        return httpx.Response(200, json=_completion(content))
+
+    store = FileStore()
+    runner = BatchRunner(
+        _proxy(handler),
+        store,
+        max_workers=8,
+        max_per_model=2,
+        retry=RetryPolicy(max_attempts=2, base_delay=0.0),
+    )
+    lines = [_line(f"req-{i}", f"q{i}") for i in range(6)]
+    lines += [_line("flaky", "flaky", stream=True), _line("bad", "bad")]
+    input_file_id = await _upload(store, _jsonl(lines))
+
+    batch = await runner.create(
+        user_id="u1", input_file_id=input_file_id, endpoint="/v1/chat/completions"
+    )
+    await runner.wait(batch["id"])
+
+    batch = await runner.get(batch["id"], "u1")
+    assert batch["status"] == "completed"
+    assert batch["request_counts"] == {"total": 8, "completed": 7, "failed": 1}
+    assert batch["usage"]["total_tokens"] == 35
+    assert running["max"] == 2 and attempts["flaky"] == 2
+
+    output = await _content(store, batch["output_file_id"])
+    assert sorted(o["custom_id"] for o in output) == sorted(
+        [f"req-{i}" for i in range(6)] + ["flaky"]
+    )
+    assert all(o["response"]["status_code"] == 200 for o in output)
+    errors = await _content(store, batch["error_file_id"])
+    assert errors[0]["custom_id"] == "bad"
+    assert errors[0]["response"]["status_code"] == 400
+    assert await runner.get(batch["id"], "someone-else") is None
+
+
+@pytest.mark.asyncio
+async def test_saturated_model_does_not_hold_workers():
+    events = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        content = body["messages"][0]["content"]
+        events.append(f"start {content}")
+        await asyncio.sleep(0.02 if body["model"] == "slow" else 0)
+        events.append(f"end {content}")
+        return httpx.Response(200, json=_completion(content))
+
+    store = FileStore()
+    runner = BatchRunner(_proxy(handler), store, max_workers=2, max_per_model=1)
+    slow = await _upload(
+        store, _jsonl([_line(f"s{i}", f"s{i}", "slow") for i in range(3)])
+    )
+    fast = await _upload(store, _jsonl([_line("f", "f", "fast")]))
+
+    batches = [
+        await runner.create(
+            user_id="u1", input_file_id=file_id, endpoint="/v1/chat/completions"
+        )
+        for file_id in (slow, fast)
+    ]
+    for batch in batches:
+        await runner.wait(batch["id"])
+    # The fast line got the free worker while the slow model was busy
+    assert events.index("end f") < events.index("end s0")
+
+
+@pytest.mark.asyncio
+async def test_lines_are_retried_once_by_the_batch_policy():
+    attempts = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request)
+        return httpx.Response(503, json={"error": "busy"})
+
+    http_client = httpx.AsyncClient(
+        transport=httpx.MockTransport(handler), base_url="https://upstream.test"
+    )
+    proxy = OpenRouterProxy(
+        http_client=http_client, retry=RetryPolicy(max_attempts=3, base_delay=0.0)
+    )
+    store = FileStore()
+    runner = BatchRunner(
+        proxy, store, retry=RetryPolicy(max_attempts=2, base_delay=0.0)
+    )
+    input_file_id = await _upload(store, _jsonl([_line("a")]))
+    batch = await runner.create(
+        user_id="u1", input_file_id=input_file_id, endpoint="/v1/chat/completions"
+    )
+    await runner.wait(batch["id"])
+
+    assert (await runner.get(batch["id"], "u1"))["request_counts"]["failed"] == 1
+    assert len(attempts) == 2
+
+
+@pytest.mark.asyncio
+async def test_invalid_input_fails_validation_without_calls():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(200, json=_completion("x"))
+
+    store = FileStore()
+    runner = BatchRunner(_proxy(handler), store)
+    wrong_url = {**_line("b"), "url": "/v1/responses"}
+    data = _jsonl([_line("a"), _line("a"), wrong_url]) + b"not json\n"
+    input_file_id = await _upload(store, data)
+
+    batch = await runner.create(
+        user_id="u1", input_file_id=input_file_id, endpoint="/v1/chat/completions"
+    )
+    await runner.wait(batch["id"])
+
+    assert batch["status"] == "failed" and calls == []
+    assert [e["line"] for e in batch["errors"]["data"]] == [2, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_cancel_keeps_finished_lines():
+    release = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        content = json.loads(request.content)["messages"][0]["content"]
+        if content != "fast":
+            await release.wait()
+        return httpx.Response(200, json=_completion(content))
+
+    store = FileStore()
+    runner = BatchRunner(_proxy(handler), store, max_per_model=1)
+    input_file_id = await _upload(
+        store, _jsonl([_line("fast", "fast"), _line("slow", "slow")])
+    )
+    batch = await runner.create(
+        user_id="u1", input_file_id=input_file_id, endpoint="/v1/chat/completions"
+    )
+    while batch["request_counts"]["completed"] < 1:
+        await asyncio.sleep(0.01)
+
+    assert (await runner.cancel(batch["id"], "u1"))["status"] == "cancelling"
+    await runner.wait(batch["id"])
+
+    assert batch["status"] == "cancelled"
+    output = await _content(store, batch["output_file_id"])
+    assert [o["custom_id"] for o in output] == ["fast"]
+    assert batch["error_file_id"] is None
+
+
+@pytest.mark.asyncio
+async def test_create_rejects_unknown_file_and_endpoint():
+    store = FileStore()
+    runner = BatchRunner(_proxy(lambda r: httpx.Response(200)), store)
+    with pytest.raises(ValueError):
+        await runner.create(
+            user_id="u1", input_file_id="file-x", endpoint="/v1/chat/completions"
+        )
+    input_file_id = await _upload(store, _jsonl([_line("a")]))
+    with pytest.raises(ValueError):
+        await runner.create(
+            user_id="u1", input_file_id=input_file_id, endpoint="/v1/embeddings"
+        )
+    with pytest.raises(ValueError):
+        await runner.create(
+            user_id="u2", input_file_id=input_file_id, endpoint="/v1/chat/completions"
+        )
+
+
+def test_files_and_batches_routes(client: TestClient):
+    def handler(request: httpx.Request) -> httpx.Response:
+        content = json.loads(request.content)["messages"][0]["content"]
+        return httpx.Response(200, json=_completion(content))
+
+    store = FileStore()
+    runner = BatchRunner(_proxy(handler), store)
+    client.app.file_store = store
+    client.app.batch_runner = runner
+    try:
+        with client:
+            data = _jsonl([_line("a", "one"), _line("b", "two")])
+            r = client.post(
+                "/v1/files",
+                files={"file": ("in.jsonl", data, "application/jsonl")},
+                data={"purpose": "batch"},
+            )
+            assert r.status_code == 200
+            uploaded = r.json()
+            assert uploaded["bytes"] == len(data) and "user_id" not in uploaded
+            assert client.get("/v1/files").json()["data"][0]["id"] == uploaded["id"]
+
+            r = client.post(
+                "/v1/batches",
+                json={
+                    "input_file_id": uploaded["id"],
+                    "endpoint": "/v1/chat/completions",
+                },
+            )
+            assert r.status_code == 200
+            batch_id = r.json()["id"]
+            client.portal.call(runner.wait, batch_id)
+
+            batch = client.get(f"/v1/batches/{batch_id}").json()
+            assert batch["status"] == "completed"
+            assert batch["request_counts"]["completed"] == 2
+            assert client.get("/v1/batches").json()["data"][0]["id"] == batch_id
+
+            r = client.get(f"/v1/files/{batch['output_file_id']}/content")
+            results = [json.loads(line) for line in r.text.splitlines()]
+            assert {o["custom_id"] for o in results} == {"a", "b"}
+
+            r = client.post(
+                "/v1/batches",
+                json={"input_file_id": "file-missing", "endpoint": "/v1/responses"},
+            )
+            assert r.status_code == 400
+            assert client.delete(f"/v1/files/{uploaded['id']}").json()["deleted"]
+            assert client.get(f"/v1/files/{uploaded['id']}").status_code == 404
+    finally:
+        client.app.file_store = None
+        client.app.batch_runner = None
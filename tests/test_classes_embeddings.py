@@ -1,6 +1,11 @@
+import base64
+import json
+from types import SimpleNamespace
+
+import numpy as np
 import pytest
 
-from api.classes.embeddings import Embeddings
+from api.classes.embeddings import Embeddings, encode_embedding
 
 
 @pytest.mark.asyncio
@@ -25,3 +30,49 @@ async def test_generate_embeddings_tuple_format():
     assert ids == [0]
     assert len(vectors[0]) == 3
     assert payloads[0]["source_text"] == "abc"
+
+
+def test_encode_embedding_formats():
+    vector = np.array([0.5, -0.25, 1.0], dtype=np.float32)
+    assert encode_embedding(vector) == [0.5, -0.25, 1.0]
+
+    f32 = base64.b64decode(encode_embedding(vector, "base64"))
+    assert np.frombuffer(f32, dtype="<f4").tolist() == [0.5, -0.25, 1.0]
+    f16 = base64.b64decode(encode_embedding(vector, "float16"))
+    assert len(f16) == 6
+    assert np.frombuffer(f16, dtype="<f2").tolist() == [0.5, -0.25, 1.0]
+    i8 = base64.b64decode(encode_embedding(vector, "int8"))
+    assert np.frombuffer(i8, dtype=np.int8).tolist() == [64, -32, 127]
+
+
+@pytest.mark.asyncio
+async def test_base64_client_result_is_decoded_to_arrays():
+    vector = np.array([0.5, 0.25], dtype="<f4")
+
+    async def create(model, input, encoding_format=None):
+        assert encoding_format == "base64"
+        embedding = base64.b64encode(vector.tobytes()).decode()
+        return SimpleNamespace(data=[SimpleNamespace(embedding=embedding)])
+
+    e = Embeddings(SimpleNamespace(embeddings=SimpleNamespace(create=create)))
+    data = await e._create_embeddings("text-embedding-3-small", ["abc"])
+    assert isinstance(data[0]["embedding"], np.ndarray)
+    out = await e.generate_embeddings(
+        model="text-embedding-3-small", inputs=["abc"], encoding_format="base64"
+    )
+    assert out["data"][0]["embedding"] == base64.b64encode(vector.tobytes()).decode()
+
+
+def test_batch_results_and_offline_stub_are_arrays():
+    lines = [
+        {"custom_id": "job-1", "response": {"body": {"data": [{"embedding": [1.5]}]}}},
+        {"custom_id": "job-0", "response": {"body": {"data": [{"embedding": [0.5]}]}}},
+    ]
+    data = Embeddings._parse_embeddings_jsonl(
+        "\n".join(json.dumps(line) for line in lines), 3
+    )
+    assert all(isinstance(d["embedding"], np.ndarray) for d in data)
+    assert [d["embedding"].tolist() for d in data] == [[0.5], [1.5], []]
+
+    [stub] = Embeddings._offline_embeddings_stub(["abc"])
+    assert stub["embedding"].dtype == np.float32
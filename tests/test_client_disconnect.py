@@ -0,0 +1,149 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from api.classes import StreamReplay
+from api.config import get_settings
+
+EVENT = b'data: {"id":"c1","choices":[{"delta":{"content":"hi"}}]}\n\n'
+
+
+class Upstream:
+    """Mock upstream that sends one SSE event (when streaming), then hangs."""
+
+    def __init__(self):
+        self.closed = asyncio.Event()
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        if not json.loads(request.content).get("stream"):
+            try:
+                await asyncio.Event().wait()
+            finally:
+                self.closed.set()
+
+        async def body():
+            try:
+                yield EVENT
+                await asyncio.Event().wait()
+            finally:
+                self.closed.set()
+
+        return httpx.Response(
+            200, content=body(), headers={"content-type": "text/event-stream"}
+        )
+
+
+async def _call_then_disconnect(app, body, *, after_first_chunk, headers=()):
+    """Run one ASGI request whose client goes away early."""
+    gone = asyncio.Event()
+    sent = []
+    messages = [{"type": "http.request", "body": json.dumps(body).encode()}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+        if message["type"] == "http.response.body" and message.get("body"):
+            gone.set()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/v1/chat/completions",
+        "raw_path": b"/v1/chat/completions",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), *headers],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+    if not after_first_chunk:
+        asyncio.get_running_loop().call_later(0.05, gone.set)
+    await asyncio.wait_for(app(scope, receive, send), timeout=5)
+    return sent
+
+
+@pytest.fixture
+def upstream(mock_upstream):
+    upstream = Upstream()
+    mock_upstream(upstream.handler)
+    return upstream
+
+
+def _last_log(client):
+    return client.app.mongodb_client._col("llm_requests")[-1]
+
+
+BODY = {"model": "openai/tiny", "messages": [{"role": "user", "content": "hi"}]}
+
+
+@pytest.mark.asyncio
+async def test_disconnect_before_answer_cancels_upstream_call(client, upstream):
+    sent = await _call_then_disconnect(client.app, BODY, after_first_chunk=False)
+
+    assert upstream.closed.is_set()
+    assert sent[0]["status"] == 499
+    log = _last_log(client)
+    assert log["status_code"] == 499 and log["error"] == "client_cancelled"
+
+
+@pytest.mark.asyncio
+async def test_disconnect_mid_stream_closes_upstream(client, upstream):
+    body = {**BODY, "stream": True}
+    sent = await _call_then_disconnect(client.app, body, after_first_chunk=True)
+
+    assert upstream.closed.is_set()
+    assert sent[1]["body"] == EVENT
+    log = _last_log(client)
+    assert log["status_code"] == 499 and log["error"] == "client_cancelled"
+
+
+@pytest.mark.asyncio
+async def test_resumable_stream_is_abandoned_after_grace(client, upstream):
+    replay = StreamReplay(abandon_after=0.05)
+    client.app.stream_replay = replay
+    try:
+        body = {**BODY, "stream": True}
+        await _call_then_disconnect(
+            client.app,
+            body,
+            after_first_chunk=True,
+            headers=[(b"x-stream-resumable", b"true")],
+        )
+        # Still running for a client to resume it...
+        assert not upstream.closed.is_set()
+        await asyncio.wait_for(upstream.closed.wait(), timeout=2)
+        await asyncio.sleep(0)
+    finally:
+        client.app.stream_replay = None
+
+    assert replay.metrics()["abandoned"] == 1
+    assert _last_log(client)["status_code"] == 499
+
+
+@pytest.mark.asyncio
+async def test_default_replay_cancels_streams_not_asked_to_be_resumable(
+    client, upstream
+):
+    assert get_settings().stream_replay_abandon_after > 0
+    replay = StreamReplay.from_settings()
+    client.app.stream_replay = replay
+    try:
+        body = {**BODY, "stream": True}
+        sent = await _call_then_disconnect(client.app, body, after_first_chunk=True)
+    finally:
+        client.app.stream_replay = None
+
+    assert upstream.closed.is_set()
+    assert b"x-job-id" not in dict(sent[0]["headers"])
+    assert replay.metrics()["started"] == 0
+    assert _last_log(client)["status_code"] == 499
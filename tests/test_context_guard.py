@@ -0,0 +1,117 @@
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from api.classes import ContextGuard
+from api.classes.context_guard import ContextLimits
+from api.utils import LazyJSONObject, TokenEstimator
+
+MODEL = {
+    "id": "openai/tiny",
+    "context_length": 4000,
+    "endpoints": [
+        {"context_length": 1000, "max_prompt_tokens": 800},
+        {"context_length": 2000, "max_prompt_tokens": 1500},
+    ],
+}
+
+
+class FakeModels:
+    def __init__(self):
+        self.calls = 0
+
+    async def read_model(self, author, model):
+        self.calls += 1
+        return MODEL
+
+
+def _payload(text, **extra):
+    body = {"model": "openai/tiny", "messages": [{"role": "user", "content": text}]}
+    return LazyJSONObject(httpx.Request("POST", "/", json={**body, **extra}).content)
+
+
+def test_estimate_sets_inline_media_aside_and_reads_output_cap():
+    image = "data:image/png;base64," + "A" * 400_000
+    payload = _payload(
+        [{"type": "image_url", "image_url": {"url": image}}], max_tokens=50
+    )
+    estimate = TokenEstimator().estimate(payload)
+    assert 1000 <= estimate.prompt_tokens < 1100
+    assert estimate.max_output_tokens == 50 and not estimate.exact
+
+
+def test_escaped_non_ascii_prompt_is_not_overcounted():
+    body = {"model": "m", "messages": [{"role": "user", "content": "日本語" * 1000}]}
+    escaped = LazyJSONObject(json.dumps(body).encode())
+    raw = LazyJSONObject(json.dumps(body, ensure_ascii=False).encode())
+    assert len(escaped.raw) > 1.9 * len(raw.raw)
+
+    estimator = TokenEstimator()
+    assert estimator.estimate(escaped).prompt_tokens == pytest.approx(
+        estimator.estimate(raw).prompt_tokens, rel=0.01
+    )
+
+
+def test_registered_tokenizer_counts_message_texts():
+    estimator = TokenEstimator()
+    estimator.register("openai/*", lambda text: len(text.split()))
+    estimate = estimator.estimate(_payload("one two three"))
+    assert estimate.exact and estimate.prompt_tokens == 3 + 4
+
+
+def test_limits_take_the_most_permissive_endpoint():
+    limits = ContextLimits.from_model(MODEL)
+    assert limits.context_length == 2000 and limits.max_prompt_tokens == 1500
+    limits = ContextLimits.from_model({"context_length": 4000, "endpoints": []})
+    assert limits.context_length == 4000 and limits.max_prompt_tokens is None
+
+
+@pytest.mark.asyncio
+async def test_check_rejects_only_once_limits_are_known():
+    models = FakeModels()
+    guard = ContextGuard(models, margin=0.2)
+    too_long = guard.estimate(_payload("word " * 2000))
+
+    assert guard.check("openai/tiny", too_long) is None
+    await guard._loading["openai/tiny"]
+    assert "1500" in guard.check("openai/tiny", too_long)
+
+    fits = guard.estimate(_payload("hello", max_tokens=1000))
+    assert guard.check("openai/tiny", fits) is None
+    over_budget = guard.estimate(_payload("hello", max_tokens=1990))
+    assert "2000 token context" in guard.check("openai/tiny", over_budget)
+    assert models.calls == 1 and guard.metrics()["rejected"] == 2
+
+
+def test_route_rejects_doomed_request_without_upstream_call(
+    client: TestClient, mock_upstream
+):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(200, json={"id": "r1", "choices": []})
+
+    mock_upstream(handler)
+    guard = ContextGuard(FakeModels())
+    client.app.context_guard = guard
+    try:
+        with client:
+            client.portal.call(guard.load, "openai/tiny")
+            body = {
+                "model": "openai/tiny",
+                "messages": [{"role": "user", "content": "word " * 5000}],
+            }
+            r = client.post("/v1/chat/completions", json=body)
+            assert r.status_code == 400
+            assert "1500" in r.json()["error"]
+            assert calls == []
+
+            body["messages"][0]["content"] = "hello"
+            assert client.post("/v1/chat/completions", json=body).status_code == 200
+        log = client.app.mongodb_client._col("llm_requests")[-1]
+        assert log["estimated_prompt_tokens"] > 0
+    finally:
+        client.app.context_guard = None
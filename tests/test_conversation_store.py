@@ -0,0 +1,182 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from api.classes import ConversationStore
+from api.classes.conversation_store import ConversationNotFoundError
+
+
+def _message(role, text):
+    return {"type": "message", "role": role, "content": text}
+
+
+@pytest.mark.asyncio
+async def test_expand_walks_turns_in_order_and_checks_owner():
+    store = ConversationStore(max_entries=10)
+    store.turn("u1", None, [_message("user", "a")]).complete(
+        "r1", [_message("assistant", "b")]
+    )
+    store.turn("u1", "r1", [_message("user", "c")]).complete(
+        "r2", [_message("assistant", "d")]
+    )
+
+    history = await store.expand("u1", "r2")
+    assert [item["content"] for item in history] == ["a", "b", "c", "d"]
+
+    with pytest.raises(ConversationNotFoundError):
+        await store.expand("u2", "r2")
+    with pytest.raises(ConversationNotFoundError):
+        await store.expand("u1", "missing")
+
+
+@pytest.mark.asyncio
+async def test_hot_tier_is_bounded():
+    store = ConversationStore(max_entries=2)
+    for i in range(3):
+        store.record(f"r{i}", user_id="u1", previous_response_id=None, items=[i])
+    assert store.metrics()["hot_entries"] == 2
+    with pytest.raises(ConversationNotFoundError):
+        await store.expand("u1", "r0")
+
+
+@pytest.mark.asyncio
+async def test_hot_tier_is_bounded_by_bytes():
+    store = ConversationStore(max_bytes=100)
+    store.record("r0", user_id="u1", previous_response_id=None, items=["x" * 60])
+    store.record("r1", user_id="u1", previous_response_id="r0", items=["y" * 60])
+    store.record("big", user_id="u1", previous_response_id=None, items=["z" * 200])
+    assert store.metrics()["hot_entries"] == 1
+    assert store.metrics()["hot_bytes"] <= 100
+    with pytest.raises(ConversationNotFoundError):
+        await store.expand("u1", "big")
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class FakeConversations:
+    """Enough of `$match` + `$graphLookup` for the conversation pipeline."""
+
+    def __init__(self):
+        self.docs = {}
+        self.aggregations = 0
+
+    async def replace_one(self, query, doc, upsert):
+        self.docs[query["_id"]] = {"_id": query["_id"], **doc}
+
+    def aggregate(self, pipeline):
+        self.aggregations += 1
+        match, lookup = pipeline[0]["$match"], pipeline[1]["$graphLookup"]
+        doc = self.docs.get(match["_id"])
+        if doc is None or doc["user_id"] != match["user_id"]:
+            return FakeCursor([])
+        ancestors, parent, depth = [], doc["previous_response_id"], 0
+        while parent in self.docs:
+            ancestor = self.docs[parent]
+            if ancestor["user_id"] != lookup["restrictSearchWithMatch"]["user_id"]:
+                break
+            ancestors.append({**ancestor, "depth": depth})
+            parent, depth = ancestor["previous_response_id"], depth + 1
+        return FakeCursor([{**doc, "ancestors": ancestors}])
+
+
+class FakeMongo:
+    def __init__(self):
+        self.conversations = FakeConversations()
+
+    def get_database(self):
+        return {"llm_conversation_items": self.conversations}
+
+
+@pytest.mark.asyncio
+async def test_cold_history_is_loaded_in_one_round_trip():
+    mongo = FakeMongo()
+    writer = ConversationStore(mongodb_client=mongo)
+    previous = None
+    for i in range(5):
+        writer.record(f"r{i}", user_id="u1", previous_response_id=previous, items=[i])
+        previous = f"r{i}"
+    await asyncio.gather(*writer._background)
+
+    # Another worker with an empty hot tier
+    reader = ConversationStore(mongodb_client=mongo)
+    assert await reader.expand("u1", "r4") == [0, 1, 2, 3, 4]
+    assert mongo.conversations.aggregations == 1
+    assert reader.metrics()["cold_hits"] == 5
+
+    assert await reader.expand("u1", "r4") == [0, 1, 2, 3, 4]
+    assert mongo.conversations.aggregations == 1
+    with pytest.raises(ConversationNotFoundError):
+        await ConversationStore(mongodb_client=mongo).expand("u2", "r4")
+
+
+def test_route_expands_previous_response_id(client: TestClient, mock_upstream):
+    sent = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        sent.append(body)
+        response = {
+            "id": f"resp{len(sent)}",
+            "object": "response",
+            "status": "completed",
+            "output": [_message("assistant", f"answer{len(sent)}")],
+        }
+        if body.get("stream"):
+            event = {"type": "response.completed", "response": response}
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                content=f"data: {json.dumps(event)}\n\ndata: [DONE]\n\n".encode(),
+            )
+        return httpx.Response(200, json=response)
+
+    mock_upstream(handler)
+    client.app.conversation_store = ConversationStore()
+    try:
+        model = "openai/gpt-4.1-mini"
+        r = client.post("/v1/responses", json={"model": model, "input": "one"})
+        assert r.json()["id"] == "resp1"
+
+        with client.stream(
+            "POST",
+            "/v1/responses",
+            json={
+                "model": model,
+                "input": "two",
+                "previous_response_id": "resp1",
+                "stream": True,
+            },
+        ) as r:
+            r.read()
+
+        r = client.post(
+            "/v1/responses",
+            json={"model": model, "input": "three", "previous_response_id": "resp2"},
+        )
+        assert r.status_code == 200
+        assert "previous_response_id" not in sent[2]
+        assert [item["content"] for item in sent[2]["input"]] == [
+            "one",
+            "answer1",
+            "two",
+            "answer2",
+            "three",
+        ]
+
+        r = client.post(
+            "/v1/responses",
+            json={"model": model, "input": "x", "previous_response_id": "unknown"},
+        )
+        assert r.status_code == 400
+        assert len(sent) == 3
+    finally:
+        client.app.conversation_store = None
@@ -0,0 +1,112 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from api.classes import EmbeddingBatcher, Embeddings
+
+MODEL = "text-embedding-3-small"
+
+
+class FakeOpenAI:
+    """Embeds each text as [len(text)]; fails on "boom", rejects "bad"."""
+
+    def __init__(self):
+        self.calls = []
+        self.embeddings = SimpleNamespace(create=self.create)
+
+    async def create(self, model, input, dimensions=None, encoding_format=None):
+        self.calls.append(list(input))
+        await asyncio.sleep(0)
+        if "boom" in input:
+            raise RuntimeError("upstream down")
+        if "bad" in input:
+            response = httpx.Response(
+                400, request=httpx.Request("POST", "https://upstream.test")
+            )
+            raise openai.BadRequestError("invalid input", response=response, body=None)
+        return SimpleNamespace(
+            data=[SimpleNamespace(embedding=[float(len(text))]) for text in input]
+        )
+
+
+def _embeddings(**kwargs):
+    client = FakeOpenAI()
+    return client, Embeddings(client, batcher=EmbeddingBatcher(**kwargs))
+
+
+def _vectors(out):
+    return [item["embedding"] for item in out["data"]]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_upstream_request():
+    client, e = _embeddings(max_delay=0.01)
+    outs = await asyncio.gather(
+        e.generate_embeddings(model=MODEL, inputs=["a"]),
+        e.generate_embeddings(model=MODEL, inputs=["bb", "a"]),
+        e.generate_embeddings(model=MODEL, inputs=["ccc"]),
+    )
+
+    assert [_vectors(out) for out in outs] == [[[1.0]], [[2.0], [1.0]], [[3.0]]]
+    assert client.calls == [["a", "bb", "ccc"]]
+    metrics = e.batcher.metrics()
+    assert metrics["requests"] == 3 and metrics["upstream_calls"] == 1
+    assert metrics["deduplicated"] == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_is_sent_once_max_items_are_waiting():
+    client, e = _embeddings(max_items=2, max_delay=60)
+    outs = await asyncio.wait_for(
+        asyncio.gather(
+            e.generate_embeddings(model=MODEL, inputs=["a"]),
+            e.generate_embeddings(model=MODEL, inputs=["bb"]),
+            e.generate_embeddings(model=MODEL, inputs=["ccc", "dddd"]),
+        ),
+        timeout=1,
+    )
+
+    assert [_vectors(out) for out in outs] == [[[1.0]], [[2.0]], [[3.0], [4.0]]]
+    assert client.calls == [["a", "bb"], ["ccc", "dddd"]]
+
+
+@pytest.mark.asyncio
+async def test_upstream_error_reaches_every_caller():
+    client, e = _embeddings(max_delay=0.01)
+    results = await asyncio.gather(
+        e.generate_embeddings(model=MODEL, inputs=["a"]),
+        e.generate_embeddings(model=MODEL, inputs=["boom"]),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(client.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_rejected_batch_is_retried_per_caller():
+    client, e = _embeddings(max_delay=0.01)
+    good, bad = await asyncio.gather(
+        e.generate_embeddings(model=MODEL, inputs=["a", "bb"]),
+        e.generate_embeddings(model=MODEL, inputs=["bad"]),
+        return_exceptions=True,
+    )
+
+    assert _vectors(good) == [[1.0], [2.0]]
+    assert isinstance(bad, openai.BadRequestError)
+    assert client.calls == [["a", "bb", "bad"], ["a", "bb"], ["bad"]]
+
+
+@pytest.mark.asyncio
+async def test_batch_dropped_when_every_caller_left():
+    client, e = _embeddings(max_delay=0.01)
+    task = asyncio.ensure_future(e.generate_embeddings(model=MODEL, inputs=["a"]))
+    await asyncio.sleep(0)
+    task.cancel()
+    await asyncio.sleep(0.03)
+
+    assert client.calls == []
+    assert e.batcher.metrics()["pending"] == 0
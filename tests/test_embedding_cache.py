@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+
+import pytest
+
+from api.classes import EmbeddingCache, Embeddings
+
+MODEL = "text-embedding-3-small"
+
+
+class FakeOpenAI:
+    """Embeds each text as [len(text), dimensions or 0]."""
+
+    def __init__(self):
+        self.calls = []
+        self.embeddings = SimpleNamespace(create=self.create)
+
+    async def create(self, model, input, dimensions=None, encoding_format=None):
+        self.calls.append((list(input), dimensions))
+        return SimpleNamespace(
+            data=[
+                SimpleNamespace(embedding=[float(len(text)), float(dimensions or 0)])
+                for text in input
+            ]
+        )
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+
+    def find(self, query):
+        docs = [self.docs[k] for k in query["_id"]["$in"] if k in self.docs]
+
+        async def cursor():
+            for doc in docs:
+                yield doc
+
+        return cursor()
+
+    async def bulk_write(self, operations, ordered=True):
+        for op in operations:
+            doc = op._doc
+            self.docs[op._filter["_id"]] = {"_id": op._filter["_id"], **doc}
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collection = FakeCollection()
+
+    def get_database(self):
+        return {"llm_embedding_cache": self.collection}
+
+
+def _vectors(out):
+    return [item["embedding"] for item in out["data"]]
+
+
+@pytest.mark.asyncio
+async def test_only_missing_texts_go_upstream_in_input_order():
+    client = FakeOpenAI()
+    e = Embeddings(client, cache=EmbeddingCache())
+
+    await e.generate_embeddings(model=MODEL, inputs=["a", "bbb"])
+    out = await e.generate_embeddings(model=MODEL, inputs=["cc", "a", "cc", "bbb"])
+
+    assert _vectors(out) == [[2.0, 0.0], [1.0, 0.0], [2.0, 0.0], [3.0, 0.0]]
+    assert client.calls == [(["a", "bbb"], None), (["cc"], None)]
+    metrics = e.cache.metrics()
+    assert metrics["hits"] == 2 and metrics["misses"] == 3
+    assert metrics["entries"] == 3 and metrics["bytes"] == 3 * 2 * 4
+
+
+@pytest.mark.asyncio
+async def test_dimensions_are_part_of_the_key():
+    client = FakeOpenAI()
+    e = Embeddings(client, cache=EmbeddingCache())
+
+    await e.generate_embeddings(model=MODEL, inputs=["a"])
+    out = await e.generate_embeddings(model=MODEL, inputs=["a"], dimensions=256)
+
+    assert _vectors(out) == [[1.0, 256.0]]
+    assert client.calls[-1] == (["a"], 256)
+
+
+def test_memory_tier_is_bounded_by_bytes():
+    cache = EmbeddingCache(max_bytes=16)
+    cache.set_many({"a": [1.0, 2.0], "b": [3.0, 4.0], "c": [5.0, 6.0]})
+    metrics = cache.metrics()
+    assert metrics["entries"] == 2 and metrics["bytes"] == 16
+    assert metrics["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_persistent_tier_survives_a_restart():
+    mongo = FakeDatabase()
+    first = EmbeddingCache(mongodb_client=mongo)
+    first.set_many({"k": [0.5, 0.25]})
+    for task in list(first._background):
+        await task
+
+    second = EmbeddingCache(mongodb_client=mongo)
+    found = await second.get_many(["k", "other"])
+    assert list(found) == ["k"] and found["k"].tolist() == [0.5, 0.25]
+    metrics = second.metrics()
+    assert metrics["persistent_hits"] == 1 and metrics["misses"] == 1
+    assert (await second.get_many(["k"]))["k"].tolist() == [0.5, 0.25]
+    assert second.metrics()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_offline_stub_is_not_cached():
+    e = Embeddings(cache=EmbeddingCache())
+    e._client = None
+    await e.generate_embeddings(model=MODEL, inputs=["a"])
+    assert e.cache.metrics()["entries"] == 0
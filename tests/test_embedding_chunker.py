@@ -0,0 +1,124 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from api.classes import EmbeddingChunker, Embeddings
+from api.classes.resilience import RetryPolicy
+
+MODEL = "text-embedding-3-small"
+
+
+def _status_error(status_code):
+    request = httpx.Request("POST", "https://api.test/v1/embeddings")
+    response = httpx.Response(status_code, request=request)
+    return openai.APIStatusError("error", response=response, body=None)
+
+
+class FakeOpenAI:
+    """Embeds each text as [int(text)]; `failures` are raised first, in order."""
+
+    def __init__(self, failures=()):
+        self.calls = []
+        self.failures = list(failures)
+        self.in_flight = self.max_in_flight = 0
+        self.embeddings = SimpleNamespace(create=self.create)
+
+    async def create(self, model, input, dimensions=None, encoding_format=None):
+        self.calls.append(list(input))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if self.failures:
+                raise self.failures.pop(0)
+            return SimpleNamespace(
+                data=[SimpleNamespace(embedding=[float(text)]) for text in input]
+            )
+        finally:
+            self.in_flight -= 1
+
+
+def _chunker(**kwargs):
+    return EmbeddingChunker(retry=RetryPolicy(base_delay=0), **kwargs)
+
+
+def test_split_by_items_and_estimated_tokens():
+    chunker = _chunker(max_items=3, max_tokens=4)
+    assert chunker.split(["1234"] * 7) == [(0, 3), (3, 6), (6, 7)]
+    # 8 bytes is 2 tokens: two texts fill a chunk; an oversized text is alone
+    assert chunker.split(["a" * 8, "b" * 8, "c" * 8, "d" * 40, "e"]) == [
+        (0, 2),
+        (2, 3),
+        (3, 4),
+        (4, 5),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_large_call_runs_chunks_in_parallel_and_in_order():
+    client = FakeOpenAI()
+    e = Embeddings(client, chunker=_chunker(max_items=10, concurrency=3))
+    inputs = [str(i) for i in range(300)]
+
+    out = await e.generate_embeddings(model=MODEL, inputs=inputs)
+
+    # "auto" stays realtime even above the Batch API threshold
+    assert [item["embedding"] for item in out["data"]] == [
+        [float(i)] for i in range(300)
+    ]
+    assert len(client.calls) == 30 and client.max_in_flight == 3
+    assert e.chunker.metrics()["chunks"] == 30
+
+
+@pytest.mark.asyncio
+async def test_chunk_retried_on_rate_limit():
+    client = FakeOpenAI(
+        failures=[
+            _status_error(429),
+            openai.APIConnectionError(
+                request=httpx.Request("POST", "https://api.test/v1/embeddings")
+            ),
+        ]
+    )
+    e = Embeddings(client, chunker=_chunker())
+
+    out = await e.generate_embeddings(model=MODEL, inputs=["1", "2"])
+
+    assert [item["embedding"] for item in out["data"]] == [[1.0], [2.0]]
+    assert e.chunker.metrics()["retries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_client_error_is_not_retried():
+    client = FakeOpenAI(failures=[_status_error(400)])
+    e = Embeddings(client, chunker=_chunker(max_items=1))
+
+    with pytest.raises(openai.APIStatusError):
+        await e.generate_embeddings(model=MODEL, inputs=["1", "2", "3"])
+    assert e.chunker.metrics()["retries"] == 0
+    assert e.chunker.metrics()["failures"] == 1
+
+
+@pytest.mark.asyncio
+async def test_openai_client_does_not_retry_chunks_again():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(503, json={"error": {"message": "busy"}})
+
+    client = openai.AsyncOpenAI(
+        api_key="test",
+        base_url="https://api.test/v1",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    chunker = EmbeddingChunker(retry=RetryPolicy(max_attempts=2, base_delay=0))
+    e = Embeddings(client, chunker=chunker)
+
+    with pytest.raises(openai.APIStatusError):
+        await e.generate_embeddings(model=MODEL, inputs=["1"])
+    assert len(requests) == 2
+    assert e.chunker.metrics()["retries"] == 1
@@ -0,0 +1,245 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.classes import EmbeddingJobs, Embeddings
+
+MODEL = "text-embedding-3-small"
+
+
+class FakeBatchAPI:
+    """Provider Files + Batches: a batch completes when `finish` is called."""
+
+    def __init__(self):
+        self.files = SimpleNamespace(create=self.create_file, content=self.content)
+        self.batches = SimpleNamespace(create=self.create_batch, retrieve=self.retrieve)
+        self._files = {}
+        self._batches = {}
+
+    async def create_file(self, file, purpose):
+        file_id = f"file-{len(self._files)}"
+        self._files[file_id] = file[1].read().decode()
+        return SimpleNamespace(id=file_id)
+
+    async def content(self, file_id):
+        return SimpleNamespace(text=self._files[file_id])
+
+    async def create_batch(self, input_file_id, endpoint, completion_window, metadata):
+        batch = SimpleNamespace(
+            id=f"batch-{len(self._batches)}",
+            status="validating",
+            input_file_id=input_file_id,
+            output_file_id=None,
+            request_counts=None,
+            errors=None,
+        )
+        self._batches[batch.id] = batch
+        return batch
+
+    async def retrieve(self, batch_id):
+        return self._batches[batch_id]
+
+    def finish(self, batch_id, status="completed"):
+        batch = self._batches[batch_id]
+        batch.status = status
+        if status != "completed":
+            batch.errors = SimpleNamespace(data=[SimpleNamespace(message="boom")])
+            return
+        lines = []
+        for line in self._files[batch.input_file_id].splitlines():
+            request = json.loads(line)
+            text = request["body"]["input"]
+            body = {"data": [{"embedding": [float(len(text))]}]}
+            lines.append(
+                json.dumps(
+                    {"custom_id": request["custom_id"], "response": {"body": body}}
+                )
+            )
+        batch.output_file_id = f"file-{len(self._files)}"
+        self._files[batch.output_file_id] = "\n".join(lines)
+
+
+class FakeQdrant:
+    def __init__(self, failures=0):
+        self.upserts = []
+        self.failures = failures
+
+    async def batch_upsert(self, collection_name, indexes, vectors, payloads=None):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("qdrant unavailable")
+        self.upserts.append((collection_name, indexes, vectors, payloads))
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.docs[query["_id"]] = dict(doc)
+
+    async def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        return dict(doc) if doc else None
+
+    async def find_one_and_update(self, query, update, return_document):
+        doc = self.docs.get(query["_id"])
+        if doc is None or doc["status"] in query["status"]["$nin"]:
+            return None
+        lease_until, owner = doc.get("lease_until"), doc.get("lease_owner")
+        now = query["$or"][1]["lease_until"]["$lt"]
+        if lease_until is not None and lease_until >= now:
+            if owner != query["$or"][2]["lease_owner"]:
+                return None
+        doc.update(update["$set"])
+        return dict(doc)
+
+    def find(self, query):
+        excluded = query["status"]["$nin"]
+        docs = [dict(d) for d in self.docs.values() if d["status"] not in excluded]
+
+        async def cursor():
+            for doc in docs:
+                yield doc
+
+        return cursor()
+
+
+class FakeMongo:
+    def __init__(self):
+        self.collection = FakeCollection()
+
+    def get_database(self):
+        return {"llm_embedding_jobs": self.collection}
+
+
+@pytest.mark.asyncio
+async def test_job_completes_in_background_and_upserts_into_vector_store():
+    api, qdrant = FakeBatchAPI(), FakeQdrant()
+    jobs = EmbeddingJobs(Embeddings(api), qdrant_client=qdrant)
+
+    job = await jobs.submit(
+        user_id="u1", model=MODEL, inputs=["a", "bbb"], vector_store_id="docs"
+    )
+    assert job["status"] == "validating"
+    await jobs.poll()
+    assert job["status"] == "validating" and jobs.metrics()["in_flight"] == 1
+
+    api.finish(job["batch_id"])
+    await jobs.poll()
+
+    assert job["status"] == "completed"
+    results = await jobs.results(job)
+    assert [d["embedding"] for d in results["data"]] == [[1.0], [3.0]]
+    [(collection, ids, vectors, payloads)] = qdrant.upserts
+    assert collection == "docs" and vectors == [[1.0], [3.0]]
+    assert [p["source_text"] for p in payloads] == ["a", "bbb"]
+    assert await jobs.get(job["id"], "someone-else") is None
+
+
+@pytest.mark.asyncio
+async def test_provider_failure_fails_the_job():
+    api = FakeBatchAPI()
+    jobs = EmbeddingJobs(Embeddings(api))
+    job = await jobs.submit(user_id="u1", model=MODEL, inputs=["a"])
+
+    api.finish(job["batch_id"], status="expired")
+    await jobs.poll()
+
+    assert job["status"] == "expired" and job["error"] == "boom"
+    assert jobs.metrics()["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_in_flight_jobs_survive_a_restart():
+    api, mongo = FakeBatchAPI(), FakeMongo()
+    before = EmbeddingJobs(Embeddings(api), mongodb_client=mongo)
+    job = await before.submit(user_id="u1", model=MODEL, inputs=["ab"])
+
+    after = EmbeddingJobs(Embeddings(api), mongodb_client=mongo, poll_interval=0.01)
+    await after.start()
+    try:
+        api.finish(job["batch_id"])
+        for _ in range(100):
+            if mongo.collection.docs[job["id"]]["status"] == "completed":
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await after.aclose()
+
+    stored = await after.get(job["id"], "u1")
+    assert stored["status"] == "completed"
+    results = await after.results(stored)
+    assert results["data"][0]["embedding"] == [2.0]
+
+
+@pytest.mark.asyncio
+async def test_failed_action_is_retried_on_the_next_poll():
+    api, qdrant = FakeBatchAPI(), FakeQdrant(failures=1)
+    jobs = EmbeddingJobs(Embeddings(api), qdrant_client=qdrant)
+    job = await jobs.submit(
+        user_id="u1", model=MODEL, inputs=["a"], vector_store_id="docs"
+    )
+    api.finish(job["batch_id"])
+
+    await jobs.poll()
+    assert job["status"] == "finalizing"
+    assert job["action_error"].startswith("Completion action failed")
+    await jobs.poll()
+    assert job["status"] == "completed" and job["action_error"] is None
+    assert len(qdrant.upserts) == 1 and jobs.metrics()["failed"] == 0
+
+
+@pytest.mark.asyncio
+async def test_only_the_lease_holder_polls_a_job():
+    api, mongo = FakeBatchAPI(), FakeMongo()
+    retrieved = []
+    retrieve = api.batches.retrieve
+
+    async def counting_retrieve(batch_id):
+        retrieved.append(batch_id)
+        return await retrieve(batch_id)
+
+    api.batches.retrieve = counting_retrieve
+    first = EmbeddingJobs(Embeddings(api), mongodb_client=mongo)
+    job = await first.submit(user_id="u1", model=MODEL, inputs=["ab"])
+    second = EmbeddingJobs(Embeddings(api), mongodb_client=mongo)
+    await second.start()
+
+    await first.poll()
+    await second.poll()
+    assert retrieved == [job["batch_id"]]
+
+    api.finish(job["batch_id"])
+    await first.poll()
+    await second.poll()
+    assert (await second.get(job["id"], "u1"))["status"] == "completed"
+    assert len(retrieved) == 2
+
+
+def test_embedding_job_routes(client: TestClient):
+    api = FakeBatchAPI()
+    jobs = client.app.embedding_jobs = EmbeddingJobs(Embeddings(api))
+    try:
+        with client:
+            body = {"model": MODEL, "input": ["a"]}
+            r = client.post("/v1/embeddings/jobs", json=body)
+            assert r.status_code == 202
+            job_id, batch_id = r.json()["id"], r.json()["batch_id"]
+            r = client.get(f"/v1/embeddings/jobs/{job_id}/results")
+            assert r.status_code == 409
+
+            api.finish(batch_id)
+            client.portal.call(jobs.poll)
+            r = client.get(f"/v1/embeddings/jobs/{job_id}")
+            assert r.status_code == 200 and r.json()["status"] == "completed"
+            r = client.get(f"/v1/embeddings/jobs/{job_id}/results")
+            assert r.status_code == 200
+            assert r.json()["data"][0]["embedding"] == [1.0]
+
+            assert client.get("/v1/embeddings/jobs/unknown").status_code == 404
+    finally:
+        client.app.embedding_jobs = None
@@ -0,0 +1,100 @@
+import asyncio
+
+import httpx
+import pytest
+
+from api.classes import HedgePolicy, OpenRouterProxy
+from api.classes.upstream_router import Upstream, UpstreamRouter
+
+
+def _proxy(handler, policy: HedgePolicy) -> OpenRouterProxy:
+    client = httpx.AsyncClient(
+        transport=httpx.MockTransport(handler), base_url="https://upstream/v1"
+    )
+    return OpenRouterProxy(
+        router=UpstreamRouter([Upstream("a", client)]), hedging=policy
+    )
+
+
+@pytest.mark.asyncio
+async def test_slow_request_is_hedged_and_fast_copy_wins():
+    calls = 0
+
+    async def handler(_request):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            await asyncio.sleep(1)
+            return httpx.Response(200, json={"id": "slow"})
+        return httpx.Response(200, json={"id": "fast"})
+
+    policy = HedgePolicy(delay_ms=20, budget_per_minute=5)
+    proxy = _proxy(handler, policy)
+    response = await proxy.post("/chat/completions", {"model": "m"}, hedge_user="u1")
+    assert response.json()["id"] == "fast"
+    assert OpenRouterProxy.was_hedged(response)
+    assert policy.metrics()["hedge_wins"] == 1
+    await proxy.aclose()
+
+
+@pytest.mark.asyncio
+async def test_budget_exhausted_waits_for_primary():
+    async def handler(_request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"id": "only"})
+
+    policy = HedgePolicy(delay_ms=1, budget_per_minute=0)
+    proxy = _proxy(handler, policy)
+    response = await proxy.post("/chat/completions", {"model": "m"}, hedge_user="u1")
+    assert response.json()["id"] == "only"
+    assert not OpenRouterProxy.was_hedged(response)
+    assert policy.metrics()["denied_by_budget"] == 1
+    await proxy.aclose()
+
+
+def test_delay_is_learned_per_model_percentile():
+    policy = HedgePolicy(percentile=0.9, min_samples=10)
+    for latency in range(1, 10):
+        policy.record("m", float(latency * 100))
+    assert policy.delay_for("m") is None
+    policy.record("m", 1000.0)
+    assert policy.delay_for("m") == pytest.approx(1.0)
+    assert policy.delay_for("other") is None
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    def __init__(self):
+        self.closed = False
+
+    async def __aiter__(self):
+        yield b"{}"
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_cancel_during_hedge_delay_closes_the_primary_response():
+    started, release = asyncio.Event(), asyncio.Event()
+    stream = _TrackedStream()
+
+    async def handler(_request):
+        started.set()
+        await release.wait()
+        return httpx.Response(200, stream=stream)
+
+    proxy = _proxy(handler, HedgePolicy(delay_ms=60_000))
+    call = asyncio.ensure_future(
+        proxy.post("/chat/completions", {"model": "m"}, hedge_user="u1")
+    )
+    await started.wait()
+    # The answer lands while the caller is being cancelled
+    release.set()
+    call.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await call
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+    assert stream.closed
+    await proxy.aclose()
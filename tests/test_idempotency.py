@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from pymongo.errors import DuplicateKeyError
+
+from api.classes import IdempotencyStore
+
+
+def _entry(content=b'{"id":"r1"}', status_code=200):
+    return {
+        "content": content,
+        "status_code": status_code,
+        "media_type": "application/json",
+        "job_id": "job1",
+    }
+
+
+async def _kind(store, key, request_hash="h", stream=False):
+    outcome = await store.begin(
+        key, request_hash=request_hash, stream=stream, job_id="j"
+    )
+    return outcome.kind
+
+
+@pytest.mark.asyncio
+async def test_retry_joins_running_call_then_replays():
+    store = IdempotencyStore()
+    first = await store.begin("k", request_hash="h", stream=False, job_id="job1")
+    assert first.kind == "new"
+
+    joined = await store.begin("k", request_hash="h", stream=False, job_id="job2")
+    assert joined.kind == "join" and joined.job_id == "job1"
+
+    store.complete("k", _entry())
+    assert (await joined.future)["content"] == b'{"id":"r1"}'
+
+    replay = await store.begin("k", request_hash="h", stream=False, job_id="job3")
+    assert replay.kind == "replay" and replay.entry["status_code"] == 200
+    assert store.metrics()["joins"] == 1 and store.metrics()["replays"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_conflict_body_mismatch_and_errors_not_stored():
+    store = IdempotencyStore()
+    await store.begin("s", request_hash="h", stream=True, job_id="job1")
+    assert await _kind(store, "s", stream=True) == "conflict"
+    assert await _kind(store, "s", "x", stream=True) == "mismatch"
+
+    await store.begin("e", request_hash="h", stream=False, job_id="job1")
+    joined = await store.begin("e", request_hash="h", stream=False, job_id="job2")
+    store.complete("e", _entry(b"{}", status_code=502))
+    assert (await joined.future)["status_code"] == 502
+    assert await _kind(store, "e") == "new"
+
+
+@pytest.mark.asyncio
+async def test_failed_call_releases_joiners_and_key():
+    store = IdempotencyStore()
+    await store.begin("k", request_hash="h", stream=False, job_id="job1")
+    joined = await store.begin("k", request_hash="h", stream=False, job_id="job2")
+    store.fail("k")
+    assert await asyncio.wait_for(joined.future, timeout=1) is None
+    assert await _kind(store, "k") == "new"
+
+
+class ClaimedElsewhere:
+    """Mongo collection where another worker already holds every key."""
+
+    async def insert_one(self, doc):
+        await asyncio.sleep(0.01)
+        raise DuplicateKeyError("dup")
+
+    async def find_one(self, query):
+        return {"_id": query["_id"], "state": "in_flight", "request_hash": "h"}
+
+
+class FakeMongo:
+    def get_database(self):
+        return {"llm_idempotency_keys": ClaimedElsewhere()}
+
+
+@pytest.mark.asyncio
+async def test_retry_joining_during_the_claim_is_released():
+    store = IdempotencyStore(mongodb_client=FakeMongo())
+    first = asyncio.ensure_future(
+        store.begin("k", request_hash="h", stream=False, job_id="job1")
+    )
+    await asyncio.sleep(0)
+    joined = await store.begin("k", request_hash="h", stream=False, job_id="job2")
+    assert joined.kind == "join"
+
+    assert (await first).kind == "conflict"
+    assert await asyncio.wait_for(joined.future, timeout=1) is None
+    assert store.metrics()["in_flight"] == 0
+
+
+def test_route_replays_stored_result(client: TestClient):
+    client.app.idempotency_store = IdempotencyStore()
+    try:
+        headers = {"Idempotency-Key": "abc"}
+        payload = {"model": "mistral-small", "messages": [], "stream": False}
+        first = client.post("/v1/chat/completions", json=payload, headers=headers)
+        assert first.status_code == 200
+        assert "Idempotent-Replayed" not in first.headers
+
+        again = client.post("/v1/chat/completions", json=payload, headers=headers)
+        assert again.status_code == 200
+        assert again.headers["Idempotent-Replayed"] == "true"
+        assert again.json() == first.json()
+
+        payload["messages"] = [{"role": "user", "content": "other"}]
+        other = client.post("/v1/chat/completions", json=payload, headers=headers)
+        assert other.status_code == 422
+
+        stream = {"model": "mistral-small", "messages": [], "stream": True}
+        headers = {"Idempotency-Key": "stream"}
+        first = client.post("/v1/chat/completions", json=stream, headers=headers)
+        again = client.post("/v1/chat/completions", json=stream, headers=headers)
+        assert again.headers["Idempotent-Replayed"] == "true"
+        assert again.headers["content-type"].startswith("text/event-stream")
+        assert again.text == first.text
+    finally:
+        client.app.idempotency_store = None
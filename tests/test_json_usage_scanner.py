@@ -0,0 +1,45 @@
+import json
+
+from api.utils import JSONUsageScanner
+
+
+def _scan(body: bytes, step: int) -> JSONUsageScanner:
+    scanner = JSONUsageScanner()
+    for i in range(0, len(body), step):
+        scanner.feed(body[i : i + step])
+    scanner.close()
+    return scanner
+
+
+def test_scanner_extracts_usage_across_any_chunking():
+    body = json.dumps(
+        {
+            "id": 'gen-"1"',
+            "object": "chat.completion",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"content": 'tricky \\ "quotes" {[,:]}'},
+                    "finish_reason": "stop",
+                },
+                {"index": 1, "finish_reason": "length"},
+            ],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 5, "total_tokens": 8},
+        }
+    ).encode("utf-8")
+    for step in (1, 2, 3, 5, 11, len(body)):
+        scanner = _scan(body, step)
+        assert scanner.provider_response_id == 'gen-"1"'
+        assert scanner.finish_reason == "stop"
+        assert scanner.usage["total_tokens"] == 8
+
+
+def test_scanner_ignores_nested_keys_with_same_names():
+    body = (
+        b'{"output":[{"id":"msg_1","usage":{"total_tokens":99}}],'
+        b'"id":"resp_1","usage":{"total_tokens":3}}'
+    )
+    scanner = _scan(body, 4)
+    assert scanner.provider_response_id == "resp_1"
+    assert scanner.usage == {"total_tokens": 3}
+    assert scanner.finish_reason is None
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from api.utils import InvalidJSONBodyError, LazyJSONObject
+from api.utils.lazy_json import EAGER_DECODE_BYTES
+
+LARGE_TEXT = "x" * (EAGER_DECODE_BYTES + 1)
+
+
+def _large_body(**fields):
+    body = {"model": "m", "messages": [{"role": "user", "content": LARGE_TEXT}]}
+    body.update(fields)
+    return json.dumps(body, indent=1).encode("utf-8")
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        b'{"model": "m", "messages": [{"a": [1, 2]}, {"b": "x,]\\\\"}], "stream": true}',
+        _large_body(stream=True),
+    ],
+)
+def test_lazy_object_reads_top_level_fields(raw):
+    payload = LazyJSONObject(raw)
+    assert payload.get("model") == "m"
+    assert payload.get("stream") is True
+    assert payload.get("missing", 1) == 1
+    assert "messages" in payload
+    assert payload.count_items("model") is None
+
+
+def test_large_object_counts_items():
+    raw = _large_body(input=[1, 2, 3], tools=[], escaped='a"b\\')
+    payload = LazyJSONObject(raw)
+    assert payload.count_items("messages") == 1
+    assert payload.count_items("input") == 3
+    assert payload.count_items("tools") == 0
+    assert payload.get("escaped") == 'a"b\\'
+
+
+def test_with_fields_splices_top_level_members():
+    payload = LazyJSONObject(_large_body(stream=True, temperature=1))
+    updated = payload.with_fields(
+        {"temperature": 0, "stream_options": {"include_usage": True}},
+        remove=["stream"],
+    )
+    assert json.loads(updated.raw) == {
+        "model": "m",
+        "messages": [{"role": "user", "content": LARGE_TEXT}],
+        "temperature": 0,
+        "stream_options": {"include_usage": True},
+    }
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        b"",
+        b"[1]",
+        b'{"a": 1,}',
+        b'{"a": 1',
+        b'{"a": 1} x',
+        b'{"a": "1}',
+    ],
+)
+def test_invalid_bodies_are_rejected(raw):
+    with pytest.raises(InvalidJSONBodyError):
+        LazyJSONObject(raw)
+    with pytest.raises(InvalidJSONBodyError):
+        LazyJSONObject(raw + b" " * EAGER_DECODE_BYTES)
+
+
+@pytest.mark.parametrize("value", [b"[tru]", b'{"b": 1 2}'])
+def test_large_body_values_are_validated_when_read(value):
+    raw = b'{"a": ' + value + b', "b": 1}' + b" " * EAGER_DECODE_BYTES
+    payload = LazyJSONObject(raw)
+    assert payload.get("b") == 1
+    with pytest.raises(InvalidJSONBodyError):
+        payload.get("a")
@@ -0,0 +1,173 @@
+import logging
+
+import pytest
+from pymongo import UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from api.databases.llm_request_log_writer import LLMRequestLogWriter
+
+
+class FakeCollection:
+    def __init__(self):
+        self.batches = []
+
+    async def bulk_write(self, operations, ordered=True):
+        self.batches.append(operations)
+
+
+@pytest.mark.asyncio
+async def test_insert_and_update_are_merged_into_one_write():
+    collection = FakeCollection()
+    writer = LLMRequestLogWriter(collection, logging.getLogger("test"))
+    await writer.submit_insert({"job_id": "j1", "status_code": None})
+    await writer.submit_update("j1", {"status_code": 200, "latency_ms": 12})
+    assert writer.metrics()["queue_depth"] == 1
+
+    await writer.flush()
+
+    [batch] = collection.batches
+    [operation] = batch
+    assert isinstance(operation, UpdateOne) and operation._upsert
+    assert operation._doc["$set"] == {
+        "status_code": 200,
+        "latency_ms": 12,
+        "updated_at": operation._doc["$set"]["updated_at"],
+    }
+    assert operation._doc["$setOnInsert"] == {"job_id": "j1"}
+    assert writer.metrics()["written"] == 1
+
+
+@pytest.mark.asyncio
+async def test_update_after_flush_becomes_update_one():
+    collection = FakeCollection()
+    writer = LLMRequestLogWriter(collection, logging.getLogger("test"))
+    await writer.submit_insert({"job_id": "j1"})
+    await writer.flush()
+    await writer.submit_update("j1", {"status_code": 500})
+    await writer.flush()
+
+    operation = collection.batches[1][0]
+    assert isinstance(operation, UpdateOne) and not operation._upsert
+
+
+@pytest.mark.asyncio
+async def test_overflow_drop_policy_counts_dropped_jobs():
+    collection = FakeCollection()
+    writer = LLMRequestLogWriter(
+        collection, logging.getLogger("test"), batch_size=2, max_queue=2
+    )
+    for i in range(3):
+        await writer.submit_insert({"job_id": f"j{i}"})
+
+    metrics = writer.metrics()
+    assert metrics["queue_depth"] == 2
+    assert metrics["dropped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_pending_jobs():
+    collection = FakeCollection()
+    writer = LLMRequestLogWriter(
+        collection, logging.getLogger("test"), flush_interval=60
+    )
+    writer.start()
+    await writer.submit_insert({"job_id": "j1"})
+    await writer.stop()
+
+    assert sum(len(b) for b in collection.batches) == 1
+
+
+class FlakyCollection(FakeCollection):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    async def bulk_write(self, operations, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("mongo down")
+        await super().bulk_write(operations, ordered)
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_retried_with_later_updates():
+    collection = FlakyCollection(failures=1)
+    writer = LLMRequestLogWriter(collection, logging.getLogger("test"))
+    await writer.submit_insert({"job_id": "j1", "status_code": None})
+    await writer.flush()
+    await writer.submit_update("j1", {"status_code": 200})
+    await writer.flush()
+
+    [[operation]] = collection.batches
+    assert operation._doc["$set"]["status_code"] == 200
+    metrics = writer.metrics()
+    assert metrics["written"] == 1 and metrics["retried"] == 1
+    assert metrics["dropped"] == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_dropped_once_retries_run_out():
+    collection = FlakyCollection(failures=10)
+    writer = LLMRequestLogWriter(collection, logging.getLogger("test"), max_retries=2)
+    await writer.submit_insert({"job_id": "j1"})
+    await writer.stop()
+
+    metrics = writer.metrics()
+    assert metrics["flush_errors"] == 3 and metrics["dropped"] == 1
+    assert metrics["queue_depth"] == 0
+
+
+class LossyCollection:
+    """Applies the first batch, then loses the reply."""
+
+    def __init__(self):
+        self.docs = {}
+        self.lost = False
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            doc = self.docs.get(operation._filter["job_id"])
+            if doc is None:
+                doc = self.docs[operation._filter["job_id"]] = dict(
+                    operation._doc.get("$setOnInsert", {})
+                )
+            doc.update(operation._doc.get("$set", {}))
+        if not self.lost:
+            self.lost = True
+            raise AutoReconnect("connection reset")
+
+
+@pytest.mark.asyncio
+async def test_retry_of_a_write_that_went_through_keeps_later_updates():
+    collection = LossyCollection()
+    writer = LLMRequestLogWriter(collection, logging.getLogger("test"))
+    await writer.submit_insert({"_id": "o1", "job_id": "j1", "status_code": None})
+    await writer.flush()
+    await writer.submit_update("j1", {"status_code": 200, "latency_ms": 5})
+    await writer.flush()
+
+    [doc] = collection.docs.values()
+    assert doc["_id"] == "o1"
+    assert doc["status_code"] == 200 and doc["latency_ms"] == 5
+    metrics = writer.metrics()
+    assert metrics["written"] == 1 and metrics["dropped"] == 0
+
+
+class DuplicateCollection(FakeCollection):
+    async def bulk_write(self, operations, ordered=True):
+        await super().bulk_write(operations, ordered)
+        raise BulkWriteError(
+            {"writeErrors": [{"index": 0, "code": 11000, "errmsg": "E11000"}]}
+        )
+
+
+@pytest.mark.asyncio
+async def test_duplicate_key_counts_as_written():
+    collection = DuplicateCollection()
+    writer = LLMRequestLogWriter(collection, logging.getLogger("test"))
+    await writer.submit_insert({"job_id": "j1"})
+    await writer.flush()
+
+    metrics = writer.metrics()
+    assert metrics["written"] == 1 and metrics["retried"] == 0
+    assert metrics["queue_depth"] == 0
@@ -76,3 +76,15 @@ async def test_openrouter_proxy_stream():
             chunks.append(chunk)
     assert b"data:" in b"".join(chunks)
     await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_openrouter_proxy_aclose_keeps_injected_client():
+    client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda _r: httpx.Response(200)),
+        base_url="https://openrouter.ai/api/v1",
+    )
+    proxy = OpenRouterProxy(http_client=client)
+    await proxy.aclose()
+    assert not client.is_closed
+    await client.aclose()
@@ -0,0 +1,101 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from api.classes import RateLimiter
+from api.utils import LazyJSONObject
+from api.v1.services import request_body
+
+
+@pytest.mark.asyncio
+async def test_request_needs_room_in_every_scope():
+    limiter = RateLimiter(limits={"user": (10, 0), "key": (2, 0), "model": (0, 100)})
+    for _ in range(2):
+        result = await limiter.check(user_id="u1", api_key_id="k1", model="m")
+        assert result.allowed
+    result = await limiter.check(user_id="u1", api_key_id="k1", model="m")
+    assert not result.allowed
+    assert int(result.headers["Retry-After"]) >= 1
+    assert result.headers["X-RateLimit-Remaining"] == "0"
+
+    # Another key of the same user still has room
+    assert (await limiter.check(user_id="u1", api_key_id="k2")).allowed
+
+
+@pytest.mark.asyncio
+async def test_token_budget_and_oversized_requests():
+    limiter = RateLimiter(limits={"user": (0, 1000)})
+    first = await limiter.check(user_id="u1", tokens=5000)
+    assert first.allowed
+    assert first.headers["X-RateLimit-Limit-Tokens"] == "1000"
+    assert not (await limiter.check(user_id="u1", tokens=10)).allowed
+    assert (await limiter.check(user_id="u2", tokens=10)).allowed
+
+
+def test_routes_report_rate_limit_headers(client: TestClient):
+    client.app.rate_limiter = RateLimiter(limits={"user": (1, 0)})
+    try:
+        payload = {"model": "mistral-small", "messages": [], "stream": False}
+        r = client.post("/v1/chat/completions", json=payload)
+        assert r.status_code == 200
+        assert r.headers["X-RateLimit-Limit"] == "1"
+        assert r.headers["X-RateLimit-Remaining"] == "0"
+
+        r = client.post("/v1/chat/completions", json=payload)
+        assert r.status_code == 429
+        assert "Retry-After" in r.headers
+    finally:
+        client.app.rate_limiter = None
+
+
+def test_rate_limited_route_parses_the_body_once(client: TestClient, monkeypatch):
+    parsed = []
+
+    class CountingObject(LazyJSONObject):
+        __slots__ = ()
+
+        def __init__(self, raw):
+            parsed.append(raw)
+            super().__init__(raw)
+
+    monkeypatch.setattr(request_body, "LazyJSONObject", CountingObject)
+    client.app.rate_limiter = RateLimiter(limits={"user": (10, 0)})
+    try:
+        payload = {"model": "mistral-small", "messages": [], "stream": False}
+        r = client.post("/v1/chat/completions", json=payload)
+        assert r.status_code == 200
+        assert len(parsed) == 1
+    finally:
+        client.app.rate_limiter = None
+
+
+class FakeCounters:
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one_and_update(self, query, update, upsert, return_document):
+        doc = self.docs.setdefault(query["_id"], {"requests": 0, "tokens": 0})
+        for field, amount in update["$inc"].items():
+            doc[field] += amount
+        return dict(doc)
+
+
+class FakeMongo:
+    def __init__(self):
+        self.counters = FakeCounters()
+
+    def get_database(self):
+        return {"rate_limit_counters": self.counters}
+
+
+@pytest.mark.asyncio
+async def test_shared_counters_only_count_admitted_requests():
+    mongo = FakeMongo()
+    # Workers with their own local buckets share the Mongo window
+    workers = [
+        RateLimiter(limits={"user": (2, 0)}, mongodb_client=mongo) for _ in range(3)
+    ]
+    results = [await w.check(user_id="u1", tokens=5) for w in workers]
+
+    assert [r.allowed for r in results] == [True, True, False]
+    [counter] = mongo.counters.docs.values()
+    assert counter == {"requests": 2, "tokens": 10}
@@ -0,0 +1,70 @@
+import httpx
+import pytest
+
+from api.classes import OpenRouterProxy
+from api.classes.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+from api.classes.upstream_router import Upstream, UpstreamRouter
+
+
+def _proxy(handler, *, breaker=None, attempts=3) -> OpenRouterProxy:
+    client = httpx.AsyncClient(
+        transport=httpx.MockTransport(handler), base_url="https://upstream/v1"
+    )
+    upstream = Upstream("a", client, breaker=breaker)
+    return OpenRouterProxy(
+        router=UpstreamRouter([upstream]),
+        retry=RetryPolicy(max_attempts=attempts, base_delay=0.001, max_delay=0.05),
+    )
+
+
+@pytest.mark.asyncio
+async def test_retries_429_and_5xx_then_succeeds():
+    answers = [
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(503),
+        httpx.Response(200, json={"ok": True}),
+    ]
+    proxy = _proxy(lambda _request: answers.pop(0))
+    response = await proxy.post("/chat/completions", {"model": "m"})
+    assert response.status_code == 200
+    assert not answers
+    await proxy.aclose()
+
+
+@pytest.mark.asyncio
+async def test_long_retry_after_is_returned_without_waiting():
+    proxy = _proxy(lambda _r: httpx.Response(429, headers={"Retry-After": "120"}))
+    response = await proxy.post("/chat/completions", {"model": "m"})
+    assert response.status_code == 429
+    await proxy.aclose()
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_fast():
+    calls = 0
+
+    def handler(request):
+        nonlocal calls
+        calls += 1
+        raise httpx.ConnectError("refused", request=request)
+
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    proxy = _proxy(handler, breaker=breaker, attempts=2)
+    with pytest.raises(httpx.ConnectError):
+        await proxy.post("/chat/completions", {"model": "m"})
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        async with proxy.stream("/chat/completions", {"model": "m"}):
+            pass
+    assert calls == 2
+    await proxy.aclose()
+
+
+def test_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
@@ -0,0 +1,123 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.classes import ResponseCache
+from api.classes.response_cache import chat_completion_to_sse
+from api.utils import LazyJSONObject
+
+
+def _lazy(payload):
+    return LazyJSONObject(json.dumps(payload).encode("utf-8"))
+
+
+def test_is_cacheable_requires_deterministic_request():
+    assert ResponseCache.is_cacheable({"temperature": 0}, {})
+    assert ResponseCache.is_cacheable({"temperature": 0.7}, {"x-cache": "allow"})
+    assert not ResponseCache.is_cacheable({"temperature": 0.7}, {})
+    assert not ResponseCache.is_cacheable({}, {})
+
+
+def test_make_key_ignores_streaming_fields():
+    payload = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+    streamed = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+    key = ResponseCache.make_key("u", "/chat/completions", _lazy(payload))
+    assert key == ResponseCache.make_key("u", "/chat/completions", _lazy(streamed))
+    assert key != ResponseCache.make_key("other", "/chat/completions", _lazy(payload))
+
+
+def test_make_key_ignores_key_order_and_whitespace():
+    compact = LazyJSONObject(b'{"model":"m","messages":[],"temperature":0}')
+    spaced = LazyJSONObject(b'{"temperature": 0,\n "messages": [], "model": "m"}')
+    assert ResponseCache.make_key("u", "/responses", compact) == (
+        ResponseCache.make_key("u", "/responses", spaced)
+    )
+
+
+@pytest.mark.asyncio
+async def test_lru_evicts_by_total_bytes():
+    cache = ResponseCache(max_bytes=10, max_entry_bytes=10)
+    cache.set("a", b"12345", "application/json")
+    cache.set("b", b"12345", "application/json")
+    assert await cache.get("a") is not None
+    cache.set("c", b"12345", "application/json")
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") is not None
+    assert cache.metrics()["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_misses():
+    cache = ResponseCache(ttl=-1)
+    cache.set("a", b"{}", "application/json")
+    assert await cache.get("a") is None
+    assert cache.metrics()["entries"] == 0
+
+
+def test_chat_completion_replayed_as_sse():
+    events = chat_completion_to_sse(
+        {
+            "id": "resp1",
+            "created": 0,
+            "model": "m",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "hi"},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"total_tokens": 2},
+        },
+        include_usage=True,
+    )
+    chunks = [json.loads(e[6:]) for e in events[:-1]]
+    assert chunks[0]["choices"][0]["delta"]["content"] == "hi"
+    assert chunks[1]["choices"][0]["finish_reason"] == "stop"
+    assert chunks[2]["usage"]["total_tokens"] == 2
+    assert events[-1] == b"data: [DONE]\n\n"
+
+
+def test_chat_completions_served_from_cache(client: TestClient):
+    client.app.response_cache = ResponseCache()
+    try:
+        payload = {
+            "model": "mistral-small",
+            "messages": [{"role": "user", "content": "cached?"}],
+            "temperature": 0,
+        }
+        first = client.post("/v1/chat/completions", json=payload)
+        assert first.headers["x-cache"] == "MISS"
+        second = client.post("/v1/chat/completions", json=payload)
+        assert second.headers["x-cache"] == "HIT"
+        assert second.json() == first.json()
+        record = client.app.mongodb_client._collections["llm_requests"][-1]
+        assert record["cache_hit"] is True
+
+        with client.stream(
+            "POST", "/v1/chat/completions", json={**payload, "stream": True}
+        ) as r:
+            assert r.headers["x-cache"] == "HIT"
+            lines = [line for line in r.iter_lines() if line]
+        assert lines[-1] == "data: [DONE]"
+        # Without stream_options.include_usage no `choices: []` chunk is sent
+        chunks = [json.loads(line[6:]) for line in lines[:-1]]
+        assert chunks and all(chunk["choices"] for chunk in chunks)
+
+        with client.stream(
+            "POST",
+            "/v1/chat/completions",
+            json={
+                **payload,
+                "stream": True,
+                "stream_options": {"include_usage": True},
+            },
+        ) as r:
+            lines = [line for line in r.iter_lines() if line]
+        usage_chunk = json.loads(lines[-2][6:])
+        assert usage_chunk["choices"] == []
+        assert usage_chunk["usage"]["total_tokens"] == 2
+    finally:
+        client.app.response_cache = None
@@ -17,6 +17,8 @@ def test_chat_completions_non_stream(client: TestClient):
     record = logs[-1]
     assert record["status_code"] == 200
     assert record["usage"]["total_tokens"] == 2
+    assert record["provider_response_id"] == "resp1"
+    assert record["finish_reason"] == "stop"
 
 
 def test_chat_completions_stream_sse(client: TestClient):
@@ -32,4 +34,6 @@ def test_chat_completions_stream_sse(client: TestClient):
     assert logs
     record = logs[-1]
     assert record["status_code"] == 200
-    assert record["usage"] is None
+    assert record["usage"]["total_tokens"] == 2
+    assert record["provider_response_id"] == "resp1"
+    assert record["finish_reason"] == "stop"
@@ -79,3 +79,122 @@ def test_chat_completions_upstream_error_pass_through(client: TestClient):
         assert record["error"]["message"] == "bad key"
     finally:
         _clear_override(client, proxy)
+
+
+def test_chat_completions_stream_requests_usage(client: TestClient):
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.update(json.loads(request.content.decode("utf-8")))
+        return httpx.Response(
+            status_code=200,
+            headers={"content-type": "text/event-stream"},
+            content=b"data: [DONE]\n\n",
+        )
+
+    proxy = _override_proxy(client, handler)
+    try:
+        payload = {
+            "model": "mistral-small",
+            "messages": [{"role": "user", "content": "Bonjour"}],
+            "stream": True,
+            "stream_options": {"foo": 1},
+        }
+        with client.stream("POST", "/v1/chat/completions", json=payload) as r:
+            list(r.iter_lines())
+        assert seen["stream_options"] == {"foo": 1, "include_usage": True}
+    finally:
+        _clear_override(client, proxy)
+
+
+def test_chat_completions_forwards_raw_body(client: TestClient):
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen["body"] = request.content
+        return httpx.Response(status_code=200, json={"id": "resp1", "choices": []})
+
+    proxy = _override_proxy(client, handler)
+    try:
+        raw = b'{"model": "mistral-small",  "messages": [], "custom_field": 1.50}'
+        r = client.post(
+            "/v1/chat/completions",
+            content=raw,
+            headers={"content-type": "application/json"},
+        )
+        assert r.status_code == 200
+        assert seen["body"] == raw
+    finally:
+        _clear_override(client, proxy)
+
+
+def test_chat_completions_rejects_invalid_bodies(client: TestClient):
+    proxy = _override_proxy(client, lambda _r: httpx.Response(status_code=200))
+    try:
+        r = client.post("/v1/chat/completions", content=b"{not json")
+        assert r.status_code == 400
+        r = client.post("/v1/chat/completions", json={"messages": []})
+        assert r.status_code == 400
+    finally:
+        _clear_override(client, proxy)
+
+
+def test_chat_completions_rejects_malformed_member_of_large_body(
+    client: TestClient, mock_upstream
+):
+    calls = []
+    mock_upstream(lambda request: calls.append(request) or httpx.Response(200))
+    messages = json.dumps([{"role": "user", "content": "x" * 64 * 1024}])
+    body = b'{"model": "m", "messages": %s, "stream": tru}' % messages.encode()
+
+    r = client.post("/v1/chat/completions", content=body)
+    assert r.status_code == 400
+    assert "stream" in r.json()["error"]
+    assert calls == []
+
+
+def test_chat_completions_schema_is_documented(client: TestClient):
+    spec = client.get("/api/v1/openapi.json").json()
+    body = spec["paths"]["/v1/chat/completions"]["post"]["requestBody"]
+    schema = body["content"]["application/json"]["schema"]
+    assert {"model", "messages"} <= set(schema["properties"])
+
+
+def test_chat_completions_stream_hides_usage_chunk_not_asked_for(
+    client: TestClient,
+):
+    usage_chunk = (
+        b'data: {"id":"resp1","object":"chat.completion.chunk","choices":[],'
+        b'"usage":{"prompt_tokens":1,"completion_tokens":1,"total_tokens":2}}\n\n'
+    )
+
+    def handler(_request: httpx.Request) -> httpx.Response:
+        content = (
+            b'data: {"id":"resp1","object":"chat.completion.chunk","choices":[{"index":0,"delta":{"content":"hi"},"finish_reason":"stop"}]}\n\n'
+            + usage_chunk
+            + b"data: [DONE]\n\n"
+        )
+        return httpx.Response(
+            status_code=200,
+            headers={"content-type": "text/event-stream"},
+            content=content,
+        )
+
+    proxy = _override_proxy(client, handler)
+    try:
+        payload = {
+            "model": "mistral-small",
+            "messages": [{"role": "user", "content": "Bonjour"}],
+            "stream": True,
+        }
+        with client.stream("POST", "/v1/chat/completions", json=payload) as r:
+            body = r.read()
+        assert b'"choices":[]' not in body and body.endswith(b"data: [DONE]\n\n")
+        record = client.app.mongodb_client._collections["llm_requests"][-1]
+        assert record["usage"]["total_tokens"] == 2
+
+        payload["stream_options"] = {"include_usage": True}
+        with client.stream("POST", "/v1/chat/completions", json=payload) as r:
+            assert usage_chunk in r.read()
+    finally:
+        _clear_override(client, proxy)
@@ -1,3 +1,5 @@
+import base64
+
 from fastapi.testclient import TestClient
 
 
@@ -15,3 +17,11 @@ def test_embeddings_validation_error(client: TestClient):
     payload = {"model": "mistral-embed", "input": []}
     r = client.post("/v1/embeddings", json=payload)
     assert r.status_code == 400
+
+
+def test_embeddings_base64_encoding(client: TestClient):
+    payload = {"model": "mistral-embed", "input": ["a"], "encoding_format": "base64"}
+    r = client.post("/v1/embeddings", json=payload)
+    assert r.status_code == 200
+    embedding = r.json()["data"][0]["embedding"]
+    assert isinstance(embedding, str) and len(base64.b64decode(embedding)) == 12
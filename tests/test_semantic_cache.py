@@ -0,0 +1,130 @@
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from qdrant_client import AsyncQdrantClient
+
+from api.classes import SemanticCache
+
+VECTORS = {
+    "How do I reset my password?": [1.0, 0.0, 0.0],
+    "how can I reset my password": [0.99, 0.1, 0.0],
+    "What is the refund policy?": [0.0, 1.0, 0.0],
+}
+
+
+class FakeEmbeddings:
+    async def generate_embeddings(self, model, inputs, **kwargs):
+        return {"data": [{"embedding": VECTORS[text]} for text in inputs]}
+
+
+def _cache(**kwargs):
+    return SemanticCache(
+        qdrant_client=AsyncQdrantClient(location=":memory:"),
+        embeddings=FakeEmbeddings(),
+        **kwargs,
+    )
+
+
+def _chat(question, system="You are support.", **extra):
+    return {
+        "model": "m",
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": question},
+        ],
+        **extra,
+    }
+
+
+def test_query_scopes_and_eligibility():
+    a = SemanticCache.query("u1", _chat("How do I reset my password?"))
+    b = SemanticCache.query("u1", _chat("how can I reset my password"))
+    assert a.scope == b.scope
+    assert SemanticCache.query("u2", _chat("x")).scope != a.scope
+    assert SemanticCache.query("u1", _chat("x", system="Other")).scope != a.scope
+    short = _chat("How do I reset my password?", max_tokens=5)
+    assert SemanticCache.query("u1", short).scope != a.scope
+    seeded = _chat("How do I reset my password?", seed=1, stop=["\n"])
+    assert SemanticCache.query("u1", seeded).scope != a.scope
+
+    multi_turn = _chat("x")
+    multi_turn["messages"].insert(1, {"role": "assistant", "content": "hi"})
+    assert SemanticCache.query("u1", multi_turn) is None
+    image = _chat([{"type": "image_url", "image_url": {"url": "data:"}}])
+    assert SemanticCache.query("u1", image) is None
+
+
+@pytest.mark.asyncio
+async def test_near_duplicate_hits_above_model_threshold():
+    cache = _cache(threshold=0.9, model_thresholds={"strict": 0.999})
+    first = SemanticCache.query("u1", _chat("How do I reset my password?"))
+    assert await cache.get(first) is None
+    cache.set(first, b'{"id":"c1"}', "application/json", finish_reason="stop")
+    await cache._background.pop()
+
+    near = SemanticCache.query("u1", _chat("how can I reset my password"))
+    entry = await cache.get(near)
+    assert entry["content"] == b'{"id":"c1"}' and entry["similarity"] > 0.9
+
+    other = SemanticCache.query("u1", _chat("What is the refund policy?"))
+    assert await cache.get(other) is None
+    assert cache.metrics()["hits"] == 1 and cache.metrics()["lookups"] == 3
+
+    near.model = "strict"
+    assert await cache.get(near) is None
+
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_ignored():
+    cache = _cache(ttl=-1)
+    query = SemanticCache.query("u1", _chat("How do I reset my password?"))
+    await cache.get(query)
+    cache.set(query, b"{}", "application/json")
+    await cache._background.pop()
+    assert await cache.get(query) is None
+
+
+def test_route_serves_semantic_hit(client: TestClient, mock_upstream):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        choice = {"index": 0, "message": {"content": "hi"}, "finish_reason": "stop"}
+        return httpx.Response(200, json={"id": "resp1", "choices": [choice]})
+
+    mock_upstream(handler)
+    cache = _cache()
+    client.app.semantic_cache = cache
+    try:
+        with client:
+            r = client.post(
+                "/v1/chat/completions", json=_chat("How do I reset my password?")
+            )
+            assert r.status_code == 200 and "X-Cache" not in r.headers
+            for _ in range(100):
+                if cache.metrics()["stores"]:
+                    break
+                time.sleep(0.01)
+
+            r = client.post(
+                "/v1/chat/completions", json=_chat("how can I reset my password")
+            )
+            assert r.headers["X-Cache"] == "SEMANTIC"
+            assert r.json()["id"] == "resp1"
+            assert len(calls) == 1
+    finally:
+        client.app.semantic_cache = None
+
+
+def test_semantic_cache_collection_name_is_reserved(client: TestClient):
+    r = client.post(
+        "/v1/vector_stores",
+        json={
+            "name": "llm_semantic_cache",
+            "embedding_model": "text-embedding-3-small",
+        },
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Vector store name is reserved"
@@ -0,0 +1,86 @@
+import asyncio
+
+import httpx
+import pytest
+
+from api.classes import OpenRouterProxy
+from api.classes.single_flight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "ok"
+
+    tasks = [asyncio.create_task(flight.do("k", fetch)) for _ in range(5)]
+    await asyncio.sleep(0)
+    assert flight.metrics()["waiters"] == {"k": 5}
+    release.set()
+
+    assert await asyncio.gather(*tasks) == ["ok"] * 5
+    assert calls == 1
+    assert flight.metrics()["coalesced"] == 4
+    assert flight.metrics()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_errors_are_shared_and_not_cached():
+    flight = SingleFlight()
+
+    async def boom():
+        raise ValueError("upstream down")
+
+    with pytest.raises(ValueError):
+        await flight.do("k", boom)
+    assert await flight.do("k", lambda: asyncio.sleep(0, result=1)) == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_shared_call():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def fetch():
+        await release.wait()
+        return "ok"
+
+    first = asyncio.create_task(flight.do("k", fetch))
+    second = asyncio.create_task(flight.do("k", fetch))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    assert await second == "ok"
+
+
+@pytest.mark.asyncio
+async def test_openrouter_proxy_dedupes_identical_posts():
+    hits = 0
+
+    async def handler(_request: httpx.Request) -> httpx.Response:
+        nonlocal hits
+        hits += 1
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"id": "resp1"})
+
+    client = httpx.AsyncClient(
+        transport=httpx.MockTransport(handler),
+        base_url="https://openrouter.ai/api/v1",
+    )
+    proxy = OpenRouterProxy(http_client=client)
+    responses = await asyncio.gather(
+        *(
+            proxy.post("/chat/completions", {"model": "m"}, dedupe_key="h")
+            for _ in range(3)
+        )
+    )
+    assert hits == 1
+    assert all(r.json()["id"] == "resp1" for r in responses)
+    await client.aclose()
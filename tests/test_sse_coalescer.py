@@ -0,0 +1,79 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from api.classes import SSECoalescer
+
+
+def _event(i):
+    return b'data: {"choices":[{"delta":{"content":"%d"}}]}\n\n' % i
+
+
+async def _chunks(*parts, pause=0.0):
+    for part in parts:
+        if part is None:
+            await asyncio.sleep(pause)
+            continue
+        yield part
+
+
+@pytest.mark.asyncio
+async def test_merges_whole_events_up_to_max_bytes():
+    events = [_event(i) for i in range(10)]
+    stream = b"".join(events)
+    # Split mid-event so that boundaries have to be found again
+    parts = [stream[i : i + 7] for i in range(0, len(stream), 7)]
+    coalescer = SSECoalescer(max_bytes=len(events[0]) * 3, max_delay=10)
+
+    writes = [w async for w in coalescer.wrap(_chunks(*parts))]
+
+    assert writes[0] == events[0]
+    assert b"".join(writes) == stream
+    assert [len(w) // len(events[0]) for w in writes] == [1, 3, 3, 3]
+    assert coalescer.metrics() == {"events": 10, "writes": 4}
+
+
+@pytest.mark.asyncio
+async def test_flushes_after_max_delay_when_upstream_pauses():
+    coalescer = SSECoalescer(max_bytes=1 << 20, max_delay=0.01)
+    source = _chunks(_event(0), _event(1), _event(2), None, _event(3), pause=0.2)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    arrivals = []
+    async for write in coalescer.wrap(source):
+        arrivals.append((loop.time() - start, write))
+
+    assert [w for _, w in arrivals] == [
+        _event(0),
+        _event(1) + _event(2),
+        _event(3),
+    ]
+    # The held events did not wait for the upstream pause to end
+    assert arrivals[1][0] < 0.15 <= arrivals[2][0]
+
+
+def test_route_stream_is_coalesced(client: TestClient, mock_upstream):
+    stream = b"".join(_event(i) for i in range(5)) + b"data: [DONE]\n\n"
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200, content=stream, headers={"content-type": "text/event-stream"}
+        )
+
+    mock_upstream(handler)
+    coalescer = SSECoalescer(max_bytes=4096, max_delay=0.01)
+    client.app.sse_coalescer = coalescer
+    try:
+        body = {
+            "model": "openai/tiny",
+            "messages": [{"role": "user", "content": "hi"}],
+            "stream": True,
+        }
+        r = client.post("/v1/chat/completions", json=body)
+        assert r.status_code == 200
+        assert r.content == stream
+        assert coalescer.metrics()["events"] == 6
+    finally:
+        client.app.sse_coalescer = None
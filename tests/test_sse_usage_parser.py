@@ -0,0 +1,42 @@
+from api.utils import SSEUsageParser
+
+
+def test_parser_handles_events_split_across_chunks():
+    stream = (
+        b'data: {"id":"gen-1","choices":[{"index":0,"delta":{"content":"hi"},"finish_reason":null}]}\n\n'
+        b'data: {"id":"gen-1","choices":[{"index":0,"delta":{},"finish_reason":"length"}]}\n\n'
+        b'data: {"id":"gen-1","choices":[],"usage":{"prompt_tokens":3,"completion_tokens":5,"total_tokens":8}}\n\n'
+        b"data: [DONE]\n\n"
+    )
+    parser = SSEUsageParser()
+    for i in range(0, len(stream), 7):
+        parser.feed(stream[i : i + 7])
+    parser.close()
+    assert parser.provider_response_id == "gen-1"
+    assert parser.finish_reason == "length"
+    assert parser.usage["total_tokens"] == 8
+
+
+def test_parser_reads_responses_completed_event():
+    parser = SSEUsageParser()
+    parser.feed(
+        b"event: response.created\n"
+        b'data: {"type":"response.created","response":{"id":"resp_1","status":"in_progress"}}\n\n'
+        b'data: {"type":"response.output_text.delta","delta":"hi"}\n\n'
+    )
+    parser.feed(
+        b'data: {"type":"response.completed","response":{"id":"resp_1","status":"completed",'
+        b'"usage":{"input_tokens":1,"output_tokens":2,"total_tokens":3}}}'
+    )
+    parser.close()
+    assert parser.provider_response_id == "resp_1"
+    assert parser.finish_reason == "completed"
+    assert parser.usage["total_tokens"] == 3
+
+
+def test_parser_ignores_malformed_events():
+    parser = SSEUsageParser()
+    parser.feed(b"data: {not json}\n\n: keep-alive\n\n")
+    parser.close()
+    assert parser.provider_response_id is None
+    assert parser.usage is None
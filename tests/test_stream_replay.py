@@ -0,0 +1,142 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from api.classes import StreamReplay
+from api.classes.stream_replay import ReplayGapError, StreamJob
+from api.utils import SSEEventSplitter
+
+EVENTS = [
+    b'data: {"id":"c1","choices":[{"delta":{"content":"%d"}}]}\n\n' % i
+    for i in range(3)
+]
+
+
+def test_splitter_keeps_events_whole_across_chunks():
+    splitter = SSEEventSplitter()
+    stream = b"data: a\n\ndata: b\r\n\r\ndata: c"
+    events = []
+    for i in range(len(stream)):
+        events += splitter.feed(stream[i : i + 1])
+    assert events == [b"data: a\n\n", b"data: b\r\n\r\n"]
+    assert splitter.close() == b"data: c"
+
+
+@pytest.mark.asyncio
+async def test_job_replays_after_last_event_id_and_reports_gaps():
+    job = StreamJob("job", "u1", max_bytes=120)
+    for i in range(3):
+        job.append(b"data: %d\n\n" % i)
+    job.finish()
+    assert [e async for e in job.follow(0)] == [
+        b"id: 1\ndata: 1\n\n",
+        b"id: 2\ndata: 2\n\n",
+    ]
+
+    for i in range(3, 20):
+        job.append(b"data: %d\n\n" % i)
+    assert not job.can_replay(0) and job.can_replay(18)
+    with pytest.raises(ReplayGapError):
+        async for _ in job.follow(0):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_generation_survives_a_dropped_reader():
+    release = asyncio.Event()
+
+    async def source():
+        yield EVENTS[0]
+        await release.wait()
+        yield EVENTS[1] + EVENTS[2]
+
+    replay = StreamReplay(ttl=60)
+    job = replay.start("job", "u1", source())
+    reader = replay.follow(job)
+    first = await reader.__anext__()
+    await reader.aclose()
+
+    release.set()
+    resumed = [e async for e in replay.follow(replay.get("job", "u1"), 0)]
+    assert first.startswith(b"id: 0\n")
+    assert resumed == [b"id: 1\n" + EVENTS[1], b"id: 2\n" + EVENTS[2]]
+    assert replay.get("job", "someone-else") is None
+    assert replay.metrics()["resumed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_reader_cut_off_by_a_gap_gets_an_error_event():
+    release = asyncio.Event()
+
+    async def source():
+        yield b"data: 0\n\n"
+        await release.wait()
+        for i in range(1, 20):
+            yield b"data: %d\n\n" % i
+
+    replay = StreamReplay(max_job_bytes=120)
+    reader = replay.follow(replay.start("job", "u1", source()))
+    assert await reader.__anext__() == b"id: 0\ndata: 0\n\n"
+    release.set()
+    await asyncio.sleep(0)
+    await asyncio.gather(*replay._pumps)
+
+    rest = [event async for event in reader]
+    assert rest[-1].startswith(b'data: {"error": ')
+    assert replay.metrics()["gaps"] == 1
+
+
+@pytest.mark.asyncio
+async def test_replay_buffers_are_bounded_in_total():
+    async def source(n):
+        for i in range(n):
+            yield b"data: %d\n\n" % i
+
+    replay = StreamReplay(max_job_bytes=1000, max_total_bytes=100)
+    for job_id in ("a", "b", "c"):
+        await replay.start(job_id, "u1", source(3)).pump
+    assert replay.get("a", "u1") is None and replay.get("c", "u1") is not None
+    assert 0 < replay.metrics()["bytes"] <= 100
+
+
+def test_stream_resume_route(client: TestClient, mock_upstream):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200,
+            content=b"".join(EVENTS) + b"data: [DONE]\n\n",
+            headers={"content-type": "text/event-stream"},
+        )
+
+    mock_upstream(handler)
+    client.app.stream_replay = StreamReplay(ttl=60)
+    try:
+        with client:
+            body = {
+                "model": "openai/tiny",
+                "messages": [{"role": "user", "content": "hi"}],
+                "stream": True,
+            }
+            r = client.post(
+                "/v1/chat/completions",
+                json=body,
+                headers={"X-Stream-Resumable": "true"},
+            )
+            assert r.status_code == 200
+            job_id = r.headers["x-job-id"]
+            assert r.text.startswith("id: 0\ndata: ")
+            assert "id: 3\ndata: [DONE]" in r.text
+
+            r = client.get(f"/v1/streams/{job_id}", headers={"Last-Event-ID": "1"})
+            assert r.status_code == 200
+            assert r.text.startswith("id: 2\ndata: ")
+            assert r.text.count("id: ") == 2
+
+            assert client.get("/v1/streams/unknown").status_code == 404
+            r = client.get(f"/v1/streams/{job_id}", headers={"Last-Event-ID": "x"})
+            assert r.status_code == 400
+        log = client.app.mongodb_client._col("llm_requests")[-1]
+        assert log["job_id"] == job_id and log["status_code"] == 200
+    finally:
+        client.app.stream_replay = None
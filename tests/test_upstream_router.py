@@ -0,0 +1,96 @@
+import random
+from collections import Counter
+
+import httpx
+import pytest
+
+from api.classes import OpenRouterProxy
+from api.classes.resilience import RetryPolicy
+from api.classes.upstream_router import Upstream, UpstreamRouter
+
+
+def _upstream(name, handler, **kwargs) -> Upstream:
+    client = httpx.AsyncClient(
+        transport=httpx.MockTransport(handler), base_url=f"https://{name}/v1"
+    )
+    return Upstream(name, client, **kwargs)
+
+
+def _ok(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json={"upstream": request.url.host})
+
+
+@pytest.mark.asyncio
+async def test_fails_over_on_5xx_and_connect_errors():
+    def down(_request):
+        return httpx.Response(503, json={"error": "overloaded"})
+
+    def unreachable(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    router = UpstreamRouter(
+        [_upstream("a", down), _upstream("b", unreachable), _upstream("c", _ok)]
+    )
+    proxy = OpenRouterProxy(router=router)
+    response = await proxy.post("/chat/completions", {"model": "m"})
+    assert response.status_code == 200
+    assert OpenRouterProxy.upstream_name(response) == "c"
+    assert [u.failures for u in router.upstreams] == [1, 1, 0]
+
+    # The failing upstreams are now ranked after the healthy one
+    assert router.candidates("m")[0].name == "c"
+    await proxy.aclose()
+
+
+@pytest.mark.asyncio
+async def test_last_upstream_error_is_returned():
+    def down(_request):
+        return httpx.Response(502, json={"error": "bad gateway"})
+
+    proxy = OpenRouterProxy(
+        router=UpstreamRouter([_upstream("a", down)]),
+        retry=RetryPolicy(max_attempts=1),
+    )
+    async with proxy.stream("/chat/completions", {"model": "m"}) as response:
+        assert response.status_code == 502
+    await proxy.aclose()
+
+
+@pytest.mark.asyncio
+async def test_model_allowlist_and_latency_ranking():
+    router = UpstreamRouter(
+        [
+            _upstream("slow", _ok),
+            _upstream("fast", _ok, weight=2.0),
+            _upstream("local", _ok, models=["llama-*"]),
+        ]
+    )
+    router.record(router.upstreams[0], 400.0, ok=True)
+    router.record(router.upstreams[1], 600.0, ok=True)
+    router.record(router.upstreams[2], 10.0, ok=True)
+
+    assert {u.name for u in router.candidates("gpt-4o")} == {"fast", "slow"}
+    assert router.candidates("llama-3")[0].name == "local"
+
+    proxy = OpenRouterProxy(router=UpstreamRouter([router.upstreams[2]]))
+    with pytest.raises(httpx.RequestError):
+        await proxy.post("/chat/completions", {"model": "gpt-4o"})
+    await router.aclose()
+
+
+def test_load_is_spread_in_proportion_to_weight_over_latency():
+    router = UpstreamRouter(
+        [_upstream("a", _ok, weight=3.0), _upstream("b", _ok), _upstream("c", _ok)],
+        rng=random.Random(0),
+    )
+    # Twice as slow: half the share of its weight
+    for upstream, latency_ms in zip(
+        router.upstreams, [100.0, 100.0, 200.0], strict=True
+    ):
+        router.record(upstream, latency_ms, ok=True)
+
+    leaders = Counter(router.candidates("m")[0].name for _ in range(6000))
+    # Shares 3 : 1 : 0.5
+    assert 0.63 < leaders["a"] / 6000 < 0.71
+    assert 0.18 < leaders["b"] / 6000 < 0.26
+    assert 0.08 < leaders["c"] / 6000 < 0.15